@@ -2,42 +2,36 @@ import os
 import json
 import re
 import random
-import logging
-import sys
+import time
+import threading
 from dotenv import load_dotenv
 import traceback
+from analysis_cache import analysis_cache, analysis_flight, story_cache_key
+from circuit_breaker import CircuitBreaker
+from deadline import check_deadline, remaining_seconds
+from mood_classifier import get_default_classifier
+from mood_lexicon import classify_mood, score_moods
+from structured_logging import configure_logging
 
 # Load environment variables
 load_dotenv(override=True)
 
-# Configure console-only logging
-logger = logging.getLogger("aura_q")
-logger.setLevel(logging.INFO)
+# Console logging through the shared non-blocking pipeline (idempotent)
+logger = configure_logging("aura_q")
 
-# Only add handler if one doesn't exist already (prevent duplicates)
-if not logger.handlers:
-    console_handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-
-# Enhanced error logging for Vercel
-print("Initializing AI Analysis module - Gemini-only version")
+logger.info("Initializing AI Analysis module - Gemini-only version")
 
 # Try to import Gemini API with better error handling
 GEMINI_AVAILABLE = False
 GEMINI_CONFIGURED = False
 try:
-    print("Attempting to import Google Generative AI")
     import google.generativeai as genai
     GEMINI_AVAILABLE = True
-    print("✅ Gemini API successfully imported")
+    logger.info("Gemini API successfully imported")
 except ImportError as e:
-    print(f"❌ google.generativeai import error: {str(e)}")
-    logger.warning(f"google.generativeai module not available: {str(e)}")
+    logger.warning("google.generativeai module not available: %s", e)
 except Exception as e:
-    print(f"❌ Unexpected error importing Gemini: {str(e)}")
-    logger.error(f"Unexpected error importing Gemini: {str(e)}")
+    logger.error("Unexpected error importing Gemini: %s", e)
     logger.error(traceback.format_exc())
 
 # Configure Gemini API if available
@@ -45,18 +39,291 @@ GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 if GEMINI_AVAILABLE and GEMINI_API_KEY:
     if not GEMINI_CONFIGURED:
         try:
-            print(f"Configuring Gemini API with key (first 3 chars: {GEMINI_API_KEY[:3]}...)")
+            logger.info("Configuring Gemini API with key (first 3 chars: %s...)", GEMINI_API_KEY[:3])
             genai.configure(api_key=GEMINI_API_KEY)
             logger.info("Gemini API configured successfully")
             GEMINI_CONFIGURED = True
         except Exception as e:
-            print(f"❌ Failed to configure Gemini API: {str(e)}")
-            logger.error(f"Failed to configure Gemini API: {str(e)}")
+            logger.error("Failed to configure Gemini API: %s", e)
             logger.error(traceback.format_exc())
 elif GEMINI_AVAILABLE:
-    print("⚠️ Gemini API key not found in environment variables")
     logger.warning("Gemini API key not found in environment variables")
 
+# Gemini models in order of preference
+PREFERRED_MODELS = [
+    "models/gemini-1.5-flash",
+    "models/gemini-1.5-pro",
+    "models/gemini-pro",
+    "gemini-pro",
+    "models/gemini-1.0-pro",
+    "models/gemini-1.5-flash-latest"
+]
+
+# How long a resolved model is trusted before it is re-validated
+GEMINI_MODEL_REVALIDATE_SECONDS = int(os.environ.get("GEMINI_MODEL_REVALIDATE_SECONDS", 900))
+# Consecutive call errors before failing over to the next model in the list
+GEMINI_MODEL_MAX_FAILURES = int(os.environ.get("GEMINI_MODEL_MAX_FAILURES", 3))
+# Back-off before trying to resolve again when no model could be resolved
+GEMINI_MODEL_RETRY_SECONDS = int(os.environ.get("GEMINI_MODEL_RETRY_SECONDS", 30))
+# Timeout for each models.get lookup (and re-validation probe) made while resolving
+GEMINI_MODEL_LOOKUP_TIMEOUT_SECONDS = float(os.environ.get("GEMINI_MODEL_LOOKUP_TIMEOUT_SECONDS", 5))
+# How long a model that was failed away from is skipped when resolving or re-validating
+GEMINI_MODEL_DEMOTE_SECONDS = int(os.environ.get("GEMINI_MODEL_DEMOTE_SECONDS", 1800))
+
+class GeminiModelRegistry:
+    """Resolves a working Gemini model once per process and reuses the handle.
+
+    The model is resolved lazily on first use (or eagerly via ``resolve()``)
+    and only failed over down the preference list when the cached model keeps
+    erroring; the model it failed away from is then skipped for
+    ``demote_seconds``. Every ``revalidate_seconds`` a background thread tries
+    to move back up the list, but only to a model that answers a real
+    one-token probe call: model metadata says nothing about whether
+    generate_content works for this key.
+
+    Lookups and probes never run under the lock. One resolution, failover or
+    re-validation runs at a time; other threads keep the current handle (or
+    get None and use the fallback) instead of waiting, and lookups made on a
+    request thread are capped by that request's analysis budget.
+    """
+    def __init__(self, model_names, revalidate_seconds=GEMINI_MODEL_REVALIDATE_SECONDS,
+                 max_failures=GEMINI_MODEL_MAX_FAILURES, retry_seconds=GEMINI_MODEL_RETRY_SECONDS,
+                 lookup_timeout=GEMINI_MODEL_LOOKUP_TIMEOUT_SECONDS, demote_seconds=GEMINI_MODEL_DEMOTE_SECONDS):
+        self.model_names = list(model_names)
+        self.revalidate_seconds = revalidate_seconds
+        self.max_failures = max_failures
+        self.retry_seconds = retry_seconds
+        self.lookup_timeout = lookup_timeout
+        self.demote_seconds = demote_seconds
+        self._lock = threading.Lock()
+        self._busy = False  # a resolution, failover or re-validation is running
+        self._model = None
+        self._model_name = None
+        self._index = -1
+        self._resolved_at = 0.0
+        self._next_attempt_at = 0.0
+        self._failures = 0
+        self._demoted_until = {}  # model name -> monotonic time it may be used again
+
+    @property
+    def model_name(self):
+        return self._model_name
+
+    def get_model(self):
+        """Return the cached model handle, resolving it when there is none.
+
+        A due re-validation is handed to a background thread; the caller gets
+        the current handle straight away.
+        """
+        model = self._model
+        if model is not None:
+            if self._needs_revalidation():
+                self._start_revalidation()
+            return model
+
+        with self._lock:
+            if self._model is not None or self._busy or time.monotonic() < self._next_attempt_at:
+                return self._model
+            self._busy = True
+        self._resolve_from(0)
+        return self._model
+
+    def resolve(self):
+        """Force resolution of the model, e.g. at application startup"""
+        with self._lock:
+            if self._busy:
+                return self._model
+            self._busy = True
+        self._resolve_from(0)
+        return self._model
+
+    def report_success(self, model):
+        if model is self._model:
+            self._failures = 0
+
+    def report_failure(self, model):
+        """Record a failed call; fail over to the next model after repeated errors"""
+        with self._lock:
+            if model is not self._model:
+                # Stale handle - a failover already happened
+                return
+            self._failures += 1
+            if self._failures < self.max_failures or self._busy:
+                return
+            logger.warning("Gemini model %s failed %s times in a row, failing over", self._model_name, self._failures)
+            self._demoted_until[self._model_name] = time.monotonic() + self.demote_seconds
+            start = self._index + 1
+            self._busy = True
+        self._resolve_from(start)
+
+    def _needs_revalidation(self):
+        return time.monotonic() - self._resolved_at >= self.revalidate_seconds
+
+    def _start_revalidation(self):
+        with self._lock:
+            if self._busy or self._model is None or not self._needs_revalidation():
+                return
+            self._busy = True
+        threading.Thread(target=self._revalidate, name="gemini-model-revalidate", daemon=True).start()
+
+    def _revalidate(self):
+        # Runs on its own thread. Only models above the current one are tried: the
+        # current model is checked by live traffic through report_failure.
+        found = None
+        try:
+            found = self._find(range(0, self._index), probe=True)
+        finally:
+            with self._lock:
+                self._resolved_at = time.monotonic()
+                if found is not None and self._model is not None and found[0] < self._index:
+                    self._select(*found)
+                self._busy = False
+
+    def _resolve_from(self, start):
+        # Caller has set self._busy
+        found = None
+        try:
+            found = self._find(range(start, len(self.model_names)))
+        finally:
+            with self._lock:
+                if found is not None:
+                    self._select(*found)
+                else:
+                    self._model = None
+                    self._model_name = None
+                    self._index = -1
+                    self._next_attempt_at = time.monotonic() + self.retry_seconds
+                    logger.error("No available Gemini model found, retrying in %s seconds", self.retry_seconds)
+                self._busy = False
+
+    def _find(self, indexes, probe=False):
+        """Return (index, name, model) for the first usable model in ``indexes``, or None"""
+        for index in indexes:
+            name = self.model_names[index]
+            if time.monotonic() < self._demoted_until.get(name, 0.0):
+                continue
+            timeout = self.lookup_timeout
+            budget = analysis_budget_seconds()
+            if budget is not None:
+                if budget <= 0:
+                    logger.warning("Stopped resolving Gemini models, the request has no time left")
+                    return None
+                timeout = min(timeout, budget)
+            try:
+                # get_model() confirms the model exists for this API key before we commit to it
+                genai.get_model(name if name.startswith("models/") else f"models/{name}",
+                                request_options={"timeout": timeout})
+                model = genai.GenerativeModel(name)
+                if probe:
+                    model.generate_content("ping", generation_config={"max_output_tokens": 1},
+                                           request_options={"timeout": timeout})
+            except Exception as e:
+                logger.warning("Model %s unavailable: %s", name, e)
+                continue
+            return index, name, model
+        return None
+
+    def _select(self, index, name, model):
+        # Caller must hold self._lock
+        if name != self._model_name:
+            logger.info("Selected Gemini model: %s", name)
+        self._model = model
+        self._model_name = name
+        self._index = index
+        self._failures = 0
+        self._resolved_at = time.monotonic()
+
+model_registry = GeminiModelRegistry(PREFERRED_MODELS)
+
+if GEMINI_CONFIGURED and os.environ.get("GEMINI_RESOLVE_MODEL_AT_STARTUP", "").lower() in ("1", "true", "yes"):
+    model_registry.resolve()
+
+# Upper bound for a single Gemini call, further capped by the request deadline
+GEMINI_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("GEMINI_REQUEST_TIMEOUT_SECONDS", 20))
+# Skip Gemini entirely when less than this much of the request budget is left
+GEMINI_MIN_BUDGET_SECONDS = float(os.environ.get("GEMINI_MIN_BUDGET_SECONDS", 1.0))
+# Budget held back from Gemini so the caller can still save the result (mood insert, stats) in time
+GEMINI_DEADLINE_RESERVE_MS = int(os.environ.get("GEMINI_DEADLINE_RESERVE_MS", 2000))
+
+def analysis_budget_seconds():
+    """Time the analysis may take: the request's remaining budget minus the persistence reserve, or None without a deadline"""
+    remaining = remaining_seconds()
+    if remaining is None:
+        return None
+    return max(0.0, remaining - GEMINI_DEADLINE_RESERVE_MS / 1000)
+
+def gemini_call_timeout():
+    """Timeout for one Gemini call; raises DeadlineExceeded when the analysis budget is nearly spent"""
+    budget = analysis_budget_seconds()
+    if budget is None:
+        return GEMINI_REQUEST_TIMEOUT_SECONDS
+    # Never start a call the request has no time left to wait for
+    check_deadline(GEMINI_MIN_BUDGET_SECONDS + GEMINI_DEADLINE_RESERVE_MS / 1000)
+    return min(budget, GEMINI_REQUEST_TIMEOUT_SECONDS)
+
+# Circuit breaker around Gemini: serve the fallback immediately while Gemini is failing or slow
+gemini_breaker = CircuitBreaker(
+    "gemini",
+    window_seconds=int(os.environ.get("GEMINI_BREAKER_WINDOW_SECONDS", 60)),
+    min_calls=int(os.environ.get("GEMINI_BREAKER_MIN_CALLS", 5)),
+    error_rate_threshold=float(os.environ.get("GEMINI_BREAKER_ERROR_RATE", 0.5)),
+    p95_latency_threshold=float(os.environ.get("GEMINI_BREAKER_P95_SECONDS", 8.0)),
+    cooldown_seconds=int(os.environ.get("GEMINI_BREAKER_COOLDOWN_SECONDS", 30)),
+    probe_successes=int(os.environ.get("GEMINI_BREAKER_PROBE_SUCCESSES", 2))
+)
+
+# Moods the analysis is allowed to return
+VALID_MOODS = ["joy", "sadness", "anger", "fear", "surprise", "disgust", "neutral"]
+
+# Output token budget: a mood label plus 1-2 sentences of feedback wrapped in JSON
+GEMINI_MAX_OUTPUT_TOKENS = int(os.environ.get("GEMINI_MAX_OUTPUT_TOKENS", 120))
+# Extra tokens for the array wrapper of a batch response
+GEMINI_BATCH_OUTPUT_OVERHEAD_TOKENS = 16
+
+# Response schemas for Gemini's structured JSON output mode
+MOOD_RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "mood": {"type": "string", "format": "enum", "enum": VALID_MOODS},
+        "feedback": {"type": "string"}
+    },
+    "required": ["mood", "feedback"]
+}
+MOOD_BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "index": {"type": "integer"},
+            "mood": {"type": "string", "format": "enum", "enum": VALID_MOODS},
+            "feedback": {"type": "string"}
+        },
+        "required": ["index", "mood", "feedback"]
+    }
+}
+
+# Models that rejected JSON mode; they are prompted for plain JSON instead
+_json_mode_unsupported = set()
+
+# Maximum stories packed into a single Gemini batch request
+GEMINI_BATCH_SIZE = int(os.environ.get("GEMINI_BATCH_SIZE", 10))
+
+# Optional server-side micro-batching of concurrent /analyze calls
+GEMINI_MICRO_BATCH_ENABLED = os.environ.get("GEMINI_MICRO_BATCH", "").lower() in ("1", "true", "yes")
+GEMINI_MICRO_BATCH_WINDOW_MS = int(os.environ.get("GEMINI_MICRO_BATCH_WINDOW_MS", 30))
+GEMINI_MICRO_BATCH_MAX_SIZE = int(os.environ.get("GEMINI_MICRO_BATCH_MAX_SIZE", 8))
+
+# Local classifier tier: serve confident predictions in-process, escalate the rest to Gemini.
+# Off by default; the threshold defaults to the one chosen on held-out data by
+# evaluate_mood_classifier.py and stored in the model file (none stored = never serve)
+LOCAL_CLASSIFIER_ENABLED = os.environ.get("LOCAL_CLASSIFIER_ENABLED", "false").lower() in ("1", "true", "yes")
+LOCAL_CLASSIFIER_THRESHOLD = (float(os.environ["LOCAL_CLASSIFIER_THRESHOLD"])
+                              if os.environ.get("LOCAL_CLASSIFIER_THRESHOLD") else None)
+
+# Counters for the local classifier tier
+local_tier_stats = {"served": 0, "escalated": 0}
+_local_tier_lock = threading.Lock()
+
 # Define feedback templates for each mood
 FEEDBACK_TEMPLATES = {
     "joy": [
@@ -89,30 +356,79 @@ FEEDBACK_TEMPLATES = {
     ]
 }
 
-# Simple non-AI backup for when Gemini is unavailable
-def generate_simple_analysis(story):
-    """
-    Extremely simple mood analysis as last resort backup
+# Prompt input budget: stories estimated above this many tokens are condensed or truncated
+GEMINI_INPUT_TOKEN_BUDGET = int(os.environ.get("GEMINI_INPUT_TOKEN_BUDGET", 800))
+# "condense" keeps the opening, the ending and the most emotional sentences; "truncate" keeps the start
+GEMINI_INPUT_OVERFLOW = os.environ.get("GEMINI_INPUT_OVERFLOW", "condense").lower()
+
+# Counters for the input preprocessing stage
+input_stats = {"stories": 0, "estimated_tokens": 0, "max_estimated_tokens": 0, "truncated": 0, "condensed": 0}
+_input_stats_lock = threading.Lock()
+
+_PROMPT_QUOTES_RE = re.compile(r'["\u201c\u201d`]')
+_SENTENCE_RE = re.compile(r'[^.!?]+[.!?]*')
+
+def estimate_tokens(text):
+    """Cheap token estimate (about four characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+def prepare_story(story, token_budget=None):
+    """Normalize a story for the Gemini prompt and fit it into the token budget.
+
+    Collapses whitespace, replaces the quote characters that break the prompt's
+    quoting and, when the estimate exceeds the budget, condenses (or truncates)
+    the text. Returns ``(text, estimated_tokens, action)`` where action is
+    None, "condensed" or "truncated".
     """
-    print("Using simple keyword-based analysis (fallback)")
+    budget = GEMINI_INPUT_TOKEN_BUDGET if token_budget is None else token_budget
+    text = _PROMPT_QUOTES_RE.sub("'", " ".join(story.split()))
+    tokens = estimate_tokens(text)
+    action = None
     
-    # Simple keyword matching
-    positive_words = ['happy', 'good', 'great', 'excellent', 'joy', 'wonderful', 'love', 'like', 'amazing']
-    negative_words = ['sad', 'bad', 'terrible', 'awful', 'hate', 'dislike', 'angry', 'upset', 'disappointed']
+    if tokens > budget:
+        if GEMINI_INPUT_OVERFLOW == "condense":
+            text = _condense(text, budget)
+            action = "condensed"
+        if estimate_tokens(text) > budget:
+            text = text[:budget * 4].rsplit(" ", 1)[0]
+            action = "truncated"
     
-    # Convert to lowercase for case-insensitive matching
-    story_lower = story.lower()
+    with _input_stats_lock:
+        input_stats["stories"] += 1
+        input_stats["estimated_tokens"] += tokens
+        input_stats["max_estimated_tokens"] = max(input_stats["max_estimated_tokens"], tokens)
+        if action:
+            input_stats[action] += 1
+    if action:
+        logger.info("Story of ~%s tokens %s to fit the %s token budget", tokens, action, budget)
+    return text, tokens, action
+
+def _condense(text, budget):
+    """Extractive condensation: keep the first and last sentence plus the most emotional ones"""
+    sentences = [sentence.strip() for sentence in _SENTENCE_RE.findall(text) if sentence.strip()]
+    if len(sentences) <= 2:
+        return text
     
-    # Count positive and negative words
-    positive_count = sum(word in story_lower for word in positive_words)
-    negative_count = sum(word in story_lower for word in negative_words)
+    keep = {0, len(sentences) - 1}
+    used = estimate_tokens(sentences[0]) + estimate_tokens(sentences[-1])
+    ranked = sorted(range(1, len(sentences) - 1), key=lambda i: sum(score_moods(sentences[i])), reverse=True)
+    for index in ranked:
+        cost = estimate_tokens(sentences[index]) + 1
+        if used + cost > budget:
+            continue
+        keep.add(index)
+        used += cost
+    return " ".join(sentences[index] for index in sorted(keep))
+
+# Simple non-AI backup for when Gemini is unavailable
+def generate_simple_analysis(story):
+    """
+    Lexicon-based mood analysis as last resort backup
+    """
+    logger.info("Using simple lexicon-based analysis (fallback)")
     
-    if positive_count > negative_count:
-        mood = "joy"
-    elif negative_count > positive_count:
-        mood = "sadness"
-    else:
-        mood = "neutral"
+    # Whole-word, negation-aware scoring across all seven moods
+    mood, _ = classify_mood(story)
     
     # Use a template response
     feedback = random.choice(FEEDBACK_TEMPLATES[mood])
@@ -120,7 +436,30 @@ def generate_simple_analysis(story):
     return {
         "mood": mood,
         "feedback": feedback,
-        "model_used": "simple-keyword"
+        "model_used": "simple-lexicon"
+    }
+
+def classify_locally(story):
+    """First analysis tier: return a result from the local classifier if it is confident enough"""
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+    classifier = get_default_classifier()
+    if classifier is None:
+        return None
+    
+    threshold = LOCAL_CLASSIFIER_THRESHOLD if LOCAL_CLASSIFIER_THRESHOLD is not None else classifier.threshold
+    prediction = classifier.serving_prediction(story, threshold)
+    with _local_tier_lock:
+        local_tier_stats["escalated" if prediction is None else "served"] += 1
+    if prediction is None:
+        return None
+    
+    mood, confidence = prediction
+    return {
+        "mood": mood,
+        "feedback": random.choice(FEEDBACK_TEMPLATES[mood]),
+        "model_used": "local-nb",
+        "confidence": round(confidence, 3)
     }
 
 def analyze_mood(story):
@@ -130,17 +469,47 @@ def analyze_mood(story):
         logger.warning("Empty story received")
         return {"mood": "neutral", "feedback": "No story provided."}
 
-    # Try Gemini if available
-    if GEMINI_AVAILABLE and GEMINI_API_KEY:
+    # Serve repeated stories from the content-addressed cache
+    cache_key = story_cache_key(story)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Serving analysis from cache")
+        return cached
+
+    # Confident local predictions never reach Gemini
+    local_result = classify_locally(story)
+    if local_result is not None:
+        return local_result
+
+    # Concurrent calls for the same story share a single in-flight analysis
+    try:
+        return analysis_flight.do(cache_key, lambda: analyze_uncached_mood(story, cache_key),
+                                  timeout=analysis_budget_seconds())
+    except TimeoutError:
+        logger.warning("Request deadline reached while waiting for in-flight analysis, using keyword fallback")
+        return generate_simple_analysis(story)
+
+def analyze_uncached_mood(story, cache_key):
+    """Run the Gemini/keyword analysis for a story that missed the cache"""
+    # Try Gemini if available and not currently tripped
+    if GEMINI_AVAILABLE and GEMINI_API_KEY and gemini_breaker.allow_request():
         try:
             logger.info("Attempting Gemini analysis")
-            result = analyze_with_gemini(story)
+            if micro_batcher is not None:
+                result = micro_batcher.analyze(story)
+            else:
+                result = analyze_with_gemini(story)
             if result:
                 logger.info("Successfully analyzed with Gemini")
+                # Only Gemini results are cached; the keyword fallback is cheap and lower quality
+                analysis_cache.set(cache_key, result)
                 return result
         except Exception as e:
-            logger.error(f"Gemini API error: {str(e)}")
+            logger.error("Gemini API error: %s", e)
             logger.error(traceback.format_exc())
+        finally:
+            # Hand back a half-open probe slot if no Gemini call was made after all
+            gemini_breaker.release_probe()
     
     # If Gemini fails, use simple keyword analysis
     logger.warning("Using simple keyword analysis as fallback")
@@ -151,31 +520,15 @@ def analyze_with_gemini(story):
     if not GEMINI_API_KEY:
         return None
         
-    # Select from preferred Gemini models
-    preferred_models = [
-        "models/gemini-1.5-flash",
-        "models/gemini-1.5-pro",
-        "models/gemini-pro",
-        "gemini-pro",
-        "models/gemini-1.0-pro",
-        "models/gemini-1.5-flash-latest"
-    ]
-    model = None
-    for name in preferred_models:
-        try:
-            logger.info(f"Attempting to load Gemini model: {name}")
-            model = genai.GenerativeModel(name)
-            logger.info(f"Selected Gemini model: {name}")
-            break
-        except Exception as e:
-            logger.warning(f"Model {name} unavailable: {str(e)}")
+    model = model_registry.get_model()
     if model is None:
         logger.error("No available Gemini model found")
         return None
 
     try:
+        text, _, _ = prepare_story(story)
         prompt = f"""
-        Analyze this text: "{story}"
+        Analyze this text: "{text}"
         
         First, determine the primary emotion/mood (choose only ONE from: joy, sadness, anger, fear, surprise, disgust, neutral).
         
@@ -188,61 +541,433 @@ def analyze_with_gemini(story):
         IMPORTANT: Return raw JSON with no markdown formatting, code blocks, or additional text.
         """
         
+        raw_response = generate_with_model(model, prompt, max_output_tokens=GEMINI_MAX_OUTPUT_TOKENS,
+                                           response_schema=MOOD_RESULT_SCHEMA)
+        
+        return normalize_mood_result(extract_json(raw_response, "{"))
+    
+    except Exception as e:
+        logger.error("Gemini analysis error: %s", e)
+        return None
+
+def generate_with_model(model, prompt, max_output_tokens, response_schema=None):
+    """Run a single Gemini completion and report the outcome to the registry and breaker.
+
+    With ``response_schema`` the model is asked for schema-constrained JSON;
+    models that reject JSON mode are remembered and prompted for plain JSON.
+    """
+    timeout = gemini_call_timeout()
+    
+    generation_config = {
+        "temperature": 0.7,
+        "top_p": 0.95,
+        "top_k": 40,
+        "max_output_tokens": max_output_tokens
+    }
+    model_name = getattr(model, "model_name", None)
+    json_mode = response_schema is not None and model_name not in _json_mode_unsupported
+    if json_mode:
+        generation_config["response_mime_type"] = "application/json"
+        generation_config["response_schema"] = response_schema
+    
+    started = time.monotonic()
+    try:
+        response = model.generate_content(
+            prompt,
+            generation_config=generation_config,
+            request_options={"timeout": timeout}
+        )
+    except Exception as e:
+        if json_mode and _is_json_mode_rejection(e):
+            logger.info("Gemini model %s does not support JSON mode, falling back to prompted JSON", model_name)
+            _json_mode_unsupported.add(model_name)
+            return generate_with_model(model, prompt, max_output_tokens)
+        # Only errors from the model call itself count towards failover
+        model_registry.report_failure(model)
+        gemini_breaker.record_failure(time.monotonic() - started)
+        raise
+    model_registry.report_success(model)
+    gemini_breaker.record_success(time.monotonic() - started)
+    return response.text.strip()
+
+def _is_json_mode_rejection(error):
+    message = str(error).lower()
+    return "mime" in message or "json mode" in message or "response_schema" in message
+
+def stream_mood_analysis(story):
+    """Analyze a story incrementally for streaming responses.
+
+    Yields ``("mood", mood)`` as soon as the mood is known, then
+    ``("feedback", text)`` chunks, and finally ``("done", result)`` with the
+    complete result dict (same shape as analyze_mood's return value).
+    """
+    cache_key = story_cache_key(story)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Serving streamed analysis from cache")
+        yield from _stream_complete_result(cached)
+        return
+    
+    local_result = classify_locally(story)
+    if local_result is not None:
+        yield from _stream_complete_result(local_result)
+        return
+    
+    model = None
+    if GEMINI_AVAILABLE and GEMINI_API_KEY and gemini_breaker.allow_request():
+        model = model_registry.get_model()
+        if model is None:
+            gemini_breaker.release_probe()
+    
+    if model is not None:
+        mood = None
+        feedback_parts = []
+        completed = False
+        try:
+            for event, payload in _stream_with_model(model, story):
+                if event == "mood":
+                    mood = payload
+                else:
+                    feedback_parts.append(payload)
+                yield event, payload
+            completed = True
+        except Exception as e:
+            logger.error("Gemini streaming error: %s", e)
+        finally:
+            # The stream may end (or the client disconnect) before an outcome was reported
+            gemini_breaker.release_probe()
+        
+        if mood is not None:
+            feedback = "".join(feedback_parts).strip()
+            if not feedback:
+                # The stream broke after the mood line; finish with a template response
+                feedback = random.choice(FEEDBACK_TEMPLATES[mood])
+                yield "feedback", feedback
+                yield "done", {"mood": mood, "feedback": feedback, "model_used": "gemini"}
+                return
+            result = {"mood": mood, "feedback": feedback, "model_used": "gemini"}
+            if completed:
+                analysis_cache.set(cache_key, result)
+            yield "done", result
+            return
+    
+    logger.warning("Using simple keyword analysis as fallback for streamed analysis")
+    yield from _stream_complete_result(generate_simple_analysis(story))
+
+def _stream_complete_result(result):
+    yield "mood", result["mood"]
+    yield "feedback", result["feedback"]
+    yield "done", result
+
+def _stream_with_model(model, story):
+    """Stream a Gemini completion, yielding the mood line first and then feedback text"""
+    text, _, _ = prepare_story(story)
+    prompt = f"""
+    Analyze this text: "{text}"
+    
+    First, determine the primary emotion/mood (choose only ONE from: joy, sadness, anger, fear, surprise, disgust, neutral).
+    
+    Then create a personalized, compassionate response (1-2 sentences) directly addressing what the person wrote.
+    Make your feedback empathetic, varied, and naturally conversational - like a supportive friend would respond.
+    
+    Respond in exactly this plain-text format, with no markdown:
+    MOOD: chosen_mood
+    your personalized response
+    """
+    
+    timeout = gemini_call_timeout()
+    
+    started = time.monotonic()
+    try:
         response = model.generate_content(
             prompt,
             generation_config={
                 "temperature": 0.7,
                 "top_p": 0.95,
                 "top_k": 40,
-                "max_output_tokens": 200
-            }
+                "max_output_tokens": GEMINI_MAX_OUTPUT_TOKENS
+            },
+            stream=True,
+            request_options={"timeout": timeout}
         )
         
-        raw_response = response.text.strip()
+        buffer = ""
+        mood = None
+        for chunk in response:
+            text = chunk.text
+            if mood is not None:
+                yield "feedback", text
+                continue
+            buffer += text
+            if "\n" not in buffer.lstrip():
+                continue
+            mood_line, rest = buffer.lstrip().split("\n", 1)
+            mood = parse_mood_line(mood_line)
+            yield "mood", mood
+            if rest.strip():
+                yield "feedback", rest.lstrip()
         
-        # Process response
+        if mood is None and buffer.strip():
+            # The model never got past the mood line
+            yield "mood", parse_mood_line(buffer.strip())
+    except Exception:
+        model_registry.report_failure(model)
+        gemini_breaker.record_failure(time.monotonic() - started)
+        raise
+    model_registry.report_success(model)
+    gemini_breaker.record_success(time.monotonic() - started)
+
+def parse_mood_line(line):
+    """Turn a ``MOOD: <mood>`` line into one of VALID_MOODS"""
+    mood = line.strip().strip("*").strip()
+    if mood.lower().startswith("mood:"):
+        mood = mood[len("mood:"):]
+    mood = mood.strip().strip(".*\"'").lower()
+    return mood if mood in VALID_MOODS else get_closest_mood(mood, VALID_MOODS)
+
+def normalize_mood_result(result):
+    """Validate a raw Gemini result and map its mood onto one of VALID_MOODS"""
+    if not isinstance(result, dict) or 'mood' not in result or 'feedback' not in result:
+        return None
+    
+    mood = str(result['mood']).lower()
+    if mood not in VALID_MOODS:
+        mood = get_closest_mood(mood, VALID_MOODS)
+    
+    return {
+        "mood": mood,
+        "feedback": str(result['feedback']),
+        "model_used": "gemini"
+    }
+
+def analyze_mood_batch(stories):
+    """Analyze several stories, packing cache misses into chunked Gemini requests.
+
+    Returns one result per input story, in input order.
+    """
+    results = [None] * len(stories)
+    pending = []
+    
+    for index, story in enumerate(stories):
+        if not story:
+            results[index] = {"mood": "neutral", "feedback": "No story provided."}
+            continue
+        cache_key = story_cache_key(story)
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            results[index] = cached
+            continue
+        local_result = classify_locally(story)
+        if local_result is not None:
+            results[index] = local_result
+        else:
+            pending.append((index, cache_key, story))
+    
+    if pending and GEMINI_AVAILABLE and GEMINI_API_KEY and gemini_breaker.allow_request():
         try:
-            result = json.loads(raw_response)
-        except json.JSONDecodeError:
-            cleaned_json = clean_json_response(raw_response)
-            result = json.loads(cleaned_json)
+            for start in range(0, len(pending), GEMINI_BATCH_SIZE):
+                chunk = pending[start:start + GEMINI_BATCH_SIZE]
+                try:
+                    chunk_results = analyze_batch_with_gemini([story for _, _, story in chunk])
+                except Exception as e:
+                    logger.error("Gemini batch analysis error: %s", e)
+                    chunk_results = [None] * len(chunk)
+                for (index, cache_key, _), result in zip(chunk, chunk_results):
+                    if result:
+                        analysis_cache.set(cache_key, result)
+                        results[index] = result
+        finally:
+            gemini_breaker.release_probe()
+    
+    # Anything Gemini could not answer falls back to keyword analysis
+    missing = [index for index, result in enumerate(results) if result is None]
+    if missing:
+        logger.warning("Using simple keyword analysis as fallback for %s batched stories", len(missing))
+        for index in missing:
+            results[index] = generate_simple_analysis(stories[index])
+    
+    return results
+
+def analyze_batch_with_gemini(stories):
+    """Analyze a chunk of stories with one Gemini request.
+
+    Returns a list aligned with ``stories``; entries Gemini did not answer
+    correctly are None.
+    """
+    model = model_registry.get_model()
+    if model is None:
+        logger.error("No available Gemini model found")
+        return [None] * len(stories)
+    
+    numbered = [{"index": index, "text": prepare_story(story)[0]} for index, story in enumerate(stories)]
+    prompt = f"""
+    Analyze each of the following journal entries independently. The entries are given as a JSON array:
+    {json.dumps(numbered, ensure_ascii=False)}
+    
+    For each entry, determine the primary emotion/mood (choose only ONE from: joy, sadness, anger, fear, surprise, disgust, neutral),
+    then create a personalized, compassionate response (1-2 sentences) directly addressing what the person wrote.
+    Make your feedback empathetic, varied, and naturally conversational - like a supportive friend would respond.
+    
+    Return ONLY a valid JSON array with one object per entry, using exactly this structure:
+    [{{"index": 0, "mood": "chosen_mood", "feedback": "your personalized response"}}]
+    
+    IMPORTANT: Return raw JSON with no markdown formatting, code blocks, or additional text.
+    """
+    
+    raw_response = generate_with_model(
+        model, prompt,
+        max_output_tokens=GEMINI_BATCH_OUTPUT_OVERHEAD_TOKENS + GEMINI_MAX_OUTPUT_TOKENS * len(stories),
+        response_schema=MOOD_BATCH_SCHEMA
+    )
+    items = extract_json(raw_response, "[")
+    
+    results = [None] * len(stories)
+    if not isinstance(items, list):
+        return results
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        index = item.get("index", position)
+        if isinstance(index, int) and 0 <= index < len(stories):
+            results[index] = normalize_mood_result(item)
+    return results
+
+class _PendingAnalysis:
+    """A story waiting in the micro-batcher for its result"""
+    __slots__ = ("story", "result", "done")
+
+    def __init__(self, story):
+        self.story = story
+        self.result = None
+        self.done = threading.Event()
+
+class GeminiMicroBatcher:
+    """Coalesces concurrent single-story Gemini calls into combined batch requests.
+
+    When no other Gemini call is in flight a story is analyzed immediately with
+    a single call, so low traffic pays no extra latency. Under concurrency the
+    first waiting request becomes the batch leader: it collects stories for up
+    to ``window_ms`` (or until ``max_batch`` are queued), issues one combined
+    request and fans the per-story results back to the waiting requests.
+    """
+    def __init__(self, window_ms=GEMINI_MICRO_BATCH_WINDOW_MS, max_batch=GEMINI_MICRO_BATCH_MAX_SIZE):
+        self.window_seconds = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        self._pending = []
+        self._in_flight = 0
+        self.single_calls = 0
+        self.batch_calls = 0
+        self.batched_stories = 0
+
+    def analyze(self, story):
+        with self._cond:
+            solo = self._in_flight == 0 and not self._pending
+            if solo:
+                self._in_flight += 1
         
-        # Validate result
-        if 'mood' not in result or 'feedback' not in result:
-            return None
+        if solo:
+            try:
+                return analyze_with_gemini(story)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self.single_calls += 1
         
-        # Normalize mood
-        valid_moods = ["joy", "sadness", "anger", "fear", "surprise", "disgust", "neutral"]
-        if result['mood'].lower() not in valid_moods:
-            result['mood'] = get_closest_mood(result['mood'], valid_moods)
+        item = _PendingAnalysis(story)
+        with self._cond:
+            self._pending.append(item)
+            is_leader = len(self._pending) == 1
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+            
+            if is_leader:
+                deadline = time.monotonic() + self.window_seconds
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending
+                self._pending = []
+                self._in_flight += 1
         
-        result['model_used'] = "gemini"
-        return result
-    
-    except Exception as e:
-        logger.error(f"Gemini analysis error: {str(e)}")
-        return None
+        if not is_leader:
+            # A follower stops waiting when its own request runs out of time
+            item.done.wait(analysis_budget_seconds())
+            return item.result
+        
+        try:
+            self._run(batch)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+        return item.result
+
+    def stats(self):
+        with self._cond:
+            return {
+                "window_ms": int(self.window_seconds * 1000),
+                "max_batch": self.max_batch,
+                "single_calls": self.single_calls,
+                "batch_calls": self.batch_calls,
+                "batched_stories": self.batched_stories,
+                "pending": len(self._pending)
+            }
 
-def clean_json_response(text):
-    """Clean and extract JSON from the response text."""
-    # Remove code block markers
-    if "```json" in text:
-        text = text.split("```json")[1].split("```")[0].strip()
-    elif "```" in text:
-        text = text.split("```")[1].strip()
-    
-    # Find JSON object pattern
-    json_match = re.search(r'\{[\s\S]*\}', text)
-    if json_match:
-        text = json_match.group(0)
-    
-    # Fix common issues
-    text = text.replace("'", '"')
-    text = text.replace('\\n', ' ')
-    text = text.replace('\\"', '"')
-    text = re.sub(r',\s*}', '}', text)
-    
-    return text
+    def _run(self, batch):
+        try:
+            for start in range(0, len(batch), self.max_batch):
+                chunk = batch[start:start + self.max_batch]
+                if len(chunk) == 1:
+                    results = [analyze_with_gemini(chunk[0].story)]
+                    with self._cond:
+                        self.single_calls += 1
+                else:
+                    try:
+                        results = analyze_batch_with_gemini([pending.story for pending in chunk])
+                    except Exception as e:
+                        logger.error("Gemini micro-batch error: %s", e)
+                        results = [None] * len(chunk)
+                    with self._cond:
+                        self.batch_calls += 1
+                        self.batched_stories += len(chunk)
+                for pending, result in zip(chunk, results):
+                    pending.result = result
+        finally:
+            # Never leave a waiting request hanging; missing results fall back to keywords
+            for pending in batch:
+                pending.done.set()
+
+micro_batcher = GeminiMicroBatcher() if GEMINI_MICRO_BATCH_ENABLED else None
+
+def get_analysis_metrics():
+    """Return in-process counters for the analysis pipeline"""
+    return {
+        "gemini_model": model_registry.model_name,
+        "input": dict(input_stats, token_budget=GEMINI_INPUT_TOKEN_BUDGET),
+        "local_classifier": dict(local_tier_stats, threshold=LOCAL_CLASSIFIER_THRESHOLD, enabled=LOCAL_CLASSIFIER_ENABLED),
+        "coalescing": analysis_flight.stats(),
+        "circuit_breaker": gemini_breaker.stats(),
+        "micro_batch": micro_batcher.stats() if micro_batcher else None
+    }
+
+def extract_json(text, opening="{"):
+    """Extract the first JSON value starting with ``opening`` from model output.
+
+    Tolerates code fences and prose around the value by decoding straight
+    from each candidate opening bracket, so well-formed output is parsed once.
+    Returns None if no value can be decoded.
+    """
+    decoder = json.JSONDecoder()
+    start = text.find(opening)
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            return value
+        except json.JSONDecodeError:
+            start = text.find(opening, start + 1)
+    return None
 
 def get_closest_mood(invalid_mood, valid_moods):
     """Map an invalid mood to the closest valid one."""
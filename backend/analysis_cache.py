@@ -0,0 +1,207 @@
+"""
+Content-addressed cache and request coalescing for mood analysis results.
+
+Stories are normalized (case and whitespace) and hashed, so only the SHA-256
+digest is ever used as a key - the raw story text is never stored. Results
+live in a bounded in-process LRU tier with a TTL and, optionally, in a shared
+MongoDB collection that expires documents through a TTL index. Concurrent
+misses for the same story are coalesced into a single in-flight analysis.
+"""
+import os
+import re
+import copy
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger("aura_q")
+
+# Cache configuration (size 0 disables the in-process tier)
+ANALYSIS_CACHE_SIZE = int(os.environ.get("ANALYSIS_CACHE_SIZE", 1024))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.environ.get("ANALYSIS_CACHE_TTL_SECONDS", 24 * 60 * 60))
+ANALYSIS_CACHE_SHARED = os.environ.get("ANALYSIS_CACHE_SHARED", "").lower() in ("1", "true", "yes")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_story(story):
+    """Normalize a story so trivially different variants share one cache entry"""
+    return _WHITESPACE_RE.sub(" ", story).strip().lower()
+
+def story_cache_key(story):
+    """Return the content address (SHA-256 hex digest) of a normalized story"""
+    return hashlib.sha256(normalize_story(story).encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    """Two-tier (local LRU + optional shared MongoDB) cache of analysis results"""
+    def __init__(self, max_size=ANALYSIS_CACHE_SIZE, ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._collection = None
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def attach_collection(self, collection):
+        """Enable the shared tier backed by a MongoDB collection"""
+        try:
+            collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+            self._collection = collection
+            logger.info("Shared analysis cache enabled on collection %s", collection.name)
+        except Exception as e:
+            logger.warning("Shared analysis cache unavailable: %s", e)
+
+    def get(self, key):
+        """Return a copy of the cached result for ``key`` or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.local_hits += 1
+                    return copy.deepcopy(result)
+                del self._entries[key]
+
+        result = self._get_shared(key)
+        if result is not None:
+            with self._lock:
+                self.shared_hits += 1
+            self._set_local(key, result)
+            return copy.deepcopy(result)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, result):
+        """Store ``result`` under ``key`` in every enabled tier"""
+        self._set_local(key, result)
+        if self._collection is not None:
+            try:
+                self._collection.replace_one(
+                    {"_id": key},
+                    {"_id": key, "result": result, "created_at": datetime.utcnow()},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning("Failed to write shared analysis cache: %s", e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.local_hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "shared_enabled": self._collection is not None,
+                "local_hits": self.local_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    def _set_local(self, key, result):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _get_shared(self, key):
+        if self._collection is None:
+            return None
+        try:
+            doc = self._collection.find_one({"_id": key}, {"result": 1, "created_at": 1})
+        except Exception as e:
+            logger.warning("Failed to read shared analysis cache: %s", e)
+            return None
+        if not doc:
+            return None
+        # The TTL monitor only runs once a minute, so check expiry ourselves
+        created_at = doc.get("created_at")
+        if isinstance(created_at, datetime) and (datetime.utcnow() - created_at).total_seconds() > self.ttl_seconds:
+            return None
+        return doc.get("result")
+
+class _Flight:
+    """A call in progress that other callers can wait on"""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running wait for and share its result (each receives its own copy).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, timeout=None):
+        """Run ``fn`` for ``key`` or wait up to ``timeout`` seconds for the running call.
+
+        Raises TimeoutError if a follower's wait runs out.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                is_leader = False
+            else:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.executions += 1
+                is_leader = True
+
+        if not is_leader:
+            if not flight.done.wait(timeout):
+                raise TimeoutError("Timed out waiting for in-flight analysis")
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        try:
+            result = fn()
+            # Followers get a snapshot taken before the leader's caller can mutate it
+            flight.result = copy.deepcopy(result)
+            return result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights)
+            }
+
+analysis_cache = AnalysisCache()
+analysis_flight = SingleFlight()
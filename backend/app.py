@@ -1,42 +1,39 @@
-from flask import Flask, request, jsonify
-from ai_analysis import analyze_mood
+from flask import Flask, request, jsonify, g, Response, stream_with_context
+from ai_analysis import analyze_mood, analyze_mood_batch, stream_mood_analysis, get_analysis_metrics
+from analysis_cache import analysis_cache, ANALYSIS_CACHE_SHARED
+from deadline import request_deadline, DeadlineExceeded
+from user_cache import user_cache
+from db_health import db_health
+from db_indexes import ensure_indexes
+from structured_logging import configure_logging, get_logging_stats
+from weekly_moods import record_weekly_mood, get_recent_weekly_moods, js_day_index, parse_entry_date
+from rewards import get_rewards_state, increment_daily_count as increment_daily_count_for_user
+from password_hashing import PasswordHasher, PasswordHasherBusy
+from mood_stats import record_entries, record_deletion, reset_user_stats, get_user_statistics
+from login_tracker import login_bookkeeper
+from mood_writer import mood_writer, MoodWriterBusy
+from history_cursor import encode_history_cursor, decode_history_cursor, history_page_query, InvalidCursor
 from flask_cors import CORS
 from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_access_token
-from datetime import datetime, timedelta
+from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, get_jwt, create_access_token
+from datetime import datetime, timedelta, timezone
 import os
-import sys
-import logging
 import traceback
 from dotenv import load_dotenv
 from flask_pymongo import PyMongo
 from bson.objectid import ObjectId
 import time
 import pymongo
+import io
+import csv
 import json
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logger for Vercel environment (console only)
-logger = logging.getLogger("aura_q")
-logger.setLevel(logging.INFO)
-
-# Prevent duplicate logs by checking if handlers already exist
-if not logger.handlers:
-    # Create console handler for Vercel
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    
-    # Create formatter
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    console_handler.setFormatter(formatter)
-    
-    # Add handler to the logger
-    logger.addHandler(console_handler)
-else:
-    # If handlers exist, we're probably being imported multiple times
-    logger.debug("Logger already configured, skipping handler setup")
+# Configure logger for Vercel environment (console only). Records are written
+# as JSON by a background listener thread; configure_logging is idempotent.
+logger = configure_logging("aura_q")
 
 # Initialize app
 app = Flask(__name__)
@@ -73,6 +70,9 @@ else:
 db = None
 mongo = None
 
+# How often pymongo's background monitor checks each server; bounds how stale db_health can be
+DB_HEARTBEAT_FREQUENCY_MS = int(os.environ.get("DB_HEARTBEAT_FREQUENCY_MS", 10000))
+
 # Function to establish MongoDB connection with retries
 def initialize_mongodb_connection(max_retries=3, retry_delay=2):
     global mongo, db
@@ -81,7 +81,7 @@ def initialize_mongodb_connection(max_retries=3, retry_delay=2):
     
     while retry_count < max_retries:
         try:
-            logger.info(f"Attempting MongoDB connection (attempt {retry_count+1}/{max_retries})")
+            logger.info("Attempting MongoDB connection (attempt %s/%s)", retry_count+1, max_retries)
             app.config["MONGO_URI"] = mongo_uri
             
             # Set MongoDB connection options with timeouts
@@ -91,7 +91,10 @@ def initialize_mongodb_connection(max_retries=3, retry_delay=2):
                 "socketTimeoutMS": 10000
             }
             
-            mongo = PyMongo(app)
+            # db_health follows pymongo's own background heartbeats, so request
+            # handlers can read the connection state without pinging the server.
+            # Each client gets a fresh listener; events of earlier clients are ignored.
+            mongo = PyMongo(app, event_listeners=[db_health.listener()], heartbeatFrequencyMS=DB_HEARTBEAT_FREQUENCY_MS)
             db = mongo.db
             
             # Test MongoDB connection
@@ -102,14 +105,19 @@ def initialize_mongodb_connection(max_retries=3, retry_delay=2):
         except Exception as e:
             retry_count += 1
             last_error = str(e)
-            logger.warning(f"MongoDB connection attempt {retry_count} failed: {str(e)}")
+            logger.warning("MongoDB connection attempt %s failed: %s", retry_count, e)
             
             if retry_count < max_retries:
-                logger.info(f"Retrying in {retry_delay} seconds...")
+                # Stop the failed client's monitor threads before building the next one;
+                # the last one is kept so the app can still reach MongoDB once it is back
+                if mongo is not None:
+                    mongo.cx.close()
+                    mongo, db = None, None
+                logger.info("Retrying in %s seconds...", retry_delay)
                 time.sleep(retry_delay)
                 retry_delay *= 2  # Exponential backoff
     
-    logger.error(f"All MongoDB connection attempts failed. Last error: {last_error}")
+    logger.error("All MongoDB connection attempts failed. Last error: %s", last_error)
     logger.error(traceback.format_exc())
     return False
 
@@ -119,6 +127,20 @@ mongodb_connected = initialize_mongodb_connection()
 if not mongodb_connected:
     logger.warning("MongoDB connection failed. App will run with limited functionality.")
     # In Vercel we'll continue even with failed MongoDB to allow diagnosis
+else:
+    if ANALYSIS_CACHE_SHARED:
+        # Share analysis results across processes through a TTL-indexed collection
+        analysis_cache.attach_collection(db.analysis_cache)
+    # last_login / login_count are written behind the login response in periodic bulk flushes
+    login_bookkeeper.attach(db.users)
+    # Mood entries are inserted inline or, with MOOD_WRITE_MODE=async, in background batches
+    mood_writer.attach(db.mood_entries, on_written=lambda entries: update_mood_stats_for_entries(entries))
+    if os.environ.get("ENSURE_INDEXES_ON_STARTUP", "false").lower() == "true":
+        # Idempotent; skips the explain step so startup stays quick
+        try:
+            ensure_indexes(db, explain=False)
+        except Exception as e:
+            logger.warning("Index bootstrap failed: %s", e)
 
 # Set up CORS for all routes with appropriate origins
 FRONTEND_ORIGINS = [
@@ -140,7 +162,7 @@ FRONTEND_ORIGINS = [
 # Check environment variable for production frontend URL
 if os.environ.get("FRONTEND_URL"):
     FRONTEND_ORIGINS.append(os.environ.get("FRONTEND_URL"))
-    logger.info(f"Added production frontend URL: {os.environ.get('FRONTEND_URL')}")
+    logger.info("Added production frontend URL: %s", os.environ.get('FRONTEND_URL'))
 
 # Configure CORS with more permissive settings for development
 CORS(app, resources={
@@ -151,9 +173,11 @@ CORS(app, resources={
         "supports_credentials": True
     },
 })
-logger.info(f"CORS configured with origins: {FRONTEND_ORIGINS}")
+logger.info("CORS configured with origins: %s", FRONTEND_ORIGINS)
 
 bcrypt = Bcrypt(app)
+# All hashing and checks run on a bounded pool so login bursts can't starve other endpoints
+password_hasher = PasswordHasher(bcrypt)
 
 # Debug endpoint to list users
 @app.route("/debug/users", methods=["GET"])
@@ -180,6 +204,25 @@ def debug_list_users():
     
     return jsonify(response)
 
+# Debug endpoint exposing in-process performance counters
+@app.route("/debug/metrics", methods=["GET"])
+def debug_metrics():
+    return jsonify({
+        "analysis": get_analysis_metrics(),
+        "analysis_cache": analysis_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "database": db_health.snapshot(),
+        "logging": get_logging_stats(),
+        "password_hashing": password_hasher.stats(),
+        "login_bookkeeping": login_bookkeeper.stats(),
+        "mood_writer": mood_writer.stats()
+    })
+
+def flush_pending_writes():
+    """Flush write-behind buffers; called from run.py's shutdown handlers (atexit covers other exits)"""
+    login_bookkeeper.flush()
+    mood_writer.flush()
+
 # Secret key for JWT (loaded from environment variables)
 app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "supersecretkey")
 if app.config["JWT_SECRET_KEY"] == "supersecretkey":
@@ -205,16 +248,39 @@ class ApiError(Exception):
         result['error'] = self.message
         return result
 
+# Per-endpoint time budgets (seconds). Gemini calls and every MongoDB query made
+# while handling the request share this budget.
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", 10))
+ENDPOINT_DEADLINES = {
+    "analyze": float(os.environ.get("ANALYZE_DEADLINE_SECONDS", 25)),
+    "analyze_batch": float(os.environ.get("ANALYZE_BATCH_DEADLINE_SECONDS", 60)),
+    "analyze_stream": float(os.environ.get("ANALYZE_DEADLINE_SECONDS", 25)),
+    # Covers the whole streamed response, since the request context lives until the last chunk
+    "export_history": float(os.environ.get("EXPORT_DEADLINE_SECONDS", 300))
+}
+
+@app.before_request
+def start_request_deadline():
+    budget = ENDPOINT_DEADLINES.get(request.endpoint, REQUEST_DEADLINE_SECONDS)
+    g.deadline_scope = request_deadline(budget)
+    g.deadline_scope.__enter__()
+
+@app.teardown_request
+def end_request_deadline(exc):
+    scope = g.pop("deadline_scope", None)
+    if scope is not None:
+        scope.__exit__(None, None, None)
+
 @app.errorhandler(ApiError)
 def handle_api_error(error):
-    logger.error(f"API Error: {error.message} - Code: {error.status_code}")
+    logger.error("API Error: %s - Code: %s", error.message, error.status_code)
     response = jsonify(error.to_dict())
     response.status_code = error.status_code
     return response
 
 @app.errorhandler(Exception)
 def handle_generic_exception(e):
-    logger.error(f"Unhandled exception: {str(e)}")
+    logger.error("Unhandled exception: %s", e)
     logger.error(traceback.format_exc())
     return jsonify({"error": "Internal server error"}), 500
 
@@ -248,7 +314,7 @@ def json_signup():
             return jsonify({"error": "Username already exists"}), 409
         
         # Hash the password
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = hash_password(password)
         
         # Create new user
         new_user = {
@@ -263,12 +329,17 @@ def json_signup():
             "last_reset_date": datetime.now().strftime("%Y-%m-%d")
         }
         
-        # Insert into MongoDB
-        result = db.users.insert_one(new_user)
-        logger.info(f"User {username} registered successfully in MongoDB")
+        # Insert into MongoDB; the unique indexes catch a concurrent signup that passed the check above
+        try:
+            result = db.users.insert_one(new_user)
+        except pymongo.errors.DuplicateKeyError as e:
+            field = duplicate_user_field(e, new_user)
+            logger.info("Registration failed: %s for %s already exists", field, username)
+            return jsonify({"error": f"{field.capitalize()} already exists"}), 409
+        logger.info("User %s registered successfully in MongoDB", username)
         
         # Create token for auto-login
-        access_token = create_access_token(identity=username)
+        access_token = create_user_token(new_user)
         
         return jsonify({
             "message": "User registered successfully", 
@@ -276,8 +347,11 @@ def json_signup():
             "username": username
         }), 201
         
+    except ApiError:
+        # Let the global handler take care of this
+        raise
     except Exception as e:
-        logger.error(f"Unexpected error during signup: {str(e)}")
+        logger.error("Unexpected error during signup: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({"error": "Registration error", "details": str(e)}), 500
 
@@ -286,7 +360,7 @@ def json_login():
     try:
         data = request.get_json()
         
-        logger.info(f"Login attempt for username: {data.get('username', 'unknown')}")
+        logger.info("Login attempt for username: %s", data.get('username', 'unknown'), extra={"event": "login.attempt"})
         
         if not data or 'username' not in data or 'password' not in data:
             return jsonify({"error": "Username and password are required"}), 400
@@ -304,27 +378,20 @@ def json_login():
             
             # Check if user exists and password matches
             if not user:
-                logger.warning(f"User {username} not found in MongoDB")
+                logger.warning("User %s not found in MongoDB", username)
                 return jsonify({"error": "Invalid username or password"}), 401
                 
-            if not bcrypt.check_password_hash(user["password"], password):
-                logger.warning(f"Invalid password for user: {username}")
+            if not verify_password(user, password):
+                logger.warning("Invalid password for user: %s", username)
                 return jsonify({"error": "Invalid username or password"}), 401
                 
-            logger.info(f"MongoDB authentication successful for user: {username}")
+            logger.info("MongoDB authentication successful for user: %s", username)
             
-            # Update user's last login timestamp
-            current_time = datetime.utcnow()
-            db.users.update_one(
-                {"_id": user["_id"]},
-                {
-                    "$set": {"last_login": current_time},
-                    "$inc": {"login_count": 1}
-                }
-            )
+            # Buffered; written in the next bookkeeping flush
+            login_bookkeeper.record_login(user["_id"], datetime.utcnow())
             
             # Create access token
-            access_token = create_access_token(identity=username)
+            access_token = create_user_token(user)
             
             return jsonify({
                 "message": "Login successful",
@@ -332,27 +399,88 @@ def json_login():
                 "username": username
             }), 200
                 
+        except ApiError:
+            raise
         except Exception as e:
-            logger.error(f"MongoDB authentication error: {str(e)}")
+            logger.error("MongoDB authentication error: %s", e)
             return jsonify({"error": "Authentication error", "details": str(e)}), 500
         
+    except ApiError:
+        # Let the global handler take care of this
+        raise
     except Exception as e:
-        logger.error(f"Unexpected error during JSON login: {str(e)}")
+        logger.error("Unexpected error during JSON login: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({"error": "Authentication error", "details": str(e)}), 500
 
+# Password helpers backed by the bounded hashing pool
+def hash_password(password):
+    try:
+        return password_hasher.hash_password(password)
+    except PasswordHasherBusy as e:
+        logger.warning("Password hashing rejected: %s", e)
+        raise ApiError("Server is busy, please try again shortly", 503)
+
+def verify_password(user, password):
+    """Check ``password`` against the user's hash, upgrading the hash's cost in the background if it is outdated"""
+    try:
+        valid = password_hasher.check_password(user["password"], password)
+    except PasswordHasherBusy as e:
+        logger.warning("Password check rejected: %s", e)
+        raise ApiError("Server is busy, please try again shortly", 503)
+    
+    if valid and password_hasher.needs_rehash(user["password"]):
+        old_hash = user["password"]
+        # Only replace the exact hash that was verified, in case the password changed meanwhile
+        password_hasher.rehash_in_background(password, lambda new_hash: db.users.update_one(
+            {"_id": user["_id"], "password": old_hash},
+            {"$set": {"password": new_hash}}
+        ))
+    return valid
+
 # Helper function to check if MongoDB is available
 def check_db_connection():
     if db is None:
         raise ApiError("Database connection not established", 503)
     
+    # Cached state from the background monitor; no round trip per request.
+    # None means no topology event has been seen yet, so let the query try.
+    if db_health.is_available() is False:
+        logger.error("Database connection error: %s", db_health.snapshot()['last_error'])
+        raise ApiError("Database connection error", 503)
+    return True
+
+# History pages are keyset-paginated on (timestamp, _id), see history_cursor.py
+HISTORY_DEFAULT_PAGE_SIZE = int(os.environ.get("HISTORY_DEFAULT_PAGE_SIZE", 50))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", 200))
+HISTORY_PROJECTION = {"mood": 1, "timestamp": 1}
+
+# Fold new mood entries into the per-user stats document. The entry is already
+# saved, so a failure here only logs; 'run.py rebuild-stats' repairs any drift.
+def update_mood_stats(user_id, entries):
     try:
-        # Quick ping to check connection
-        db.command("ping")
-        return True
+        record_entries(db, user_id, entries)
     except Exception as e:
-        logger.error(f"Database connection error: {str(e)}")
-        raise ApiError("Database connection error", 503)
+        logger.warning("Failed to update mood stats (repair with 'run.py rebuild-stats'): %s", e)
+
+# Called by mood_writer once entries are stored; a written batch can span several users
+def update_mood_stats_for_entries(entries):
+    by_user = {}
+    for entry in entries:
+        by_user.setdefault(entry["user_id"], []).append(entry)
+    for user_id, user_entries in by_user.items():
+        update_mood_stats(user_id, user_entries)
+
+# Persist new mood entries (see mood_writer); returns their ids, which are assigned up front
+def save_mood_entries(entries):
+    if mood_writer.collection is None:
+        # MongoDB was unreachable at startup, so the writer was never attached
+        raise ApiError("Database connection not established", 503)
+    try:
+        return mood_writer.write(entries)
+    except MoodWriterBusy as e:
+        logger.warning("Mood entry write rejected: %s", e)
+        raise ApiError("Server is busy, please try again shortly", 503)
 
 # Helper function to serialize MongoDB ObjectId
 def serialize_objectid(obj_id):
@@ -360,6 +488,48 @@ def serialize_objectid(obj_id):
         return str(obj_id)
     return obj_id
 
+# User fields cached per process: only ones that never change, so writes to a
+# user's counters don't have to invalidate the cache
+USER_CACHE_PROJECTION = {"username": 1}
+
+# Helper function to tell which unique users field ("username" or "email") an insert collided on
+def duplicate_user_field(error, user):
+    key_pattern = (error.details or {}).get("keyPattern")
+    if key_pattern:
+        return "email" if "email" in key_pattern else "username"
+    # No key pattern in the error; see which of the two is taken
+    return "username" if db.users.find_one({"username": user["username"]}, {"_id": 1}) else "email"
+
+# Helper function to create an access token carrying the user's stable fields
+def create_user_token(user):
+    return create_access_token(
+        identity=user["username"],
+        additional_claims={"uid": str(user["_id"])}
+    )
+
+# Helper function to resolve the user behind the current JWT
+def get_current_user():
+    """
+    Return ``{"_id", "username"}`` for the authenticated user, or None if the user does not exist.
+    The user is looked up through the per-process user cache, so a deleted
+    account stops working within USER_CACHE_TTL_SECONDS. Tokens carrying a
+    "uid" claim must also match the stored id, which rejects tokens issued to
+    an earlier account with the same username.
+    """
+    username = get_jwt_identity()
+    uid = get_jwt().get("uid")
+    
+    user = user_cache.get(username)
+    if user is None:
+        user = db.users.find_one({"username": username}, USER_CACHE_PROJECTION)
+        if user:
+            user_cache.set(username, user)
+    
+    if user and uid and str(user["_id"]) != uid:
+        logger.warning("Token uid does not match user %s", username)
+        return None
+    return user
+
 # Endpoint for user registration
 @app.route("/auth/register", methods=["POST"])
 def register():
@@ -370,7 +540,7 @@ def register():
         data = request.get_json()
         
         # Log attempt with username but no other sensitive data
-        logger.info(f"Registration attempt for username: {data.get('username', 'unknown')}")
+        logger.info("Registration attempt for username: %s", data.get('username', 'unknown'), extra={"event": "register.attempt"})
         
         # Validate required fields
         if not data or not all(k in data for k in ["username", "email", "password"]):
@@ -378,15 +548,15 @@ def register():
         
         # Check if username or email already exists
         if db.users.find_one({"username": data["username"]}):
-            logger.info(f"Registration failed: username {data['username']} already exists")
+            logger.info("Registration failed: username %s already exists", data['username'])
             raise ApiError("Username already exists", 409)
         
         if db.users.find_one({"email": data["email"]}):
-            logger.info(f"Registration failed: email {data['email']} already exists")
+            logger.info("Registration failed: email %s already exists", data['email'])
             raise ApiError("Email already exists", 409)
         
         # Hash password
-        hashed_password = bcrypt.generate_password_hash(data["password"]).decode('utf-8')
+        hashed_password = hash_password(data["password"])
         
         # Create new user
         new_user = {
@@ -401,11 +571,17 @@ def register():
             "last_reset_date": datetime.now().strftime("%Y-%m-%d")
         }
         
-        result = db.users.insert_one(new_user)
-        logger.info(f"User {data['username']} registered successfully")
+        # The unique indexes catch a concurrent registration that passed the checks above
+        try:
+            result = db.users.insert_one(new_user)
+        except pymongo.errors.DuplicateKeyError as e:
+            field = duplicate_user_field(e, new_user)
+            logger.info("Registration failed: %s for %s already exists", field, data['username'])
+            raise ApiError(f"{field.capitalize()} already exists", 409)
+        logger.info("User %s registered successfully", data['username'])
         
         # Generate access token
-        access_token = create_access_token(identity=new_user["username"])
+        access_token = create_user_token(new_user)
         
         return jsonify({
             "message": "User registered successfully",
@@ -416,15 +592,15 @@ def register():
     except ApiError as e:
         # ApiError is already logged and will be handled by the errorhandler
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
         # Unexpected errors
-        logger.error(f"Unexpected error in user registration: {str(e)}")
+        logger.error("Unexpected error in user registration: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
@@ -437,7 +613,7 @@ def login():
         
         data = request.get_json()
         
-        logger.info(f"Login attempt for username: {data.get('username', 'unknown')}")
+        logger.info("Login attempt for username: %s", data.get('username', 'unknown'), extra={"event": "login.attempt"})
         
         # Validate required fields
         if not data or not all(k in data for k in ["username", "password"]):
@@ -447,25 +623,18 @@ def login():
         user = db.users.find_one({"username": data["username"]})
         
         # Verify user and password
-        if not user or not bcrypt.check_password_hash(user["password"], data["password"]):
-            logger.warning(f"Failed login attempt for username: {data.get('username', 'unknown')}")
+        if not user or not verify_password(user, data["password"]):
+            logger.warning("Failed login attempt for username: %s", data.get('username', 'unknown'))
             # Use same error message to prevent username enumeration
             raise ApiError("Invalid username or password", 401)
         
-        # Update user's last login timestamp
-        current_time = datetime.utcnow()
-        db.users.update_one(
-            {"_id": user["_id"]},
-            {
-                "$set": {"last_login": current_time},
-                "$inc": {"login_count": 1}
-            }
-        )
+        # Buffered; written in the next bookkeeping flush
+        login_bookkeeper.record_login(user["_id"], datetime.utcnow())
         
-        logger.info(f"Successful login for user: {user['username']}")
+        logger.info("Successful login for user: %s", user['username'])
         
         # Generate access token
-        access_token = create_access_token(identity=user["username"])
+        access_token = create_user_token(user)
         
         return jsonify({
             "message": "Login successful",
@@ -476,14 +645,14 @@ def login():
     except ApiError:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Unexpected error during login: {str(e)}")
+        logger.error("Unexpected error during login: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
@@ -496,14 +665,13 @@ def analyze():
         check_db_connection()
         
         # Get current user from JWT token
-        username = get_jwt_identity()
-        user = db.users.find_one({"username": username})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
         data = request.get_json()
-        logger.debug(f"Received Data: {data}")  # Use logger instead of print
+        logger.debug("Received Data: %s", data)  # Use logger instead of print
 
         if not data or "story" not in data:
             return jsonify({"error": "No story provided"}), 400
@@ -515,7 +683,7 @@ def analyze():
         # Get mood and feedback using the analyze_mood function
         mood_feedback = analyze_mood(story)
 
-        logger.debug(f"Mood: {mood_feedback['mood']}, Feedback: {mood_feedback['feedback']}")  # Use logger instead of print
+        logger.debug("Mood: %s, Feedback: %s", mood_feedback['mood'], mood_feedback['feedback'])  # Use logger instead of print
 
         if mood_feedback["mood"] == "Unknown":
             return jsonify({"error": "Failed to analyze mood"}), 500
@@ -527,127 +695,377 @@ def analyze():
             "timestamp": datetime.utcnow()
         }
         
-        # Add to database
-        result = db.mood_entries.insert_one(new_entry)
+        # Add to database (or the write queue); the id is known either way
+        entry_id, = save_mood_entries([new_entry])
         
         # Include the entry ID in the response
-        mood_feedback["id"] = str(result.inserted_id)
+        mood_feedback["id"] = str(entry_id)
         
         return jsonify(mood_feedback)  # Return the mood and feedback to the client
 
     except ApiError as e:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in analyze endpoint: {str(e)}")  # Use logger instead of print
+        logger.error("Error in analyze endpoint: %s", e)  # Use logger instead of print
         logger.error(traceback.format_exc())
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
-@app.route("/user/history", methods=["GET"])
-@jwt_required()  # Require authentication
-def user_history():
+# Format one Server-Sent Events message
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/analyze/stream", methods=["POST"])
+@jwt_required()
+def analyze_stream():
     try:
         # Check MongoDB connection first
         check_db_connection()
         
         # Get current user from JWT token
-        username = get_jwt_identity()
-        user = db.users.find_one({"username": username})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        # Get query parameters
-        limit = request.args.get("limit", default=None, type=int)
-        sort = request.args.get("sort", default="desc", type=str)
+        data = request.get_json()
         
-        # Query mood entries
-        sort_direction = -1 if sort.lower() == "desc" else 1
-        query = {"user_id": user["_id"]}
+        if not data or "story" not in data:
+            return jsonify({"error": "No story provided"}), 400
+        
+        story = data["story"].strip()
+        if not story:
+            return jsonify({"error": "Story cannot be empty"}), 400
+    
+    except ApiError as e:
+        # Let the global handler take care of this
+        raise
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
+        return jsonify({"error": "Database connection error", "details": str(e)}), 503
+    except pymongo.errors.ConnectionFailure as e:
+        logger.error("MongoDB connection failure: %s", e)
+        return jsonify({"error": "Database connection error", "details": str(e)}), 503
+    except Exception as e:
+        logger.error("Error in analyze_stream endpoint: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
+    
+    def generate():
+        try:
+            for event, payload in stream_mood_analysis(story):
+                if event == "mood":
+                    yield sse_event("mood", {"mood": payload})
+                elif event == "feedback":
+                    yield sse_event("feedback", {"text": payload})
+                else:
+                    # Persist only the mood once the analysis has completed
+                    result = payload
+                    new_entry = {
+                        "user_id": user["_id"],
+                        "mood": result["mood"],
+                        "timestamp": datetime.utcnow()
+                    }
+                    entry_id, = save_mood_entries([new_entry])
+                    result["id"] = str(entry_id)
+                    yield sse_event("done", result)
+        except Exception as e:
+            logger.error("Error while streaming analysis: %s", e)
+            logger.error(traceback.format_exc())
+            yield sse_event("error", {"error": "Failed to complete analysis"})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable proxy buffering so chunks are flushed immediately
+        }
+    )
+
+# Maximum number of stories accepted by a single /analyze/batch request
+ANALYZE_BATCH_MAX_STORIES = int(os.environ.get("ANALYZE_BATCH_MAX_STORIES", 50))
+
+@app.route("/analyze/batch", methods=["POST"])
+@jwt_required()
+def analyze_batch():
+    try:
+        # Check MongoDB connection first
+        check_db_connection()
+        
+        # Get current user from JWT token
+        user = get_current_user()
+        
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+        
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get("stories"), list) or not data["stories"]:
+            return jsonify({"error": "No stories provided"}), 400
+        
+        if len(data["stories"]) > ANALYZE_BATCH_MAX_STORIES:
+            return jsonify({"error": f"At most {ANALYZE_BATCH_MAX_STORIES} stories can be analyzed per request"}), 400
+        
+        stories = []
+        for story in data["stories"]:
+            if not isinstance(story, str) or not story.strip():
+                return jsonify({"error": "Stories must be non-empty strings"}), 400
+            stories.append(story.strip())
+        
+        # Analyze all stories, packing them into as few Gemini requests as possible
+        results = analyze_mood_batch(stories)
+        
+        # Store only the moods, with a single round trip for the whole batch
+        timestamp = datetime.utcnow()
+        new_entries = [
+            {
+                "user_id": user["_id"],
+                "mood": result["mood"],
+                "timestamp": timestamp
+            }
+            for result in results
+        ]
+        inserted_ids = save_mood_entries(new_entries)
+        
+        for result, inserted_id in zip(results, inserted_ids):
+            result["id"] = str(inserted_id)
         
-        # Apply sorting and limit
-        cursor = db.mood_entries.find(query).sort("timestamp", sort_direction)
+        return jsonify({"results": results})
+    
+    except ApiError as e:
+        # Let the global handler take care of this
+        raise
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
+        return jsonify({"error": "Database connection error", "details": str(e)}), 503
+    except pymongo.errors.ConnectionFailure as e:
+        logger.error("MongoDB connection failure: %s", e)
+        return jsonify({"error": "Database connection error", "details": str(e)}), 503
+    except Exception as e:
+        logger.error("Error in analyze_batch endpoint: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
+
+@app.route("/user/history", methods=["GET"])
+@jwt_required()  # Require authentication
+def user_history():
+    try:
+        # Check MongoDB connection first
+        check_db_connection()
+        
+        # Get current user from JWT token
+        user = get_current_user()
         
-        # Apply limit if specified
-        if limit is not None and isinstance(limit, int) and limit > 0:
-            cursor = cursor.limit(limit)
+        if not user:
+            return jsonify({"error": "User not found"}), 404
         
-        # Get entries and transform to dict format
+        # Get query parameters; page size is capped server-side
+        limit = request.args.get("limit", default=HISTORY_DEFAULT_PAGE_SIZE, type=int)
+        limit = max(1, min(limit or HISTORY_DEFAULT_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE))
+        sort = request.args.get("sort", default="desc", type=str)
+        sort_direction = pymongo.DESCENDING if sort.lower() == "desc" else pymongo.ASCENDING
+        
+        after = None
+        if request.args.get("cursor"):
+            try:
+                after = decode_history_cursor(request.args["cursor"], sort_direction)
+            except InvalidCursor as e:
+                raise ApiError(str(e), 400)
+        
+        # Seek past the cursor position and fetch one extra entry to learn whether there is a next page
+        cursor = (db.mood_entries.find(history_page_query(user["_id"], sort_direction, after), HISTORY_PROJECTION)
+                  .sort([("timestamp", sort_direction), ("_id", sort_direction)])
+                  .limit(limit + 1))
+        entries = list(cursor)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        
+        # Transform to dict format
         history = []
-        for entry in cursor:
+        for entry in entries:
             history.append({
                 "id": str(entry["_id"]),
                 "mood": entry["mood"],
                 "timestamp": entry["timestamp"].isoformat() if isinstance(entry["timestamp"], datetime) else entry["timestamp"]
             })
         
-        return jsonify({"history": history})
+        return jsonify({
+            "history": history,
+            "next": encode_history_cursor(entries[-1], sort_direction) if has_more else None
+        })
         
     except ApiError as e:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in user_history endpoint: {str(e)}")  # Replace print with logger
+        logger.error("Error in user_history endpoint: %s", e)  # Replace print with logger
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
-@app.route("/user/statistics", methods=["GET"])
+# Export streams straight from the cursor: one driver batch and one output chunk in memory at a time
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def parse_export_date(value, name):
+    """Parse an ISO date/datetime query parameter into naive UTC, as timestamps are stored"""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ApiError(f"Invalid '{name}' date, expected ISO 8601", 400)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def is_date_only(value):
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+def generate_history_export(cursor, export_format):
+    """Yield the export in ~EXPORT_CHUNK_BYTES chunks while iterating the cursor.
+
+    The 200 status goes out with the first chunk, so if reading fails partway
+    (e.g. the request deadline expires) the export ends with a trailer saying
+    it is incomplete: an {"error": ...} record for NDJSON, a "#" line for CSV.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+    if writer:
+        writer.writerow(["id", "mood", "timestamp"])
+    written = 0
+    last_timestamp = None
+    try:
+        for entry in cursor:
+            timestamp = entry["timestamp"].isoformat() if isinstance(entry["timestamp"], datetime) else entry["timestamp"]
+            if writer:
+                writer.writerow([str(entry["_id"]), entry["mood"], timestamp])
+            else:
+                buffer.write(json.dumps({"id": str(entry["_id"]), "mood": entry["mood"], "timestamp": timestamp}))
+                buffer.write("\n")
+            written += 1
+            last_timestamp = timestamp
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    except Exception as e:
+        reason = "timed out" if getattr(e, "timeout", False) or isinstance(e, DeadlineExceeded) else "failed"
+        logger.error("History export %s after %s entries: %s", reason, written, e, extra={"event": "export.truncated"})
+        if writer:
+            buffer.write(f"# ERROR: export {reason} after {written} entries and is incomplete; "
+                         f"request again with from={last_timestamp} for the rest\n")
+        else:
+            buffer.write(json.dumps({"error": f"Export {reason} and is incomplete", "entries_written": written,
+                                     "resume_from": last_timestamp}))
+            buffer.write("\n")
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.route("/user/history/export", methods=["GET"])
 @jwt_required()
-def user_statistics():
+def export_history():
     try:
         # Check MongoDB connection first
         check_db_connection()
         
         # Get current user from JWT token
-        username = get_jwt_identity()
-        user = db.users.find_one({"username": username})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        # Get all mood entries for this user
-        entries = list(db.mood_entries.find({"user_id": user["_id"]}))
+        export_format = request.args.get("format", default="ndjson", type=str).lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({"error": f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}"}), 400
         
-        # Count occurrences of each mood
-        mood_counts = {}
-        for entry in entries:
-            mood = entry["mood"]
-            mood_counts[mood] = mood_counts.get(mood, 0) + 1
+        # Optional inclusive date range
+        query = {"user_id": user["_id"]}
+        date_range = {}
+        if request.args.get("from"):
+            date_range["$gte"] = parse_export_date(request.args["from"], "from")
+        if request.args.get("to"):
+            end = parse_export_date(request.args["to"], "to")
+            if is_date_only(request.args["to"]):
+                # A bare date means through the end of that day
+                date_range["$lt"] = end + timedelta(days=1)
+            else:
+                date_range["$lte"] = end
+        if date_range:
+            query["timestamp"] = date_range
+        
+        # Oldest first, walking the (user_id, timestamp, _id, mood) index
+        cursor = (db.mood_entries.find(query, HISTORY_PROJECTION)
+                  .sort([("timestamp", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+                  .batch_size(EXPORT_BATCH_SIZE))
+    
+    except ApiError as e:
+        # Let the global handler take care of this
+        raise
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
+        return jsonify({"error": "Database connection error", "details": str(e)}), 503
+    except pymongo.errors.ConnectionFailure as e:
+        logger.error("MongoDB connection failure: %s", e)
+        return jsonify({"error": "Database connection error", "details": str(e)}), 503
+    except Exception as e:
+        logger.error("Error in export_history endpoint: %s", e)
+        return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
+    
+    def generate():
+        try:
+            yield from generate_history_export(cursor, export_format)
+        finally:
+            cursor.close()
+    
+    filename = f"aura_q_history_{datetime.utcnow().strftime('%Y%m%d')}.{export_format}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f"attachment; filename={filename}", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/user/statistics", methods=["GET"])
+@jwt_required()
+def user_statistics():
+    try:
+        # Check MongoDB connection first
+        check_db_connection()
         
-        # Get recent entries
-        recent_entries = list(db.mood_entries.find({"user_id": user["_id"]})
-                            .sort("timestamp", -1)
-                            .limit(5))
-        recent_moods = [entry["mood"] for entry in recent_entries]
+        # Get current user from JWT token
+        user = get_current_user()
         
-        return jsonify({
-            "total_entries": len(entries),
-            "mood_counts": mood_counts,
-            "recent_moods": recent_moods
-        })
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+        
+        # One small incrementally maintained document per user
+        return jsonify(get_user_statistics(db, user["_id"]))
         
     except ApiError as e:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in user_statistics endpoint: {str(e)}")
+        logger.error("Error in user_statistics endpoint: %s", e)
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
 @app.route("/user/history/<entry_id>", methods=["DELETE"])
@@ -658,8 +1076,7 @@ def delete_history_entry(entry_id):
         check_db_connection()
         
         # Get current user from JWT token
-        username = get_jwt_identity()
-        user = db.users.find_one({"username": username})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
@@ -671,27 +1088,32 @@ def delete_history_entry(entry_id):
             return jsonify({"error": "Invalid entry ID"}), 400
             
         # Delete the entry if it belongs to the user
-        result = db.mood_entries.delete_one({
+        deleted = db.mood_entries.find_one_and_delete({
             "_id": object_id,
             "user_id": user["_id"]
-        })
+        }, projection={"mood": 1, "timestamp": 1})
         
-        if result.deleted_count == 0:
+        if deleted is None:
             return jsonify({"error": "Entry not found"}), 404
         
+        try:
+            record_deletion(db, user["_id"], deleted)
+        except Exception as e:
+            logger.warning("Failed to update mood stats after delete (repair with 'run.py rebuild-stats'): %s", e)
+        
         return jsonify({"message": "Entry deleted successfully"}), 200
         
     except ApiError as e:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in delete_history_entry endpoint: {str(e)}")
+        logger.error("Error in delete_history_entry endpoint: %s", e)
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
 @app.route("/user/history", methods=["DELETE"])
@@ -702,14 +1124,14 @@ def clear_history():
         check_db_connection()
         
         # Get current user from JWT token
-        username = get_jwt_identity()
-        user = db.users.find_one({"username": username})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
         # Delete all entries for this user
         result = db.mood_entries.delete_many({"user_id": user["_id"]})
+        reset_user_stats(db, user["_id"])
         
         return jsonify({
             "message": "History cleared successfully", 
@@ -719,14 +1141,14 @@ def clear_history():
     except ApiError as e:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in clear_history endpoint: {str(e)}")
+        logger.error("Error in clear_history endpoint: %s", e)
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
 # Add a health check endpoint for Vercel
@@ -737,7 +1159,7 @@ def debug_login():
         data = request.get_json()
         username = data.get('username', 'debug_user')
         
-        logger.info(f"Debug login for user: {username}")
+        logger.info("Debug login for user: %s", username)
         
         # Create access token
         access_token = create_access_token(identity=username)
@@ -748,9 +1170,20 @@ def debug_login():
             "username": username
         }), 200
     except Exception as e:
-        logger.error(f"Error in debug login: {str(e)}")
+        logger.error("Error in debug login: %s", e)
         return jsonify({"error": "Debug login failed", "details": str(e)}), 500
 
+def database_status():
+    """Describe the cached database state without touching the server"""
+    if db is None:
+        return "Not initialized"
+    available = db_health.is_available()
+    if available is None:
+        return "Unknown"
+    if available:
+        return "Connected"
+    return f"Error: {(db_health.snapshot()['last_error'] or 'no writable server')[:100]}"
+
 @app.route("/health", methods=["GET"])
 def health_check():
     """Health check endpoint for monitoring deployment status"""
@@ -759,26 +1192,28 @@ def health_check():
         "timestamp": datetime.utcnow().isoformat(),
         "environment": "Vercel" if "VERCEL" in os.environ else "Development",
         "services": {
-            "database": "Unknown"
+            "database": database_status()
         }
     }
-    
-    # Check database connectivity - but don't fail if it doesn't work
-    try:
-        # Use a lightweight query to check MongoDB connection
-        try:
-            if db is not None:
-                db.command("ping")
-                response["services"]["database"] = "Connected"
-            else:
-                response["services"]["database"] = "Not initialized"
-        except Exception as e:
-            response["services"]["database"] = f"Error: {str(e)[:100]}..."
-    except Exception as e:
-        response["services"]["database"] = f"Check failed: {str(e)[:100]}..."
-    
     return jsonify(response), 200
 
+@app.route("/health/live", methods=["GET"])
+def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return jsonify({"status": "ok", "timestamp": datetime.utcnow().isoformat()}), 200
+
+@app.route("/health/ready", methods=["GET"])
+def readiness_check():
+    """Readiness probe: 503 while the background monitor reports no usable database"""
+    ready = db is not None and db_health.is_available() is not False
+    response = {
+        "status": "ready" if ready else "unavailable",
+        "timestamp": datetime.utcnow().isoformat(),
+        "database": database_status(),
+        "monitor": db_health.snapshot()
+    }
+    return jsonify(response), 200 if ready else 503
+
 # Add routes for user rewards
 @app.route("/user/rewards", methods=["GET"])
 @jwt_required()
@@ -787,45 +1222,32 @@ def get_rewards():
         # Check MongoDB connection first
         check_db_connection()
         
-        username = get_jwt_identity()
-        user = db.users.find_one({"username": username})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        # Check if reset is needed
+        # Apply the daily reset (if due) and read the result in one atomic round trip
         today = datetime.now().strftime("%Y-%m-%d")
-        if user.get("last_reset_date") != today:
-            # Update the user document with reset values
-            db.users.update_one(
-                {"_id": user["_id"]},
-                {
-                    "$set": {
-                        "daily_count": 0,
-                        "last_reset_date": today,
-                        "rewards": 5  # Reset daily rewards to full allowance
-                    }
-                }
-            )
-            
-            # Get updated user data
-            user = db.users.find_one({"_id": user["_id"]})
+        state = get_rewards_state(db.users, user["_id"], today)
+        if state is None:
+            return jsonify({"error": "User not found"}), 404
             
         return jsonify({
-            "rewards": user.get("rewards", 0),
-            "daily_count": user.get("daily_count", 0)
+            "rewards": state.get("rewards", 0),
+            "daily_count": state.get("daily_count", 0)
         }), 200
     except ApiError as e:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in get_rewards endpoint: {str(e)}")
+        logger.error("Error in get_rewards endpoint: %s", e)
         return jsonify({"error": "Failed to get user rewards", "details": str(e)}), 500
 
 @app.route("/user/rewards", methods=["PUT"])
@@ -835,8 +1257,7 @@ def update_rewards():
         # Check MongoDB connection first
         check_db_connection()
         
-        username = get_jwt_identity()
-        user = db.users.find_one({"username": username})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
@@ -867,14 +1288,14 @@ def update_rewards():
     except ApiError as e:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in update_rewards endpoint: {str(e)}")
+        logger.error("Error in update_rewards endpoint: %s", e)
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
 @app.route("/user/daily-count", methods=["POST"])
@@ -884,52 +1305,32 @@ def increment_daily_count():
         # Check MongoDB connection first
         check_db_connection()
         
-        username = get_jwt_identity()
-        user = db.users.find_one({"username": username})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        # Check if reset is needed
+        # Daily reset (first entry of the day) and increment applied atomically
         today = datetime.now().strftime("%Y-%m-%d")
-        if user.get("last_reset_date") != today:
-            # First entry of the day
-            db.users.update_one(
-                {"_id": user["_id"]},
-                {
-                    "$set": {
-                        "daily_count": 1,
-                        "last_reset_date": today
-                    }
-                }
-            )
-            daily_count = 1
-        else:
-            # Increment daily count
-            result = db.users.update_one(
-                {"_id": user["_id"]},
-                {"$inc": {"daily_count": 1}}
-            )
-            
-            # Get the updated count
-            updated_user = db.users.find_one({"_id": user["_id"]})
-            daily_count = updated_user.get("daily_count", 0)
+        state = increment_daily_count_for_user(db.users, user["_id"], today)
+        if state is None:
+            return jsonify({"error": "User not found"}), 404
         
         return jsonify({
             "message": "Daily count incremented",
-            "daily_count": daily_count
+            "daily_count": state.get("daily_count", 0)
         }), 200
     except ApiError as e:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in increment_daily_count endpoint: {str(e)}")
+        logger.error("Error in increment_daily_count endpoint: %s", e)
         return jsonify({"error": "Failed to increment daily count", "details": str(e)}), 500
 
 # Weekly mood endpoints
@@ -940,8 +1341,7 @@ def add_weekly_mood():
         # Check MongoDB connection first
         check_db_connection()
         
-        username = get_jwt_identity()
-        user = db.users.find_one({"username": username})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
@@ -951,35 +1351,45 @@ def add_weekly_mood():
         if not data or "mood" not in data:
             return jsonify({"error": "No mood data provided"}), 400
         
-        # Create new weekly mood entry
-        new_weekly_mood = {
-            "user_id": user["_id"],
-            "mood": data["mood"],
-            # Use the day index sent from the frontend to ensure correct day of week
-            # This is more reliable than trying to convert UTC dates
-            "dayIndex": data.get("dayIndex", datetime.now().weekday()),
-            "date": datetime.now() if "date" not in data else datetime.fromisoformat(data["date"].replace('Z', '+00:00'))
-        }
-        
-        # Add to database
-        result = db.weekly_moods.insert_one(new_weekly_mood)
+        # The mood becomes a key of the bucket's counts map
+        mood = data["mood"]
+        if not isinstance(mood, str) or not mood or "." in mood or mood.startswith("$"):
+            return jsonify({"error": "Invalid mood"}), 400
+        
+        # Use the day index sent from the frontend to ensure correct day of week
+        # This is more reliable than trying to convert UTC dates
+        day_index = data.get("dayIndex", datetime.now().weekday())
+        date = datetime.now() if "date" not in data else datetime.fromisoformat(data["date"].replace('Z', '+00:00'))
+        if date.tzinfo is not None:
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
+        
+        # The client's local calendar day names the bucket when provided
+        day = data.get("day")
+        if day is not None:
+            try:
+                day = datetime.strptime(day, "%Y-%m-%d").date().isoformat()
+            except (TypeError, ValueError):
+                return jsonify({"error": "Invalid day, expected YYYY-MM-DD"}), 400
+        
+        # One upserted bucket per user per day instead of a new document per post
+        bucket_id = record_weekly_mood(db.weekly_moods, user["_id"], mood, day_index, date, day)
         
         return jsonify({
             "message": "Weekly mood data saved successfully",
-            "id": str(result.inserted_id)
+            "id": str(bucket_id)
         }), 200
             
     except ApiError as e:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in add_weekly_mood endpoint: {str(e)}")
+        logger.error("Error in add_weekly_mood endpoint: %s", e)
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
 @app.route("/user/weekly-mood", methods=["GET"])
@@ -989,43 +1399,38 @@ def get_weekly_mood():
         # Check MongoDB connection first
         check_db_connection()
         
-        username = get_jwt_identity()
-        user = db.users.find_one({"username": username})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        # Get entries from the last 30 days
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        weekly_entries = list(db.weekly_moods.find({
-            "user_id": user["_id"],
-            "date": {"$gte": thirty_days_ago}
-        }).sort("date", -1))
+        # Daily buckets from the last 30 days (at most 30 small documents)
+        weekly_entries = get_recent_weekly_moods(db.weekly_moods, user["_id"])
         
         # Convert to dict format with serialized ids and dates
         weekly_data = []
-        logger.info(f"Processing {len(weekly_entries)} weekly mood entries for user {username}")
+        logger.debug("Processing %s weekly mood entries for user %s", len(weekly_entries), user['username'],
+                     extra={"event": "weekly_mood.fetch"})
         for entry in weekly_entries:
             # Ensure we have a dayIndex, if it's missing calculate it from the date
             # But prioritize the dayIndex saved with the entry
             if "dayIndex" in entry:
                 day_index = entry["dayIndex"]
             else:
-                # Calculate day index from date, but be cautious about timezone issues
-                entry_date = entry["date"] if isinstance(entry["date"], datetime) else datetime.fromisoformat(str(entry["date"]).replace('Z', '+00:00'))
-                # Use weekday() + 1 % 7 to convert from Python's weekday() (0=Monday) to JS getDay() (0=Sunday)
-                day_of_week = entry_date.weekday() if entry_date else datetime.now().weekday()
-                day_index = (day_of_week + 1) % 7
+                # Calculate day index from date, converting Python's weekday() (0=Monday) to JS getDay() (0=Sunday)
+                day_index = js_day_index(parse_entry_date(entry["date"]))
             
             entry_data = {
                 "id": str(entry["_id"]),
                 "mood": entry["mood"],
                 "dayIndex": day_index,
-                "date": entry["date"].isoformat() if isinstance(entry["date"], datetime) else entry["date"]
+                "date": entry["date"].isoformat() if isinstance(entry["date"], datetime) else entry["date"],
+                "counts": entry.get("counts", {})
             }
             
-            # Log each entry's day info for debugging
-            logger.info(f"Mood entry: {entry_data['mood']} on day index {day_index}, date: {entry_data['date']}")
+            # Per-entry detail is debug-only and sampled (LOG_SAMPLE_RATES=weekly_mood.entry=...)
+            logger.debug("Mood entry: %s on day index %s, date: %s", entry_data['mood'], day_index, entry_data['date'],
+                         extra={"event": "weekly_mood.entry"})
             
             weekly_data.append(entry_data)
         
@@ -1034,17 +1439,17 @@ def get_weekly_mood():
     except ApiError as e:
         # Let the global handler take care of this
         raise
-    except pymongo.errors.ServerSelectionTimeoutError as e:
-        logger.error(f"MongoDB server selection timeout: {str(e)}")
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ExecutionTimeout) as e:
+        logger.error("MongoDB timeout: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except pymongo.errors.ConnectionFailure as e:
-        logger.error(f"MongoDB connection failure: {str(e)}")
+        logger.error("MongoDB connection failure: %s", e)
         return jsonify({"error": "Database connection error", "details": str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in get_weekly_mood endpoint: {str(e)}")
+        logger.error("Error in get_weekly_mood endpoint: %s", e)
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
-        logger.error(f"Error in get_weekly_mood endpoint: {str(e)}")
+        logger.error("Error in get_weekly_mood endpoint: %s", e)
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
 
 application = app  # Expose Flask app for Vercel and other WSGI servers
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Benchmark the lexicon fallback against the original substring keyword counter.
+Usage:
+  cd backend
+  python benchmarks/bench_lexicon.py [--repeat 2000]
+"""
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mood_lexicon import classify_mood, LEXICON_WORDS
+
+POSITIVE_WORDS = ['happy', 'good', 'great', 'excellent', 'joy', 'wonderful', 'love', 'like', 'amazing']
+NEGATIVE_WORDS = ['sad', 'bad', 'terrible', 'awful', 'hate', 'dislike', 'angry', 'upset', 'disappointed']
+
+def legacy_keyword_mood(story):
+    """The previous generate_simple_analysis scoring, kept here for comparison"""
+    story_lower = story.lower()
+    positive_count = sum(word in story_lower for word in POSITIVE_WORDS)
+    negative_count = sum(word in story_lower for word in NEGATIVE_WORDS)
+    if positive_count > negative_count:
+        return "joy"
+    elif negative_count > positive_count:
+        return "sadness"
+    return "neutral"
+
+ALL_LEXICON_WORDS = [word for words in LEXICON_WORDS.values() for word in words]
+
+def legacy_full_lexicon(story):
+    """The substring approach extended to the full seven-mood lexicon"""
+    story_lower = story.lower()
+    return sum(word in story_lower for word in ALL_LEXICON_WORDS)
+
+SAMPLES = {
+    "short": "I had a great day at the park with my friends.",
+    "medium": ("Work was stressful today and I felt anxious before the meeting, "
+               "but afterwards my manager said I did a good job and I was relieved. ") * 5,
+    "long": ("I woke up tired and a bit down, the weather was gloomy and I didn't feel like doing anything. "
+             "Later I met my sister for lunch and we laughed a lot, which made me feel much better. ") * 200
+}
+
+LABELLED = [
+    ("I am not happy at all with how things went", "sadness"),
+    ("It's unlikely that I'll make it, whatever", "neutral"),
+    ("I'm furious that they lied to me again", "anger"),
+    ("I feel anxious and scared about the results", "fear"),
+    ("The kitchen was filthy and disgusting", "disgust"),
+    ("Wow, I was completely shocked by the news", "surprise"),
+    ("I had a wonderful time and I love my friends", "joy"),
+    ("I went to the shop and bought some bread", "neutral"),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mood fallback scoring")
+    parser.add_argument("--repeat", type=int, default=2000, help="Iterations per sample")
+    args = parser.parse_args()
+
+    print(f"Lexicon size: {len(ALL_LEXICON_WORDS)} words\n")
+    print(f"{'sample':<8} {'chars':>7} {'legacy 18 words (us)':>21} {'substring full lexicon (us)':>28} {'lexicon engine (us)':>20}")
+    for name, text in SAMPLES.items():
+        legacy = timeit.timeit(lambda: legacy_keyword_mood(text), number=args.repeat) / args.repeat
+        full = timeit.timeit(lambda: legacy_full_lexicon(text), number=args.repeat) / args.repeat
+        lexicon = timeit.timeit(lambda: classify_mood(text), number=args.repeat) / args.repeat
+        print(f"{name:<8} {len(text):>7} {legacy * 1e6:>21.1f} {full * 1e6:>28.1f} {lexicon * 1e6:>20.1f}")
+
+    legacy_correct = sum(legacy_keyword_mood(text) == mood for text, mood in LABELLED)
+    lexicon_correct = sum(classify_mood(text)[0] == mood for text, mood in LABELLED)
+    print(f"\nLabelled samples correct: legacy {legacy_correct}/{len(LABELLED)}, lexicon {lexicon_correct}/{len(LABELLED)}")
+
+if __name__ == "__main__":
+    main()
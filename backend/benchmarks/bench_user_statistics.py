@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Benchmark the $facet statistics aggregation against the original two-query version.
+Seeds a throwaway database with --entries mood entries for one user (plus
+noise from other users), times both implementations and prints the explain
+of the aggregation's index scan. The database is dropped afterwards.
+Usage:
+  cd backend
+  python benchmarks/bench_user_statistics.py [--uri mongodb://localhost:27017] [--entries 10000] [--repeat 20]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymongo
+from bson.objectid import ObjectId
+
+from mood_stats import compute_user_statistics, statistics_pipeline
+
+MOODS = ["joy", "sadness", "anger", "fear", "surprise", "disgust", "neutral"]
+
+def legacy_user_statistics(collection, user_id):
+    """The previous user_statistics body, kept here for comparison"""
+    entries = list(collection.find({"user_id": user_id}))
+    mood_counts = {}
+    for entry in entries:
+        mood = entry["mood"]
+        mood_counts[mood] = mood_counts.get(mood, 0) + 1
+    recent_entries = list(collection.find({"user_id": user_id}).sort("timestamp", -1).limit(5))
+    return {
+        "total_entries": len(entries),
+        "mood_counts": mood_counts,
+        "recent_moods": [entry["mood"] for entry in recent_entries]
+    }
+
+def seed(collection, user_id, entries, other_users=20):
+    """Insert realistic-size entries (story + feedback) for one user and some neighbours"""
+    start = datetime.utcnow() - timedelta(days=entries // 3)
+    story = "Today I went for a walk and thought about a lot of things. " * 6
+    batch = []
+    owners = [user_id] * entries + [ObjectId() for _ in range(other_users) for _ in range(entries // other_users)]
+    for index, owner in enumerate(owners):
+        batch.append({
+            "user_id": owner,
+            "story": story,
+            "mood": random.choice(MOODS),
+            "feedback": "Taking time to reflect like this is a healthy habit. " * 3,
+            "timestamp": start + timedelta(minutes=index)
+        })
+        if len(batch) == 5000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+def time_calls(fn, repeat):
+    fn()  # warm the cache
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95) - 1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark user statistics implementations")
+    parser.add_argument("--uri", default=os.environ.get("MONGODB_URI", "mongodb://localhost:27017"), help="MongoDB server to use")
+    parser.add_argument("--entries", type=int, default=10000, help="Mood entries for the benchmarked user")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls per implementation")
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+    db = client[f"auraq_bench_{os.getpid()}"]
+    collection = db.mood_entries
+    user_id = ObjectId()
+    try:
+        print(f"Seeding {args.entries} entries for the benchmarked user...")
+        seed(collection, user_id, args.entries)
+        collection.create_index([("user_id", 1), ("timestamp", 1), ("_id", 1), ("mood", 1)], name="user_id_timestamp_id_mood")
+
+        legacy = legacy_user_statistics(collection, user_id)
+        facet = compute_user_statistics(collection, user_id)
+        assert legacy == facet, "implementations disagree"
+
+        legacy_median, legacy_p95 = time_calls(lambda: legacy_user_statistics(collection, user_id), args.repeat)
+        facet_median, facet_p95 = time_calls(lambda: compute_user_statistics(collection, user_id), args.repeat)
+        print(f"\n{'implementation':<24} {'median (ms)':>12} {'p95 (ms)':>10}")
+        print(f"{'legacy find + loop':<24} {legacy_median * 1e3:>12.1f} {legacy_p95 * 1e3:>10.1f}")
+        print(f"{'$facet aggregation':<24} {facet_median * 1e3:>12.1f} {facet_p95 * 1e3:>10.1f}")
+        print(f"Speedup: {legacy_median / facet_median:.1f}x")
+
+        explained = db.command("explain", {"aggregate": collection.name, "pipeline": statistics_pipeline(user_id), "cursor": {}},
+                               verbosity="executionStats")
+        cursor_stage = explained["stages"][0]["$cursor"] if "stages" in explained else explained
+        stats = cursor_stage.get("executionStats", {})
+        print(f"\nAggregation scan: keys examined {stats.get('totalKeysExamined')}, "
+              f"docs fetched {stats.get('totalDocsExamined')} (0 means the index covers the query)")
+    finally:
+        client.drop_database(db.name)
+
+if __name__ == "__main__":
+    main()
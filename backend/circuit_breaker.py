@@ -0,0 +1,162 @@
+"""
+Latency-aware circuit breaker for calls to external services.
+
+The breaker keeps a sliding window of recent call outcomes and latencies.
+It opens when the error rate or the p95 latency in the window crosses its
+thresholds, so callers can serve a fallback immediately instead of waiting
+on a failing dependency. After a cooldown it half-opens and lets a limited
+number of probe calls through; successful probes close it again. A caller
+that was let through but ends up making no call (a cache or local answer,
+no model available, the deadline ran out) hands the probe slot back with
+``release_probe()`` so the next request can probe straight away.
+"""
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger("aura_q")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """Tracks error rate and p95 latency over a sliding window of calls"""
+    def __init__(self, name, window_seconds=60, min_calls=5, error_rate_threshold=0.5,
+                 p95_latency_threshold=8.0, cooldown_seconds=30, probe_successes=2, max_samples=500):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.p95_latency_threshold = p95_latency_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.probe_successes = probe_successes
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe_started_at = None
+        self._probe_owner = None  # thread that took the probe slot
+        self._probe_success_count = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def allow_request(self):
+        """Return True if a call may be attempted, False to use the fallback now"""
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_half_open(now)
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN:
+                # One probe at a time; a probe that never reported back is retried after the cooldown
+                if self._probe_started_at is None or now - self._probe_started_at >= self.cooldown_seconds:
+                    self._probe_started_at = now
+                    self._probe_owner = threading.get_ident()
+                    return True
+            self.rejected += 1
+            return False
+
+    def release_probe(self):
+        """Give back a probe slot this thread took in allow_request() without reporting an outcome.
+
+        A no-op unless the breaker is half-open and the slot is still held by
+        the calling thread, so it is safe to call after every allowed request.
+        """
+        with self._lock:
+            if (self._state == STATE_HALF_OPEN and self._probe_started_at is not None
+                    and self._probe_owner == threading.get_ident()):
+                self._probe_started_at = None
+                self._probe_owner = None
+
+    def record_success(self, latency):
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, latency, True))
+            if self._state == STATE_HALF_OPEN:
+                self._probe_started_at = None
+                self._probe_owner = None
+                if latency > self.p95_latency_threshold:
+                    self._open(now, f"probe took {latency:.2f}s")
+                    return
+                self._probe_success_count += 1
+                if self._probe_success_count >= self.probe_successes:
+                    self._close()
+            elif self._state == STATE_CLOSED:
+                self._evaluate(now)
+
+    def record_failure(self, latency):
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, latency, False))
+            if self._state == STATE_HALF_OPEN:
+                self._probe_started_at = None
+                self._probe_owner = None
+                self._open(now, "probe failed")
+            elif self._state == STATE_CLOSED:
+                self._evaluate(now)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_half_open(now)
+            samples = self._window(now)
+            failures = sum(1 for _, _, ok in samples if not ok)
+            return {
+                "state": self._state,
+                "calls_in_window": len(samples),
+                "error_rate": round(failures / len(samples), 4) if samples else 0.0,
+                "p95_latency": round(_p95([latency for _, latency, _ in samples]), 4) if samples else None,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
+
+    def _window(self, now):
+        cutoff = now - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def _evaluate(self, now):
+        samples = self._window(now)
+        if len(samples) < self.min_calls:
+            return
+        failures = sum(1 for _, _, ok in samples if not ok)
+        error_rate = failures / len(samples)
+        if error_rate >= self.error_rate_threshold:
+            self._open(now, f"error rate {error_rate:.0%} over {len(samples)} calls")
+            return
+        p95 = _p95([latency for _, latency, _ in samples])
+        if p95 >= self.p95_latency_threshold:
+            self._open(now, f"p95 latency {p95:.2f}s over {len(samples)} calls")
+
+    def _maybe_half_open(self, now):
+        if self._state == STATE_OPEN and now - self._opened_at >= self.cooldown_seconds:
+            self._state = STATE_HALF_OPEN
+            self._probe_started_at = None
+            self._probe_owner = None
+            self._probe_success_count = 0
+            logger.info("Circuit breaker %s half-open, probing", self.name)
+
+    def _open(self, now, reason):
+        self._state = STATE_OPEN
+        self._opened_at = now
+        self.times_opened += 1
+        logger.warning("Circuit breaker %s opened: %s", self.name, reason)
+
+    def _close(self):
+        self._state = STATE_CLOSED
+        # Start the window afresh so old failures don't immediately re-open it
+        self._samples.clear()
+        logger.info("Circuit breaker %s closed", self.name)
+
+def _p95(values):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
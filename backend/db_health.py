@@ -0,0 +1,119 @@
+"""
+Cached MongoDB connection state maintained from pymongo's monitoring events.
+
+pymongo already runs background heartbeats against every server. Registering
+the listener from ``DatabaseHealthMonitor.listener()`` on the client lets
+request handlers read the resulting topology state in O(1) instead of issuing
+their own ``ping`` round trip on every request.
+
+Each client gets its own listener, and only the most recently created one
+updates the state: pymongo delivers every client's events from its own queue,
+so a client abandoned by a connection retry could otherwise report (e.g. its
+"closed" event) after the live client and leave the state wrong.
+"""
+import time
+import logging
+import threading
+from pymongo import monitoring
+
+logger = logging.getLogger("aura_q")
+
+class DatabaseHealthMonitor:
+    """Tracks whether the live MongoDB client's topology currently has a writable server"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._available = None  # None until the first topology event arrives
+        self._changed_at = None
+        self._last_heartbeat_at = None
+        self._last_heartbeat_ms = None
+        self._last_error = None
+
+    def listener(self):
+        """Return the event listener for a new client; earlier clients' events are ignored from now on"""
+        with self._lock:
+            self._generation += 1
+            self._available = None
+            self._changed_at = None
+            self._last_heartbeat_at = None
+            self._last_heartbeat_ms = None
+            self._last_error = None
+            return _ClientListener(self, self._generation)
+
+    def is_available(self):
+        """True if a writable server is known, None if no state has been observed yet"""
+        return self._available
+
+    def snapshot(self):
+        with self._lock:
+            now = time.time()
+            return {
+                "available": self._available,
+                "state_age_seconds": round(now - self._changed_at, 1) if self._changed_at else None,
+                "last_heartbeat_age_seconds": round(now - self._last_heartbeat_at, 1) if self._last_heartbeat_at else None,
+                "last_heartbeat_ms": self._last_heartbeat_ms,
+                "last_error": self._last_error
+            }
+
+    def _description_changed(self, generation, event):
+        available = event.new_description.has_writable_server()
+        with self._lock:
+            if generation != self._generation:
+                return
+            if available != self._available:
+                self._changed_at = time.time()
+                if available:
+                    logger.info("MongoDB topology has a writable server")
+                elif self._available is not None:
+                    logger.warning("MongoDB topology lost its writable server")
+            self._available = available
+
+    def _closed(self, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._available = False
+            self._changed_at = time.time()
+
+    def _heartbeat_succeeded(self, generation, event):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._last_heartbeat_at = time.time()
+            self._last_heartbeat_ms = round(event.duration * 1000, 1)
+            self._last_error = None
+
+    def _heartbeat_failed(self, generation, event):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._last_heartbeat_at = time.time()
+            self._last_error = str(event.reply)[:200]
+
+class _ClientListener(monitoring.TopologyListener, monitoring.ServerHeartbeatListener):
+    """Forwards one client's events to the monitor, tagged with that client's generation"""
+    def __init__(self, monitor, generation):
+        self._monitor = monitor
+        self._generation = generation
+
+    # TopologyListener
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        self._monitor._description_changed(self._generation, event)
+
+    def closed(self, event):
+        self._monitor._closed(self._generation)
+
+    # ServerHeartbeatListener
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._monitor._heartbeat_succeeded(self._generation, event)
+
+    def failed(self, event):
+        self._monitor._heartbeat_failed(self._generation, event)
+
+db_health = DatabaseHealthMonitor()
@@ -0,0 +1,201 @@
+"""
+Idempotent MongoDB index manager.
+
+``INDEX_SPECS`` lists every index the API's queries rely on, together with a
+representative query for each. ``ensure_indexes()`` creates whatever is
+missing (existing indexes with the same key pattern and options are left
+alone; ones whose unique/partial options differ are reported as mismatches
+rather than silently accepted or dropped), reports build progress while an
+index is being built, and can explain each query before and after so the
+plan change (COLLSCAN -> IXSCAN) is visible.
+
+Run it with ``python run.py indexes`` or set ENSURE_INDEXES_ON_STARTUP=true.
+"""
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+import pymongo
+from pymongo.errors import OperationFailure
+from weekly_moods import BUCKET_INDEX_KEYS, BUCKET_INDEX_NAME, BUCKET_INDEX_FILTER
+
+logger = logging.getLogger("aura_q")
+
+# How often to poll $currentOp while an index build is running
+PROGRESS_POLL_SECONDS = 1.0
+
+class IndexSpec:
+    """One index plus the query shape it exists to serve"""
+    def __init__(self, collection, keys, name, unique=False, partial_filter=None, sample_filter=None, sample_sort=None):
+        self.collection = collection
+        self.keys = keys
+        self.name = name
+        self.unique = unique
+        self.partial_filter = partial_filter
+        # sample_filter(db) returns a filter for a representative query, or None to skip explain
+        self.sample_filter = sample_filter
+        self.sample_sort = sample_sort
+
+def _sample_user_filter(collection, extra=None):
+    """Build a per-user filter using a user_id that actually exists in ``collection``"""
+    def build(db):
+        doc = db[collection].find_one({"user_id": {"$exists": True}}, {"user_id": 1})
+        if not doc:
+            return None
+        query = {"user_id": doc["user_id"]}
+        query.update(extra() if extra else {})
+        return query
+    return build
+
+def _sample_field_filter(collection, field):
+    def build(db):
+        doc = db[collection].find_one({field: {"$exists": True}}, {field: 1})
+        return {field: doc[field]} if doc else None
+    return build
+
+def _last_thirty_days():
+    return {"day": {"$gte": (datetime.utcnow().date() - timedelta(days=29)).isoformat()}}
+
+INDEX_SPECS = [
+    IndexSpec("users", [("username", pymongo.ASCENDING)], "username_unique", unique=True,
+              sample_filter=_sample_field_filter("users", "username")),
+    IndexSpec("users", [("email", pymongo.ASCENDING)], "email_unique", unique=True,
+              sample_filter=_sample_field_filter("users", "email")),
+    # History: entries of one user, newest first, paged on (timestamp, _id).
+    # Trailing mood makes both the history page and the statistics
+    # aggregation (mood_stats.py) covered index scans.
+    IndexSpec("mood_entries", [("user_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING), ("_id", pymongo.ASCENDING),
+                               ("mood", pymongo.ASCENDING)],
+              "user_id_timestamp_id_mood",
+              sample_filter=_sample_user_filter("mood_entries"), sample_sort=[("timestamp", pymongo.DESCENDING)]),
+    # Weekly mood chart: one bucket per user per day. weekly_moods.py also creates
+    # this on first use, since duplicate-free buckets depend on it.
+    IndexSpec("weekly_moods", BUCKET_INDEX_KEYS, BUCKET_INDEX_NAME, unique=True,
+              partial_filter=BUCKET_INDEX_FILTER,
+              sample_filter=_sample_user_filter("weekly_moods", _last_thirty_days),
+              sample_sort=[("day", pymongo.DESCENDING)])
+]
+
+def summarize_plan(db, spec):
+    """Explain the spec's representative query; returns a short dict or None"""
+    if spec.sample_filter is None:
+        return None
+    query = spec.sample_filter(db)
+    if query is None:
+        return None
+    cursor = db[spec.collection].find(query)
+    if spec.sample_sort:
+        cursor = cursor.sort(spec.sample_sort)
+    explained = cursor.limit(50).explain()
+
+    stages = []
+    stage = explained.get("queryPlanner", {}).get("winningPlan", {})
+    while stage:
+        # Newer servers nest the classic plan under queryPlan
+        stage = stage.get("queryPlan", stage)
+        stages.append(stage.get("stage", "?") + (f"({stage['indexName']})" if "indexName" in stage else ""))
+        stage = stage.get("inputStage")
+    stats = explained.get("executionStats", {})
+    return {
+        "plan": " <- ".join(stages),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "returned": stats.get("nReturned")
+    }
+
+def _watch_build(db, collection, done, report):
+    """Report progress of an in-flight createIndexes until ``done`` is set"""
+    while not done.wait(PROGRESS_POLL_SECONDS):
+        try:
+            ops = db.client.admin.aggregate([
+                {"$currentOp": {"allUsers": True}},
+                {"$match": {"ns": f"{db.name}.{collection}", "command.createIndexes": {"$exists": True}}}
+            ])
+            for op in ops:
+                progress = op.get("progress")
+                if progress and progress.get("total"):
+                    report(f"  ... {op.get('msg', 'building')}: {progress['done']}/{progress['total']} "
+                           f"({100.0 * progress['done'] / progress['total']:.0f}%)")
+                else:
+                    report(f"  ... {op.get('msg', 'building')} ({op.get('secs_running', 0)}s)")
+        except Exception:
+            # $currentOp needs extra privileges on some hosted clusters; progress is best effort
+            return
+
+def _option_differences(spec, info):
+    """Describe how an existing index's unique/partial options differ from ``spec``"""
+    differences = []
+    if bool(info.get("unique", False)) != spec.unique:
+        differences.append(f"unique is {bool(info.get('unique', False))}, expected {spec.unique}")
+    existing_filter = info.get("partialFilterExpression")
+    existing_filter = dict(existing_filter) if existing_filter is not None else None
+    if existing_filter != spec.partial_filter:
+        differences.append(f"partial filter is {existing_filter}, expected {spec.partial_filter}")
+    return differences
+
+def ensure_index(db, spec, report=logger.info):
+    """Create ``spec`` unless an index with the same key pattern already exists.
+
+    Returns "exists", "created", "failed", or "mismatch" when an index with the
+    same keys exists but with different unique/partial options. A mismatched
+    index is never dropped automatically, since that would briefly leave e.g.
+    usernames unprotected; drop it by hand and re-run.
+    """
+    collection = db[spec.collection]
+    wanted = [(field, int(direction)) for field, direction in spec.keys]
+    for name, info in collection.index_information().items():
+        existing = [(field, direction if isinstance(direction, str) else int(direction)) for field, direction in info["key"]]
+        if existing == wanted:
+            differences = _option_differences(spec, info)
+            if differences:
+                report(f"{spec.collection}.{name}: MISMATCH - {'; '.join(differences)}. "
+                       f"Drop it (db.{spec.collection}.dropIndex('{name}')) and re-run to create {spec.name}")
+                return "mismatch"
+            report(f"{spec.collection}.{name}: already present")
+            return "exists"
+
+    report(f"{spec.collection}.{spec.name}: building {dict(spec.keys)}{' (unique)' if spec.unique else ''}")
+    done = threading.Event()
+    watcher = threading.Thread(target=_watch_build, args=(db, spec.collection, done, report), daemon=True)
+    watcher.start()
+    started = time.monotonic()
+    try:
+        options = {"partialFilterExpression": spec.partial_filter} if spec.partial_filter else {}
+        collection.create_index(spec.keys, name=spec.name, unique=spec.unique, **options)
+        report(f"{spec.collection}.{spec.name}: built in {time.monotonic() - started:.2f}s")
+        return "created"
+    except OperationFailure as e:
+        # Typically duplicate usernames/emails blocking a unique index
+        report(f"{spec.collection}.{spec.name}: FAILED - {str(e)[:200]}")
+        return "failed"
+    finally:
+        done.set()
+
+def _try_summarize_plan(db, spec, report):
+    try:
+        return summarize_plan(db, spec)
+    except Exception as e:
+        report(f"  (explain unavailable for {spec.collection}: {str(e)[:100]})")
+        return None
+
+def ensure_indexes(db, explain=True, report=logger.info):
+    """Create all missing indexes in INDEX_SPECS; returns {"collection.name": status}.
+
+    Mismatched indexes are also logged as warnings whatever ``report`` is.
+    """
+    results = {}
+    for spec in INDEX_SPECS:
+        before = _try_summarize_plan(db, spec, report) if explain else None
+        status = ensure_index(db, spec, report)
+        results[f"{spec.collection}.{spec.name}"] = status
+        if status == "mismatch":
+            logger.warning("An index with the keys of %s.%s exists with different options; constraint may not be enforced",
+                           spec.collection, spec.name)
+        if explain and status == "created" and before is not None:
+            after = _try_summarize_plan(db, spec, report)
+            report(f"  plan before: {before['plan']} (docs examined: {before['docs_examined']})")
+            if after is not None:
+                report(f"  plan after:  {after['plan']} (docs examined: {after['docs_examined']})")
+        elif explain and before is not None:
+            report(f"  plan: {before['plan']} (docs examined: {before['docs_examined']})")
+    return results
@@ -0,0 +1,44 @@
+"""
+Per-request time budgets.
+
+A deadline is stored in a context variable so any code running on behalf of
+the request (Gemini calls in ai_analysis, MongoDB queries in app.py) can ask
+how much time is left. MongoDB operations inside ``request_deadline()`` are
+bounded through pymongo's client-side operation timeout, which sends the
+remaining budget as ``maxTimeMS`` with every command.
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+
+import pymongo
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has no time left for further work"""
+    pass
+
+_deadline = contextvars.ContextVar("aura_q_deadline", default=None)
+
+@contextmanager
+def request_deadline(seconds):
+    """Run the enclosed block with a time budget of ``seconds``"""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        with pymongo.timeout(seconds):
+            yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_seconds():
+    """Return the time left in the current budget, or None when there is no deadline"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+def check_deadline(min_seconds=0.0):
+    """Raise DeadlineExceeded unless at least ``min_seconds`` of budget remain"""
+    remaining = remaining_seconds()
+    if remaining is not None and remaining <= min_seconds:
+        raise DeadlineExceeded(f"Request deadline exceeded ({remaining:.2f}s left)")
+    return remaining
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Script to evaluate the local mood classifier on held-out data and choose its serving threshold.
+Usage:
+  cd backend
+  python evaluate_mood_classifier.py [--data mood_eval_data.jsonl] [--model mood_classifier.json]
+                                     [--target-precision 0.95] [--min-served 10] [--write]
+The held-out file uses the training format but must not share samples with
+mood_training_data.jsonl. For each candidate threshold the script reports how
+many held-out stories the local tier would serve (coverage, using the same
+``serving_prediction`` rule as the app) and how many of those it gets right
+(precision), then picks the lowest threshold that reaches
+--target-precision on at least --min-served stories. --write stores it in the
+model file; with no qualifying threshold the stored value is null and the
+local tier never serves.
+"""
+import os
+import json
+import math
+import argparse
+
+from mood_classifier import MoodClassifier, DEFAULT_MODEL_PATH
+from train_mood_classifier import load_samples
+
+DEFAULT_EVAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mood_eval_data.jsonl")
+CANDIDATE_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.98, 0.99, 0.995, 0.999]
+
+def sweep(classifier, samples, thresholds=CANDIDATE_THRESHOLDS):
+    """Return ``[(threshold, served, correct), ...]`` on the held-out ``samples``"""
+    rows = []
+    for threshold in thresholds:
+        served = []
+        for text, mood in samples:
+            prediction = classifier.serving_prediction(text, threshold)
+            if prediction is not None:
+                served.append((prediction[0], mood))
+        rows.append((threshold, len(served), sum(1 for predicted, mood in served if predicted == mood)))
+    return rows
+
+def precision_lower_bound(correct, served, z=1.96):
+    """95% Wilson lower bound of correct/served; small held-out sets give wide bounds"""
+    if not served:
+        return 0.0
+    p = correct / served
+    centre = p + z * z / (2 * served)
+    margin = z * math.sqrt(p * (1 - p) / served + z * z / (4 * served * served))
+    return (centre - margin) / (1 + z * z / served)
+
+def choose_threshold(rows, target_precision, min_served):
+    for threshold, served, correct in rows:
+        if served >= min_served and correct / served >= target_precision:
+            return threshold, served, correct
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the AuraQ local mood classifier on held-out data")
+    parser.add_argument("--data", default=DEFAULT_EVAL_PATH, help="Held-out JSONL file with text/mood pairs")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Model file to evaluate")
+    parser.add_argument("--target-precision", type=float, default=0.95, help="Required precision of served predictions")
+    parser.add_argument("--min-served", type=int, default=10, help="Fewest held-out stories a threshold must serve")
+    parser.add_argument("--write", action="store_true", help="Store the chosen threshold in the model file")
+    args = parser.parse_args()
+
+    with open(args.model, "r", encoding="utf-8") as f:
+        model = json.load(f)
+    classifier = MoodClassifier(model)
+    samples = load_samples(args.data)
+
+    print(f"Held-out samples: {len(samples)}")
+    print(f"{'threshold':>10} {'served':>7} {'coverage':>9} {'precision':>10} {'95% lower':>10}")
+    rows = sweep(classifier, samples)
+    for threshold, served, correct in rows:
+        precision = f"{correct / served:.1%}" if served else "-"
+        print(f"{threshold:>10} {served:>7} {served / len(samples):>9.1%} {precision:>10} "
+              f"{precision_lower_bound(correct, served):>10.1%}")
+
+    chosen = choose_threshold(rows, args.target_precision, args.min_served)
+    if chosen is None:
+        print(f"No threshold reaches {args.target_precision:.0%} precision on at least {args.min_served} "
+              "held-out stories; the local tier should stay disabled")
+        threshold = None
+    else:
+        threshold, served, correct = chosen
+        print(f"Chosen threshold: {threshold} (held-out precision {correct / served:.1%}, "
+              f"95% lower bound {precision_lower_bound(correct, served):.1%}, coverage {served / len(samples):.1%})")
+
+    if args.write:
+        model["threshold"] = threshold
+        model["threshold_eval"] = {
+            "data": os.path.basename(args.data),
+            "samples": len(samples),
+            "target_precision": args.target_precision,
+            "served": chosen[1] if chosen else 0,
+            "correct": chosen[2] if chosen else 0
+        }
+        with open(args.model, "w", encoding="utf-8") as f:
+            json.dump(model, f, separators=(",", ":"), sort_keys=True)
+        print(f"Threshold written to {args.model}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Keyset pagination for the mood history.
+
+History pages are sorted on (timestamp, _id) and each page resumes just past
+the last entry of the previous one, so there is no skip and deep pages cost
+the same as the first. The position travels to the client as an opaque
+cursor (urlsafe base64 of a small JSON object) that also records the sort
+direction it was issued for.
+"""
+import json
+import base64
+from datetime import datetime
+import pymongo
+from bson.objectid import ObjectId
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that can't be decoded or belongs to the other sort order"""
+
+def encode_history_cursor(entry, direction):
+    """Opaque cursor pointing just past ``entry`` in the given sort direction"""
+    raw = json.dumps({"t": entry["timestamp"].isoformat(), "i": str(entry["_id"]), "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_history_cursor(cursor, direction):
+    """Return the (timestamp, _id) position encoded in ``cursor``; raises InvalidCursor if it is invalid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        timestamp, entry_id = datetime.fromisoformat(position["t"]), ObjectId(position["i"])
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+    if position.get("d") != direction:
+        raise InvalidCursor("Cursor does not match the requested sort order")
+    return timestamp, entry_id
+
+def history_page_query(user_id, direction, after=None):
+    """Filter for the entries that follow ``after`` ((timestamp, _id)) in ``direction``"""
+    query = {"user_id": user_id}
+    if after is not None:
+        timestamp, entry_id = after
+        op = "$lt" if direction == pymongo.DESCENDING else "$gt"
+        query["$or"] = [
+            {"timestamp": {op: timestamp}},
+            {"timestamp": timestamp, "_id": {op: entry_id}}
+        ]
+    return query
@@ -0,0 +1,162 @@
+"""
+Write-behind buffer for login bookkeeping (``last_login`` / ``login_count``).
+
+These counters are informational, so a login no longer waits on a write for
+them. Logins are folded into an in-process map (one entry per user, however
+many times they logged in) and a background thread flushes the map every
+LOGIN_FLUSH_INTERVAL_SECONDS with a single unordered ``bulk_write``. The map
+is also flushed at interpreter exit and from run.py's SIGINT/SIGTERM handlers.
+
+Loss window: a hard kill (SIGKILL, OOM, power loss) drops at most the logins
+recorded since the last flush, i.e. up to LOGIN_FLUSH_INTERVAL_SECONDS worth
+of counters. When a flush can't reach MongoDB at all (connection loss,
+timeout) the whole batch is merged back and retried on the next tick; when
+the bulk write partly succeeds only the users whose updates failed are
+merged back, so nobody's count is applied twice. Any other error leaves it
+unknown what was applied, so that batch is dropped and logged instead.
+Set the interval to 0 to write through synchronously (the default on Vercel,
+where background threads are frozen between requests).
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout
+
+logger = logging.getLogger("aura_q")
+
+LOGIN_FLUSH_INTERVAL_SECONDS = float(os.environ.get("LOGIN_FLUSH_INTERVAL_SECONDS", 0 if "VERCEL" in os.environ else 5))
+# Flush early once this many users are waiting, bounding memory during bursts
+LOGIN_FLUSH_MAX_PENDING = int(os.environ.get("LOGIN_FLUSH_MAX_PENDING", 1000))
+
+class LoginBookkeeper:
+    """Coalesces per-user login counters and flushes them in bulk"""
+    def __init__(self, flush_interval=LOGIN_FLUSH_INTERVAL_SECONDS, max_pending=LOGIN_FLUSH_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.collection = None
+        self._pending = {}  # user _id -> {"count": n, "last_login": datetime}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.recorded = 0
+        self.flushes = 0
+        self.flushed_users = 0
+        self.failed_flushes = 0
+        self.dropped_users = 0
+        self.last_flush_at = None
+
+    def attach(self, collection):
+        """Set the users collection; recording is a no-op until attached"""
+        self.collection = collection
+        atexit.register(self.flush)
+
+    def record_login(self, user_id, when):
+        if self.collection is None:
+            return
+        if self.flush_interval <= 0:
+            # Write-through mode
+            self.collection.update_one({"_id": user_id}, {"$max": {"last_login": when}, "$inc": {"login_count": 1}})
+            return
+
+        with self._lock:
+            entry = self._pending.get(user_id)
+            if entry is None:
+                self._pending[user_id] = {"count": 1, "last_login": when}
+            else:
+                entry["count"] += 1
+                entry["last_login"] = max(entry["last_login"], when)
+            self.recorded += 1
+            pending = len(self._pending)
+        self._ensure_thread()
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def flush(self):
+        """Write all pending counters with one unordered bulk_write; returns the number of users written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch or self.collection is None:
+                return 0
+            user_ids = list(batch)
+            operations = [
+                UpdateOne({"_id": user_id}, {"$max": {"last_login": batch[user_id]["last_login"]},
+                                             "$inc": {"login_count": batch[user_id]["count"]}})
+                for user_id in user_ids
+            ]
+            try:
+                self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: every update not listed in writeErrors was applied, so only
+                # the failed ones go back (re-applying the rest would double their $inc)
+                failed = {user_ids[error["index"]] for error in e.details.get("writeErrors", [])}
+                self._merge_back({user_id: batch[user_id] for user_id in failed})
+                self.failed_flushes += 1
+                logger.warning("Login bookkeeping flush failed for %s of %s users, will retry them: %s",
+                               len(failed), len(batch), e)
+                written = len(batch) - len(failed)
+            except (ConnectionFailure, ExecutionTimeout) as e:
+                # Nothing was acknowledged; put the whole batch back for the next flush
+                self._merge_back(batch)
+                self.failed_flushes += 1
+                logger.warning("Login bookkeeping flush failed for %s users, will retry: %s", len(batch), e)
+                return 0
+            except Exception as e:
+                # Unknown whether anything was applied; retrying could count logins twice
+                self.dropped_users += len(batch)
+                self.failed_flushes += 1
+                logger.error("Login bookkeeping flush failed for %s users, dropping their counters: %s", len(batch), e)
+                return 0
+            else:
+                written = len(batch)
+            self.flushes += 1
+            self.flushed_users += written
+            self.last_flush_at = time.time()
+            return written
+
+    def _merge_back(self, batch):
+        with self._lock:
+            for user_id, entry in batch.items():
+                current = self._pending.get(user_id)
+                if current is None:
+                    self._pending[user_id] = entry
+                else:
+                    current["count"] += entry["count"]
+                    current["last_login"] = max(current["last_login"], entry["last_login"])
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="login-bookkeeper", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Login bookkeeping flusher error: %s", e)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "flush_interval_seconds": self.flush_interval,
+            "pending_users": pending,
+            "recorded": self.recorded,
+            "flushes": self.flushes,
+            "flushed_users": self.flushed_users,
+            "failed_flushes": self.failed_flushes,
+            "dropped_users": self.dropped_users,
+            "last_flush_age_seconds": round(time.time() - self.last_flush_at, 1) if self.last_flush_at else None
+        }
+
+login_bookkeeper = LoginBookkeeper()
@@ -0,0 +1,166 @@
+"""
+Local, dependency-free mood classifier.
+
+A multinomial Naive Bayes model over hashed unigram and bigram features,
+scoring all seven moods. Unigrams within a few words after a negation
+("not", "never", "don't", ...) are marked as negated, so "not happy" doesn't
+count as evidence for joy. The trained parameters ship as a small JSON file
+(mood_classifier.json, produced by train_mood_classifier.py), so inference
+is a handful of dictionary lookups and runs in-process in microseconds.
+"""
+import os
+import re
+import json
+import math
+import zlib
+import logging
+from collections import Counter
+from mood_lexicon import NEGATIONS, NEGATION_SCOPE, classify_mood
+
+logger = logging.getLogger("aura_q")
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mood_classifier.json")
+DEFAULT_BUCKETS = 2 ** 18
+# Bumped whenever hashed_features changes; models trained on other features are refused
+FEATURE_VERSION = 2
+
+_TOKEN_RE = re.compile(r"[a-z']+")
+
+def tokenize(text):
+    return [token.strip("'") for token in _TOKEN_RE.findall(text.lower()) if token.strip("'")]
+
+def is_negation(token):
+    return token.replace("'", "") in NEGATIONS or token.endswith("n't")
+
+def hashed_features(text, buckets=DEFAULT_BUCKETS):
+    """Count hashed unigram (negation-marked) and bigram features of ``text``"""
+    tokens = tokenize(text)
+    grams = []
+    negated_until = -1
+    for index, token in enumerate(tokens):
+        if is_negation(token):
+            negated_until = index + NEGATION_SCOPE
+            grams.append(f"u:{token}")
+        elif index <= negated_until:
+            grams.append(f"u:not_{token}")
+        else:
+            grams.append(f"u:{token}")
+    grams += [f"b:{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    return Counter(zlib.crc32(gram.encode("utf-8")) % buckets for gram in grams)
+
+def train(samples, buckets=DEFAULT_BUCKETS, alpha=0.5):
+    """Fit a multinomial Naive Bayes model from ``(text, mood)`` pairs.
+
+    Returns a JSON-serializable dict; only buckets seen in training are stored.
+    """
+    class_docs = Counter()
+    class_features = {}
+    vocabulary = set()
+    for text, mood in samples:
+        class_docs[mood] += 1
+        counts = class_features.setdefault(mood, Counter())
+        counts.update(hashed_features(text, buckets))
+        vocabulary.update(counts)
+
+    total_docs = sum(class_docs.values())
+    vocabulary_size = len(vocabulary)
+    model = {
+        "version": FEATURE_VERSION,
+        "buckets": buckets,
+        "alpha": alpha,
+        "classes": sorted(class_docs),
+        "class_log_prior": {},
+        "unseen_log_prob": {},
+        "feature_log_prob": {}
+    }
+    for mood in model["classes"]:
+        counts = class_features[mood]
+        denominator = sum(counts.values()) + alpha * vocabulary_size
+        model["class_log_prior"][mood] = math.log(class_docs[mood] / total_docs)
+        model["unseen_log_prob"][mood] = math.log(alpha / denominator)
+        model["feature_log_prob"][mood] = {
+            str(bucket): math.log((count + alpha) / denominator) for bucket, count in counts.items()
+        }
+    return model
+
+class MoodClassifier:
+    """Scores a story against every mood and reports the top mood's posterior"""
+    def __init__(self, model, min_known_features=2):
+        if model.get("version") != FEATURE_VERSION:
+            raise ValueError(f"Model was trained with feature version {model.get('version')}, "
+                             f"expected {FEATURE_VERSION}; retrain with train_mood_classifier.py")
+        self.buckets = model["buckets"]
+        self.classes = list(model["classes"])
+        self.class_log_prior = model["class_log_prior"]
+        self.unseen_log_prob = model["unseen_log_prob"]
+        self.feature_log_prob = {
+            mood: {int(bucket): value for bucket, value in table.items()}
+            for mood, table in model["feature_log_prob"].items()
+        }
+        self.known_buckets = set()
+        for table in self.feature_log_prob.values():
+            self.known_buckets.update(table)
+        self.min_known_features = min_known_features
+        # Confidence threshold chosen on held-out data by evaluate_mood_classifier.py, if any
+        self.threshold = model.get("threshold")
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH, **kwargs):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def predict(self, text):
+        """Return ``(mood, confidence, probabilities)`` for ``text``.
+
+        Confidence is the posterior of the top mood, or 0.0 when the text has
+        too few features the model has seen to be trusted.
+        """
+        features = hashed_features(text, self.buckets)
+        known = [(bucket, count) for bucket, count in features.items() if bucket in self.known_buckets]
+
+        scores = {}
+        for mood in self.classes:
+            table = self.feature_log_prob[mood]
+            unseen = self.unseen_log_prob[mood]
+            scores[mood] = self.class_log_prior[mood] + sum(
+                count * table.get(bucket, unseen) for bucket, count in known
+            )
+
+        # Softmax over the joint log-likelihoods
+        top = max(scores.values())
+        exp_scores = {mood: math.exp(score - top) for mood, score in scores.items()}
+        total = sum(exp_scores.values())
+        probabilities = {mood: value / total for mood, value in exp_scores.items()}
+
+        mood = max(probabilities, key=probabilities.get)
+        confidence = probabilities[mood] if sum(count for _, count in known) >= self.min_known_features else 0.0
+        return mood, confidence, probabilities
+
+    def serving_prediction(self, text, threshold):
+        """Return ``(mood, confidence)`` if the prediction may be served without Gemini, else None.
+
+        Naive Bayes posteriors are overconfident, so besides reaching
+        ``threshold`` the prediction must agree with the lexicon scorer; stories
+        with mixed signals ("got the job but I'm terrified") are escalated.
+        """
+        if threshold is None:
+            return None
+        mood, confidence, _ = self.predict(text)
+        if confidence < threshold or classify_mood(text)[0] != mood:
+            return None
+        return mood, confidence
+
+_default_classifier = None
+_default_classifier_loaded = False
+
+def get_default_classifier():
+    """Load the shipped classifier once; returns None if the model file is unavailable"""
+    global _default_classifier, _default_classifier_loaded
+    if not _default_classifier_loaded:
+        _default_classifier_loaded = True
+        try:
+            _default_classifier = MoodClassifier.load()
+            logger.info("Loaded local mood classifier from %s", DEFAULT_MODEL_PATH)
+        except Exception as e:
+            logger.warning("Local mood classifier unavailable: %s", e)
+    return _default_classifier
@@ -0,0 +1,176 @@
+"""
+Weighted mood lexicon and single-pass scoring engine.
+
+Used as the last-resort fallback when neither the local classifier nor
+Gemini can answer. Text is normalized and split at the byte level and the
+tokens are filtered against a precompiled lexicon set in C, so only lexicon
+hits and modifiers are touched from Python. It is still slower than the old
+18-keyword substring check it replaced (about 2x, see
+benchmarks/bench_lexicon.py); the point of the change is accuracy across all
+seven moods, not speed. Whole words are matched (no substring hits such
+as "like" inside "unlikely"), negations ("not", "never", "don't", ...)
+redirect the next few emotion words, and intensifiers boost the word that
+follows them.
+"""
+from collections import Counter
+
+MOODS = ("joy", "sadness", "anger", "fear", "surprise", "disgust", "neutral")
+
+# mood -> {word: weight}
+LEXICON_WORDS = {
+    "joy": {
+        "happy": 2.0, "happiness": 2.0, "joy": 2.0, "joyful": 2.0, "glad": 1.5, "great": 1.0, "good": 0.8,
+        "excellent": 1.5, "wonderful": 2.0, "amazing": 1.5, "awesome": 1.5, "fantastic": 1.5, "love": 1.5,
+        "loved": 1.5, "lovely": 1.5, "like": 0.5, "enjoy": 1.2, "enjoyed": 1.2, "fun": 1.2, "excited": 1.8,
+        "exciting": 1.5, "thrilled": 2.0, "delighted": 2.0, "grateful": 1.5, "thankful": 1.5, "proud": 1.5,
+        "cheerful": 1.8, "smile": 1.2, "smiled": 1.2, "laugh": 1.2, "laughed": 1.2, "celebrate": 1.5,
+        "celebrated": 1.5, "blessed": 1.5, "content": 1.0, "relaxed": 1.0, "peaceful": 1.0, "hopeful": 1.2,
+        "best": 1.2, "beautiful": 1.2, "perfect": 1.2, "pleased": 1.5, "won": 1.2, "success": 1.2
+    },
+    "sadness": {
+        "sad": 2.0, "sadness": 2.0, "unhappy": 2.0, "depressed": 2.5, "depressing": 2.0, "down": 0.8,
+        "lonely": 2.0, "alone": 1.0, "cry": 2.0, "cried": 2.0, "crying": 2.0, "tears": 1.5, "miss": 1.2,
+        "missed": 1.0, "heartbroken": 2.5, "hopeless": 2.5, "miserable": 2.5, "grief": 2.5, "grieving": 2.5,
+        "lost": 1.0, "loss": 1.5, "hurt": 1.5, "empty": 1.5, "gloomy": 1.8, "disappointed": 1.8,
+        "disappointing": 1.5, "bad": 0.8, "terrible": 1.0, "awful": 1.0, "sorrow": 2.0, "regret": 1.5,
+        "tired": 0.6, "exhausted": 0.8, "failed": 1.2, "failure": 1.5, "worthless": 2.5, "died": 2.0
+    },
+    "anger": {
+        "angry": 2.5, "anger": 2.5, "mad": 2.0, "furious": 3.0, "rage": 3.0, "livid": 3.0, "hate": 2.0,
+        "hated": 2.0, "annoyed": 1.8, "annoying": 1.5, "irritated": 1.8, "irritating": 1.5,
+        "frustrated": 1.8, "frustrating": 1.5, "upset": 1.2, "outraged": 2.5, "outrageous": 2.0,
+        "unfair": 1.5, "resent": 2.0, "yelled": 1.5, "yelling": 1.5, "shouted": 1.5, "rude": 1.5,
+        "fed": 0.5, "sick": 0.5, "blame": 1.2, "blamed": 1.2, "temper": 1.5, "dislike": 1.2
+    },
+    "fear": {
+        "afraid": 2.5, "scared": 2.5, "fear": 2.5, "frightened": 2.5, "terrified": 3.0, "anxious": 2.2,
+        "anxiety": 2.2, "worried": 2.0, "worry": 1.8, "worrying": 1.8, "nervous": 2.0, "panic": 2.5,
+        "dread": 2.5, "uneasy": 1.8, "tense": 1.2, "stressed": 1.5, "stress": 1.2, "threat": 1.5,
+        "danger": 1.5, "dangerous": 1.5, "unsafe": 1.8, "insecure": 1.5, "horror": 2.0, "creepy": 1.5
+    },
+    "surprise": {
+        "surprised": 2.5, "surprise": 2.0, "surprising": 2.0, "shocked": 2.5, "shocking": 2.0,
+        "unexpected": 2.0, "unexpectedly": 2.0, "suddenly": 1.2, "astonished": 2.5, "amazed": 2.0,
+        "stunned": 2.5, "startled": 2.5, "wow": 2.0, "unbelievable": 2.0, "speechless": 2.0,
+        "believe": 0.5, "twist": 1.2
+    },
+    "disgust": {
+        "disgusted": 3.0, "disgusting": 3.0, "disgust": 3.0, "gross": 2.5, "grossed": 2.5, "revolting": 3.0,
+        "repulsed": 3.0, "repulsive": 3.0, "nasty": 2.0, "vile": 2.5, "filthy": 2.0, "rotten": 2.0,
+        "nauseous": 2.0, "sickening": 2.5, "yuck": 2.5, "creep": 1.0, "hypocrisy": 1.5, "dirty": 1.2
+    },
+    "neutral": {
+        "okay": 1.0, "ok": 1.0, "fine": 1.0, "normal": 1.0, "usual": 1.0, "ordinary": 1.2,
+        "routine": 1.2, "regular": 0.8, "calm": 1.0, "average": 1.0
+    }
+}
+
+NEGATIONS = frozenset(["not", "no", "never", "nothing", "nobody", "none", "neither", "nor", "without",
+                       "hardly", "barely", "cannot", "cant", "dont", "didnt", "doesnt", "isnt", "wasnt",
+                       "arent", "werent", "wont", "wouldnt", "shouldnt", "couldnt", "aint"])
+INTENSIFIERS = {"very": 1.5, "so": 1.4, "really": 1.4, "extremely": 1.8, "super": 1.5, "incredibly": 1.8,
+                "totally": 1.4, "completely": 1.4, "absolutely": 1.6, "too": 1.2, "deeply": 1.5}
+
+# How many following tokens a negation applies to
+NEGATION_SCOPE = 3
+# Negated emotion words count towards the redirected mood at this fraction of their weight
+NEGATION_FACTOR = 0.5
+# "not happy" reads as sad; other negated moods ("not angry") mostly read as calm
+NEGATED_MOOD = {"joy": "sadness", "sadness": "neutral", "anger": "neutral", "fear": "neutral",
+                "surprise": "neutral", "disgust": "neutral", "neutral": "neutral"}
+# Below this total emotional weight an entry is considered neutral
+MIN_SCORE = 1.0
+
+_MOOD_INDEX = {mood: index for index, mood in enumerate(MOODS)}
+# Precompiled token -> (mood index, weight) table, built once at import;
+# tokens are UTF-8 bytes (see _tokenize)
+_LEXICON = {
+    word.encode(): (_MOOD_INDEX[mood], weight)
+    for mood, words in LEXICON_WORDS.items()
+    for word, weight in words.items()
+}
+_NEGATED_INDEX = [_MOOD_INDEX[NEGATED_MOOD[mood]] for mood in MOODS]
+
+# Precompiled byte-level tokenizer: contractions are expanded ("didn't" ->
+# "did not"), apostrophes dropped and every other ASCII non-letter becomes a
+# space through a 256-entry translation table. Non-ASCII bytes are kept, so
+# accented words stay whole. Every step is a single C-level pass.
+_TOKEN_TABLE = bytes(code if (97 <= code <= 122 or code >= 128) else 32 for code in range(256))
+_INTENSIFIERS = {word.encode(): boost for word, boost in INTENSIFIERS.items()}
+_MODIFIERS = frozenset(word.encode() for word in NEGATIONS | set(INTENSIFIERS))
+# Every token the scorer looks at; all other tokens are discarded in C
+_SCORED = frozenset(_LEXICON) | _MODIFIERS
+
+def _tokenize(text):
+    text = text.lower().encode("utf-8").replace("\u2019".encode("utf-8"), b"'").replace(b"n't", b" not")
+    return text.translate(_TOKEN_TABLE, b"'").split()
+
+def tokenize(text):
+    return [token.decode("utf-8") for token in _tokenize(text)]
+
+def _positions(tokens, token):
+    positions = []
+    position = -1
+    try:
+        while True:
+            position = tokens.index(token, position + 1)
+            positions.append(position)
+    except ValueError:
+        return positions
+
+def score_moods(text):
+    """Score ``text`` against every mood; returns a list aligned with MOODS.
+
+    Tokens are filtered against the precompiled lexicon in C and only the
+    hits are counted. Negations and intensifiers are rare, so only when one
+    is present are their positions looked up (``list.index``) and applied as
+    corrections to the words that follow them.
+    """
+    tokens = _tokenize(text)
+    counts = Counter(filter(_SCORED.__contains__, tokens))
+    scores = [0.0] * len(MOODS)
+    modifiers = []
+    for token, count in counts.items():
+        entry = _LEXICON.get(token)
+        if entry is None:
+            modifiers.append(token)
+        else:
+            scores[entry[0]] += entry[1] * count
+    
+    if not modifiers:
+        return scores
+    
+    negated = set()
+    boosted = []
+    for position in sorted(position for token in modifiers for position in _positions(tokens, token)):
+        token = tokens[position]
+        if token in _INTENSIFIERS:
+            target = position + 1
+            if target < len(tokens) and tokens[target] in _LEXICON:
+                boosted.append((target, _INTENSIFIERS[token]))
+            continue
+        # Negation: redirect emotion words among the next NEGATION_SCOPE tokens
+        for target in range(position + 1, min(position + 1 + NEGATION_SCOPE, len(tokens))):
+            if tokens[target] in _LEXICON and target not in negated:
+                negated.add(target)
+                index, weight = _LEXICON[tokens[target]]
+                scores[index] -= weight
+                scores[_NEGATED_INDEX[index]] += weight * NEGATION_FACTOR
+    
+    for target, boost in boosted:
+        index, weight = _LEXICON[tokens[target]]
+        extra = weight * (boost - 1.0)
+        if target in negated:
+            scores[_NEGATED_INDEX[index]] += extra * NEGATION_FACTOR
+        else:
+            scores[index] += extra
+    return scores
+
+def classify_mood(text):
+    """Return ``(mood, scores)`` for ``text``, defaulting to neutral on weak or tied evidence"""
+    scores = score_moods(text)
+    best = max(range(len(MOODS)), key=scores.__getitem__)
+    top = scores[best]
+    if top < MIN_SCORE or sum(1 for score in scores if score == top) > 1:
+        return "neutral", dict(zip(MOODS, scores))
+    return MOODS[best], dict(zip(MOODS, scores))
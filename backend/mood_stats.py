@@ -0,0 +1,220 @@
+"""
+Per-user mood statistics.
+
+Reads are served from one small ``user_stats`` document per user (``_id`` is
+the user id) holding per-mood counts, the total, a ring of the most recent
+moods and the first/last entry timestamps. Writers keep it current with
+atomic ``$inc``/``$push``+``$slice`` updates as entries are added or deleted,
+and every write also bumps ``version`` so a rebuild can tell whether the
+document changed while it was recomputing (see ``rebuild_user_stats``).
+
+Entries are inserted before they are recorded, so a rebuild running in
+between already counts them. ``applied_ids`` keeps the ids of the newest
+APPLIED_IDS_SIZE entries the document accounts for (a rebuild seeds it from
+the entries it counted) and ``record_entries`` skips any entry listed there.
+
+The aggregation below is the source of truth: it rebuilds a user's document
+when none exists yet (or the ring ran dry after deletes) and repairs drift
+via ``python run.py rebuild-stats``. Its $match/$sort/$project prefix runs as
+a covered scan of the (user_id, timestamp, _id, mood) index and a $facet splits
+that stream into the per-mood counts and the most recent moods.
+"""
+import logging
+import pymongo
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger("aura_q")
+
+RECENT_MOODS_LIMIT = 5
+# Recent moods kept in the stats document; the slack over RECENT_MOODS_LIMIT
+# absorbs deletes before the ring has to be rebuilt
+RECENT_RING_SIZE = 20
+# A rebuild that keeps losing the race against concurrent writes gives up after this many tries
+REBUILD_ATTEMPTS = 5
+# Ids of a user's newest entries remembered as counted. Must exceed how many of one
+# user's entries can be inserted but not yet recorded (ANALYZE_BATCH_MAX_STORIES,
+# MOOD_WRITE_BATCH_SIZE), or a rebuild in that window may count some of them twice.
+APPLIED_IDS_SIZE = 200
+
+def statistics_pipeline(user_id, recent_limit=RECENT_MOODS_LIMIT):
+    return [
+        {"$match": {"user_id": user_id}},
+        # Sort and project only indexed fields so the prefix is an IXSCAN with no FETCH
+        {"$sort": {"timestamp": pymongo.DESCENDING}},
+        {"$project": {"_id": 0, "mood": 1}},
+        {"$facet": {
+            "counts": [{"$group": {"_id": "$mood", "count": {"$sum": 1}}}],
+            "recent": [{"$limit": recent_limit}]
+        }}
+    ]
+
+def compute_user_statistics(collection, user_id, recent_limit=RECENT_MOODS_LIMIT):
+    """Return ``{"total_entries", "mood_counts", "recent_moods"}`` in one round trip"""
+    result = next(collection.aggregate(statistics_pipeline(user_id, recent_limit)), None) or {}
+    mood_counts = {row["_id"]: row["count"] for row in result.get("counts", [])}
+    return {
+        "total_entries": sum(mood_counts.values()),
+        "mood_counts": mood_counts,
+        "recent_moods": [row["mood"] for row in result.get("recent", [])]
+    }
+
+def _ring_item(entry):
+    return {"id": entry["_id"], "mood": entry["mood"], "timestamp": entry["timestamp"]}
+
+def _entries_update(entries):
+    increments = {"total_entries": len(entries), "version": 1}
+    for entry in entries:
+        key = f"mood_counts.{entry['mood']}"
+        increments[key] = increments.get(key, 0) + 1
+    return {
+        "$inc": increments,
+        "$push": {
+            "recent": {
+                "$each": [_ring_item(entry) for entry in entries],
+                "$sort": {"timestamp": pymongo.DESCENDING},
+                "$slice": RECENT_RING_SIZE
+            },
+            "applied_ids": {"$each": [entry["_id"] for entry in entries], "$slice": -APPLIED_IDS_SIZE}
+        },
+        "$min": {"first_timestamp": min(entry["timestamp"] for entry in entries)},
+        "$max": {"last_timestamp": max(entry["timestamp"] for entry in entries)}
+    }
+
+def _unapplied(user_id, entries):
+    # Matches only while none of the entries has been counted yet
+    return {"_id": user_id, "applied_ids": {"$nin": [entry["_id"] for entry in entries]}}
+
+def record_entries(db, user_id, entries):
+    """Fold newly inserted mood entries (with ``_id``) into the user's stats document.
+
+    Idempotent per entry: entries already counted, by a rebuild that ran after
+    their insert or by an earlier call, are skipped.
+    """
+    if not entries:
+        return
+    try:
+        db.user_stats.update_one(_unapplied(user_id, entries), _entries_update(entries), upsert=True)
+        return
+    except DuplicateKeyError:
+        # The document exists but didn't match: a racing first write created it,
+        # or some of the entries are already counted
+        if db.user_stats.update_one(_unapplied(user_id, entries), _entries_update(entries)).matched_count:
+            return
+    stats = db.user_stats.find_one({"_id": user_id}, {"applied_ids": 1})
+    applied = set(stats.get("applied_ids", [])) if stats else set()
+    remaining = [entry for entry in entries if entry["_id"] not in applied]
+    if remaining:
+        try:
+            db.user_stats.update_one(_unapplied(user_id, remaining), _entries_update(remaining), upsert=stats is None)
+        except DuplicateKeyError:
+            logger.warning("Stats for user %s changed while recording entries; run.py rebuild-stats repairs drift", user_id)
+
+def record_deletion(db, user_id, entry):
+    """Remove one deleted entry (needs ``_id``, ``mood`` and ``timestamp``) from the stats"""
+    stats = db.user_stats.find_one_and_update(
+        {"_id": user_id},
+        {
+            "$inc": {"total_entries": -1, f"mood_counts.{entry['mood']}": -1, "version": 1},
+            "$pull": {"recent": {"id": entry["_id"]}}
+        },
+        projection={"first_timestamp": 1, "last_timestamp": 1},
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    if stats and entry["timestamp"] in (stats.get("first_timestamp"), stats.get("last_timestamp")):
+        # The deleted entry bounded the user's history; re-read the bounds from the index
+        _refresh_bounds(db, user_id)
+
+def reset_user_stats(db, user_id):
+    """Drop the stats of a user whose history was cleared"""
+    db.user_stats.delete_one({"_id": user_id})
+
+def _refresh_bounds(db, user_id):
+    first = db.mood_entries.find_one({"user_id": user_id}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", pymongo.ASCENDING)])
+    last = db.mood_entries.find_one({"user_id": user_id}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", pymongo.DESCENDING)])
+    if first and last:
+        bounds = {"$set": {"first_timestamp": first["timestamp"], "last_timestamp": last["timestamp"]}}
+    else:
+        # Unset rather than null: null sorts before any date, so a later $min would keep it
+        bounds = {"$unset": {"first_timestamp": "", "last_timestamp": ""}}
+    db.user_stats.update_one({"_id": user_id}, dict(bounds, **{"$inc": {"version": 1}}))
+
+def rebuild_user_stats(db, user_id):
+    """Recompute a user's stats document from mood_entries; returns the new document.
+
+    The replace only succeeds if ``version`` is unchanged since the rebuild
+    started, so a ``record_entries``/``record_deletion`` landing mid-rebuild
+    isn't overwritten; the rebuild then starts over. If it keeps losing, the
+    stored document is left as is (not marked complete, so the next read
+    retries) and the freshly computed one is returned for this request.
+    """
+    for _ in range(REBUILD_ATTEMPTS):
+        current = db.user_stats.find_one({"_id": user_id}, {"version": 1})
+        document = _compute_stats_document(db, user_id)
+        try:
+            if current is None:
+                db.user_stats.insert_one(dict(document, version=0))
+                return document
+            version = current.get("version")
+            # Documents from before versioning have no version field
+            version_filter = version if version is not None else {"$exists": False}
+            result = db.user_stats.replace_one({"_id": user_id, "version": version_filter},
+                                               dict(document, version=version or 0))
+            if result.matched_count:
+                return document
+        except DuplicateKeyError:
+            # A writer created the document while we were computing
+            pass
+    logger.warning("Stats rebuild for user %s kept racing concurrent writes; will retry on next read", user_id)
+    return document
+
+def _compute_stats_document(db, user_id):
+    stats = compute_user_statistics(db.mood_entries, user_id)
+    newest = list(db.mood_entries.find({"user_id": user_id}, {"mood": 1, "timestamp": 1})
+                  .sort([("timestamp", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)])
+                  .limit(max(APPLIED_IDS_SIZE, RECENT_RING_SIZE)))
+    recent = newest[:RECENT_RING_SIZE]
+    first = db.mood_entries.find_one({"user_id": user_id}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", pymongo.ASCENDING)])
+    document = {
+        "_id": user_id,
+        "total_entries": stats["total_entries"],
+        "mood_counts": stats["mood_counts"],
+        "recent": [_ring_item(entry) for entry in recent],
+        # Oldest first, matching the order record_entries appends in
+        "applied_ids": [entry["_id"] for entry in reversed(newest[:APPLIED_IDS_SIZE])],
+        # Only rebuilt documents are trusted; ones created by an upsert in
+        # record_entries may be missing the user's older history
+        "complete": True
+    }
+    if first and recent:
+        # Left out when there are no entries so record_entries' $min/$max can set them
+        document["first_timestamp"] = first["timestamp"]
+        document["last_timestamp"] = recent[0]["timestamp"]
+    return document
+
+def rebuild_all_user_stats(db, report=logger.info):
+    """Rebuild the stats of every user with mood entries; returns the number rebuilt"""
+    rebuilt = 0
+    user_ids = set(db.mood_entries.distinct("user_id"))
+    for user_id in user_ids:
+        rebuild_user_stats(db, user_id)
+        rebuilt += 1
+        if rebuilt % 500 == 0:
+            report(f"  ... {rebuilt}/{len(user_ids)} users")
+    # Users whose entries are all gone keep no stats document
+    orphaned = db.user_stats.delete_many({"_id": {"$nin": list(user_ids)}}).deleted_count
+    report(f"Rebuilt stats for {rebuilt} users, removed {orphaned} orphaned documents")
+    return rebuilt
+
+def get_user_statistics(db, user_id):
+    """Serve ``/user/statistics`` from the stats document, rebuilding it if it can't be trusted"""
+    stats = db.user_stats.find_one({"_id": user_id})
+    if (stats is None or not stats.get("complete")
+            or len(stats.get("recent", [])) < min(stats.get("total_entries", 0), RECENT_MOODS_LIMIT)):
+        stats = rebuild_user_stats(db, user_id)
+    return {
+        "total_entries": stats["total_entries"],
+        "mood_counts": {mood: count for mood, count in stats["mood_counts"].items() if count > 0},
+        "recent_moods": [item["mood"] for item in stats["recent"][:RECENT_MOODS_LIMIT]],
+        "first_entry": stats["first_timestamp"].isoformat() if stats.get("first_timestamp") else None,
+        "last_entry": stats["last_timestamp"].isoformat() if stats.get("last_timestamp") else None
+    }
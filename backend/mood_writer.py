@@ -0,0 +1,251 @@
+"""
+Persistence pipeline for mood entries.
+
+Every entry gets its ``_id`` (an ObjectId generated here) before it is
+written, so the analyze endpoints can return the id whichever mode is used:
+
+  sync   (default) ``insert_many`` on the request thread, as before
+  async  entries are queued and a background thread writes them in batches of
+         up to MOOD_WRITE_BATCH_SIZE with unordered ``insert_many``, waiting at
+         most MOOD_WRITE_LINGER_SECONDS for a batch to fill
+
+In async mode the response no longer waits on MongoDB. The trade-offs:
+  - history and statistics lag by the time an entry spends queued, and
+    deleting an entry that hasn't been written yet returns 404;
+  - backpressure: at most MOOD_WRITE_QUEUE_SIZE entries are held; a request
+    that can't enqueue within MOOD_WRITE_ENQUEUE_TIMEOUT_SECONDS gets
+    ``MoodWriterBusy`` (a 503) instead of growing memory without bound;
+  - transient failures (connection loss, timeouts, failovers) put the batch
+    back at the head of the queue and retry with capped exponential backoff.
+    Retries are idempotent because the ids are fixed: duplicate-key errors
+    for entries that were already stored are counted as written;
+  - the queue is drained at interpreter exit and from run.py's shutdown
+    handlers, but a hard kill loses whatever was still queued.
+
+Vercel always uses sync mode, since background threads are frozen between
+requests there.
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout, PyMongoError
+
+logger = logging.getLogger("aura_q")
+
+MOOD_WRITE_MODE = "sync" if "VERCEL" in os.environ else os.environ.get("MOOD_WRITE_MODE", "sync").lower()
+MOOD_WRITE_BATCH_SIZE = int(os.environ.get("MOOD_WRITE_BATCH_SIZE", 100))
+MOOD_WRITE_LINGER_SECONDS = float(os.environ.get("MOOD_WRITE_LINGER_SECONDS", 0.2))
+MOOD_WRITE_QUEUE_SIZE = int(os.environ.get("MOOD_WRITE_QUEUE_SIZE", 10000))
+MOOD_WRITE_ENQUEUE_TIMEOUT_SECONDS = float(os.environ.get("MOOD_WRITE_ENQUEUE_TIMEOUT_SECONDS", 2))
+MOOD_WRITE_RETRY_MAX_DELAY_SECONDS = float(os.environ.get("MOOD_WRITE_RETRY_MAX_DELAY_SECONDS", 30))
+# Attempts per batch when draining at shutdown, where waiting forever isn't an option
+MOOD_WRITE_SHUTDOWN_ATTEMPTS = int(os.environ.get("MOOD_WRITE_SHUTDOWN_ATTEMPTS", 3))
+
+DUPLICATE_KEY = 11000
+
+class MoodWriterBusy(Exception):
+    """Raised when the write queue stays full for longer than the enqueue timeout"""
+
+def is_transient(error):
+    """Errors worth retrying: lost connections, timeouts and anything the driver labels retryable"""
+    if isinstance(error, (ConnectionFailure, ExecutionTimeout)):
+        return True
+    return isinstance(error, PyMongoError) and error.has_error_label("RetryableWriteError")
+
+class MoodEntryWriter:
+    """Writes mood entries synchronously or through a bounded, batched background queue"""
+    def __init__(self, mode=MOOD_WRITE_MODE, batch_size=MOOD_WRITE_BATCH_SIZE, linger=MOOD_WRITE_LINGER_SECONDS,
+                 max_queue=MOOD_WRITE_QUEUE_SIZE, enqueue_timeout=MOOD_WRITE_ENQUEUE_TIMEOUT_SECONDS):
+        self.mode = mode
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self.collection = None
+        self.on_written = None
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # one batch in flight at a time (writer thread or shutdown drain)
+        self._thread = None
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.peak_queue_depth = 0
+        self.last_error = None
+
+    @property
+    def is_async(self):
+        return self.mode == "async"
+
+    def attach(self, collection, on_written=None):
+        """Set the target collection and an optional ``on_written(entries)`` callback for stored entries"""
+        self.collection = collection
+        self.on_written = on_written
+        if self.is_async:
+            atexit.register(self.flush)
+
+    def write(self, entries):
+        """Assign ids to ``entries``, persist or enqueue them, and return the ids in order.
+
+        Raises ``MoodWriterBusy`` if the async queue has no room for the whole
+        list in time; in sync mode database errors propagate to the caller.
+        """
+        if self.collection is None:
+            raise RuntimeError("Mood entry writer is not attached to a collection")
+        for entry in entries:
+            entry.setdefault("_id", ObjectId())
+        ids = [entry["_id"] for entry in entries]
+
+        if not self.is_async:
+            self.collection.insert_many(entries, ordered=False)
+            self.batches += 1
+            self._written(entries)
+            return ids
+
+        deadline = time.monotonic() + self.enqueue_timeout
+        with self._cond:
+            # All-or-nothing, so a request never has half its entries queued
+            while len(self._queue) + len(entries) > self.max_queue:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise MoodWriterBusy("Mood entry write queue is full")
+                self._cond.wait(remaining)
+            self._queue.extend(entries)
+            self.peak_queue_depth = max(self.peak_queue_depth, len(self._queue))
+            self._cond.notify_all()
+        self._ensure_thread()
+        return ids
+
+    def flush(self, attempts=MOOD_WRITE_SHUTDOWN_ATTEMPTS):
+        """Drain the queue on the calling thread; returns the number of entries still queued"""
+        while True:
+            with self._write_lock:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                for attempt in range(attempts):
+                    if self._write_batch(batch):
+                        break
+                    time.sleep(min(2 ** attempt * 0.1, MOOD_WRITE_RETRY_MAX_DELAY_SECONDS))
+                else:
+                    self._requeue(batch)
+                    break
+        with self._cond:
+            left = len(self._queue)
+        if left:
+            logger.error("Mood entry writer stopped with %s entries unwritten: %s", left, self.last_error)
+        return left
+
+    def _take_batch(self):
+        with self._cond:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            if batch:
+                self._cond.notify_all()
+            return batch
+
+    def _requeue(self, batch):
+        with self._cond:
+            self._queue.extendleft(reversed(batch))
+
+    def _write_batch(self, batch):
+        """Insert ``batch``; True when done (written or permanently failed), False on a transient error"""
+        stored = batch
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            failed = {}
+            for error in e.details.get("writeErrors", []):
+                # A duplicate _id means an earlier, seemingly failed attempt did store it
+                if error.get("code") != DUPLICATE_KEY:
+                    failed[error["index"]] = error.get("errmsg")
+            if failed:
+                self.dropped += len(failed)
+                self.last_error = next(iter(failed.values()))
+                logger.error("Dropped %s mood entries rejected by MongoDB: %s", len(failed), self.last_error)
+            stored = [entry for index, entry in enumerate(batch) if index not in failed]
+        except Exception as e:
+            self.last_error = str(e)
+            if is_transient(e):
+                self.retries += 1
+                logger.warning("Transient error writing %s mood entries, will retry: %s", len(batch), e)
+                return False
+            self.dropped += len(batch)
+            logger.error("Dropped %s mood entries after a non-retryable error: %s", len(batch), e)
+            return True
+        self.batches += 1
+        self._written(stored)
+        return True
+
+    def _written(self, entries):
+        self.written += len(entries)
+        if self.on_written is not None and entries:
+            try:
+                self.on_written(entries)
+            except Exception as e:
+                logger.warning("Mood entry on_written callback failed: %s", e)
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mood-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        delay = 0.1
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                # Give a partial batch a moment to fill before writing it
+                deadline = time.monotonic() + self.linger
+                while len(self._queue) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            with self._write_lock:
+                batch = self._take_batch()
+                if not batch:
+                    continue
+                try:
+                    done = self._write_batch(batch)
+                except Exception as e:
+                    logger.error("Mood entry writer error: %s", e)
+                    done = False
+                if not done:
+                    self._requeue(batch)
+            if done:
+                delay = 0.1
+            else:
+                time.sleep(delay)
+                delay = min(delay * 2, MOOD_WRITE_RETRY_MAX_DELAY_SECONDS)
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._queue)
+        return {
+            "mode": self.mode,
+            "batch_size": self.batch_size,
+            "max_queue": self.max_queue,
+            "queue_depth": depth,
+            "peak_queue_depth": self.peak_queue_depth,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 1) if self.batches else None,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "last_error": self.last_error
+        }
+
+mood_writer = MoodEntryWriter()
@@ -0,0 +1,160 @@
+"""
+Bounded worker pool for bcrypt password hashing.
+
+bcrypt is deliberately CPU-heavy. Running it inline lets a login burst
+occupy one request worker per concurrent hash and compete with /analyze for
+every core. Here every hash and check runs on a small dedicated pool (the
+bcrypt extension releases the GIL while hashing), so at most
+PASSWORD_HASH_WORKERS cores are ever spent on it. The request thread waits
+idle on the result. Excess work queues up to PASSWORD_HASH_MAX_QUEUE and
+beyond that is rejected with ``PasswordHasherBusy`` instead of piling up.
+
+The cost factor is PASSWORD_HASH_ROUNDS (see ``calibrate_rounds`` /
+``python run.py calibrate-hash``). Hashes made with a different cost are
+transparently rehashed in the background after a successful login.
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger("aura_q")
+
+PASSWORD_HASH_ROUNDS = int(os.environ.get("PASSWORD_HASH_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", 32))
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.environ.get("PASSWORD_HASH_TIMEOUT_SECONDS", 10))
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full or a hash did not finish in time"""
+
+def hash_rounds(pw_hash):
+    """Cost factor of a "$2b$12$..." bcrypt hash, or None if it can't be parsed"""
+    try:
+        return int(pw_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+class PasswordHasher:
+    """Runs a flask_bcrypt ``Bcrypt`` extension's hash/check calls on a bounded pool"""
+    def __init__(self, bcrypt, rounds=PASSWORD_HASH_ROUNDS, workers=PASSWORD_HASH_WORKERS,
+                 max_queue=PASSWORD_HASH_MAX_QUEUE, timeout=PASSWORD_HASH_TIMEOUT_SECONDS):
+        self.bcrypt = bcrypt
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0  # submitted and not yet finished (queued + running)
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.rehashed = 0
+        self._wait_total = 0.0
+        self._hash_total = 0.0
+        self.peak_queue_depth = 0
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordHasherBusy("Password hashing queue is full")
+            self._pending += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self._pending - self._running)
+        submitted = time.monotonic()
+
+        def run():
+            started = time.monotonic()
+            with self._lock:
+                self._running += 1
+                self._wait_total += started - submitted
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._pending -= 1
+                    self.completed += 1
+                    self._hash_total += time.monotonic() - started
+        return self._executor.submit(run)
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+                if future.cancel():
+                    # Never started, so run() won't release its queue slot
+                    self._pending -= 1
+            raise PasswordHasherBusy("Password hashing timed out")
+
+    def hash_password(self, password):
+        """Return a new bcrypt hash (str) of ``password`` at the configured cost"""
+        return self._wait(self._submit(self._hash, password))
+
+    def check_password(self, pw_hash, password):
+        return self._wait(self._submit(self.bcrypt.check_password_hash, pw_hash, password))
+
+    def needs_rehash(self, pw_hash):
+        return hash_rounds(pw_hash) != self.rounds
+
+    def rehash_in_background(self, password, on_done):
+        """Hash ``password`` at the configured cost and pass the result to ``on_done`` on the pool.
+
+        Best effort: skipped when the pool is busy, since the next login tries again.
+        """
+        def rehash():
+            new_hash = self._hash(password)
+            try:
+                on_done(new_hash)
+                with self._lock:
+                    self.rehashed += 1
+            except Exception as e:
+                logger.warning("Failed to store rehashed password: %s", e)
+        try:
+            self._submit(rehash)
+        except PasswordHasherBusy:
+            pass
+
+    def _hash(self, password):
+        return self.bcrypt.generate_password_hash(password, self.rounds).decode("utf-8")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._pending - self._running,
+                "peak_queue_depth": self.peak_queue_depth,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "rehashed": self.rehashed,
+                "avg_queue_wait_ms": round(1000 * self._wait_total / self.completed, 1) if self.completed else None,
+                "avg_hash_ms": round(1000 * self._hash_total / self.completed, 1) if self.completed else None
+            }
+
+def calibrate_rounds(bcrypt, target_ms=250, min_rounds=10, max_rounds=16):
+    """Time one hash per cost factor; returns ``(best_rounds, [(rounds, ms), ...])``.
+
+    best_rounds is the highest cost whose hash still takes at most target_ms on this machine.
+    """
+    timings = []
+    best = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        started = time.perf_counter()
+        bcrypt.generate_password_hash("calibration-password", rounds)
+        elapsed = (time.perf_counter() - started) * 1000
+        timings.append((rounds, elapsed))
+        if elapsed <= target_ms:
+            best = rounds
+        else:
+            break
+    return best, timings
@@ -0,0 +1,44 @@
+"""
+Daily rewards and journaling counters on the user document.
+
+Every operation is a single ``find_one_and_update`` with an aggregation
+pipeline update: the daily reset (new day -> full rewards, zero count) and
+the operation's own change are evaluated together against the stored
+document, so concurrent requests (including ones straddling midnight) can't
+lose updates and the new values come back in the same round trip.
+"""
+import pymongo
+
+DAILY_REWARDS = 5
+REWARDS_PROJECTION = {"_id": 0, "rewards": 1, "daily_count": 1, "last_reset_date": 1}
+
+def _is_new_day(today):
+    return {"$ne": [{"$ifNull": ["$last_reset_date", None]}, today]}
+
+def _reset_then(today, daily_count_after_reset, daily_count_same_day):
+    """Pipeline applying the daily reset and then the given daily_count expressions"""
+    new_day = _is_new_day(today)
+    return [{"$set": {
+        # All expressions in one $set stage read the document as it was before the update
+        "rewards": {"$cond": [new_day, DAILY_REWARDS, "$rewards"]},
+        "daily_count": {"$cond": [new_day, daily_count_after_reset, daily_count_same_day]},
+        "last_reset_date": today
+    }}]
+
+def get_rewards_state(collection, user_id, today):
+    """Apply the daily reset if due and return ``{"rewards", "daily_count", ...}``, or None if no such user"""
+    return collection.find_one_and_update(
+        {"_id": user_id},
+        _reset_then(today, 0, {"$ifNull": ["$daily_count", 0]}),
+        projection=REWARDS_PROJECTION,
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+
+def increment_daily_count(collection, user_id, today):
+    """Count one more entry today (resetting first on a new day); returns the updated state or None"""
+    return collection.find_one_and_update(
+        {"_id": user_id},
+        _reset_then(today, 1, {"$add": [{"$ifNull": ["$daily_count", 0]}, 1]}),
+        projection=REWARDS_PROJECTION,
+        return_document=pymongo.ReturnDocument.AFTER
+    )
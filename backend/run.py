@@ -17,6 +17,14 @@ def parse_arguments():
     parser.add_argument("--host", type=str, default="127.0.0.1", help="Host to bind the server to")
     parser.add_argument("--production", action="store_true", help="Run in production mode using gunicorn/waitress")
     parser.add_argument("--debug", action="store_true", help="Run in debug mode")
+    subparsers = parser.add_subparsers(dest="command")
+    indexes_parser = subparsers.add_parser("indexes", help="Create missing MongoDB indexes and exit")
+    indexes_parser.add_argument("--no-explain", action="store_true", help="Skip the before/after query plan report")
+    stats_parser = subparsers.add_parser("rebuild-stats", help="Recompute per-user mood statistics from mood entries and exit")
+    stats_parser.add_argument("--user", help="Only rebuild this username")
+    subparsers.add_parser("migrate-weekly-moods", help="Fold raw weekly mood entries into daily buckets and exit")
+    calibrate_parser = subparsers.add_parser("calibrate-hash", help="Measure bcrypt cost factors on this machine and exit")
+    calibrate_parser.add_argument("--target-ms", type=float, default=250, help="Longest acceptable time for one password hash")
     return parser.parse_args()
 
 def check_dependencies():
@@ -262,10 +270,86 @@ def run_production_server(host="0.0.0.0", port=5000):
             print("Falling back to development server (not recommended for production)")
             run_flask_dev(host, port)
 
+def run_index_manager(explain=True):
+    """Create missing MongoDB indexes, reporting progress and query plans"""
+    import app
+    from db_indexes import ensure_indexes
+    
+    if app.db is None or not app.mongodb_connected:
+        print("Error: MongoDB is not reachable; cannot manage indexes.")
+        return False
+    
+    print(f"Ensuring indexes on database '{app.db.name}'...")
+    results = ensure_indexes(app.db, explain=explain, report=print)
+    failed = [name for name, status in results.items() if status == "failed"]
+    created = [name for name, status in results.items() if status == "created"]
+    mismatched = [name for name, status in results.items() if status == "mismatch"]
+    present = len(results) - len(created) - len(failed) - len(mismatched)
+    print(f"✓ {len(created)} created, {present} already present, {len(failed)} failed, {len(mismatched)} mismatched")
+    return not failed and not mismatched
+
+def run_stats_rebuild(username=None):
+    """Recompute the incrementally maintained user_stats documents"""
+    import app
+    from mood_stats import rebuild_user_stats, rebuild_all_user_stats
+    
+    if app.db is None or not app.mongodb_connected:
+        print("Error: MongoDB is not reachable; cannot rebuild statistics.")
+        return False
+    
+    if username:
+        user = app.db.users.find_one({"username": username}, {"_id": 1})
+        if not user:
+            print(f"Error: user '{username}' not found.")
+            return False
+        stats = rebuild_user_stats(app.db, user["_id"])
+        print(f"✓ Rebuilt stats for {username}: {stats['total_entries']} entries")
+        return True
+    
+    print("Rebuilding mood statistics for all users...")
+    rebuild_all_user_stats(app.db, report=print)
+    return True
+
+def run_weekly_mood_migration():
+    """Fold pre-bucket weekly mood documents into one document per user per day"""
+    import app
+    from weekly_moods import migrate_raw_weekly_moods
+    
+    if app.db is None or not app.mongodb_connected:
+        print("Error: MongoDB is not reachable; cannot migrate weekly moods.")
+        return False
+    
+    print("Migrating raw weekly mood entries into daily buckets...")
+    migrate_raw_weekly_moods(app.db.weekly_moods, report=print)
+    return True
+
+def run_hash_calibration(target_ms=250):
+    """Suggest PASSWORD_HASH_ROUNDS for this hardware"""
+    from flask_bcrypt import Bcrypt
+    from password_hashing import calibrate_rounds
+    
+    print(f"Timing bcrypt cost factors (target: {target_ms:.0f} ms per hash)...")
+    best, timings = calibrate_rounds(Bcrypt(), target_ms)
+    for rounds, elapsed in timings:
+        print(f"  rounds={rounds}: {elapsed:.0f} ms")
+    print(f"✓ Suggested setting: PASSWORD_HASH_ROUNDS={best}")
+    return True
+
 def setup_signal_handlers():
     """Setup handlers for system signals"""
     def signal_handler(sig, frame):
         print("\nShutting down AuraQ backend server...")
+        # Present whenever this process imported the app. Under waitress it
+        # serves requests here, so this drains real buffers; run_flask_dev and
+        # the maintenance commands import it too, but nothing is queued then
+        # and the flush is a no-op. The flask/gunicorn child processes flush
+        # from their own atexit hooks.
+        app_module = sys.modules.get("app")
+        if app_module is not None and hasattr(app_module, "flush_pending_writes"):
+            try:
+                app_module.flush_pending_writes()
+            except Exception as e:
+                print(f"Warning: failed to flush pending writes: {str(e)}")
         sys.exit(0)
     
     signal.signal(signal.SIGINT, signal_handler)
@@ -277,7 +361,7 @@ if __name__ == "__main__":
         args = parse_arguments()
     except Exception as e:
         print(f"Error parsing arguments: {str(e)}")
-        args = argparse.Namespace(port=5000, host="127.0.0.1", production=False, debug=False)
+        args = argparse.Namespace(port=5000, host="127.0.0.1", production=False, debug=False, command=None)
     
     print("=== AuraQ Backend Setup ===")
     
@@ -291,6 +375,15 @@ if __name__ == "__main__":
             print("Run: pip install -r requirements.txt")
             sys.exit(1)
     
+    if args.command == "indexes":
+        sys.exit(0 if run_index_manager(explain=not args.no_explain) else 1)
+    if args.command == "rebuild-stats":
+        sys.exit(0 if run_stats_rebuild(args.user) else 1)
+    if args.command == "migrate-weekly-moods":
+        sys.exit(0 if run_weekly_mood_migration() else 1)
+    if args.command == "calibrate-hash":
+        sys.exit(0 if run_hash_calibration(args.target_ms) else 1)
+    
     # Try to download NLTK data but continue even if it fails
     try:
         setup_nltk()
@@ -0,0 +1,189 @@
+"""
+Logging setup for the ``aura_q`` logger.
+
+Records are filtered (sampling / rate limits) on the calling thread, which is
+cheap, then handed to a ``QueueHandler``. A ``QueueListener`` thread does the
+message formatting, JSON encoding and stdout I/O, so request threads never
+block on logging. Callers should use %-style arguments
+(``logger.info("Login attempt for %s", username)``) so disabled levels and
+dropped records never pay for formatting.
+
+Sampling and rate limits are keyed by message type: the ``event`` passed via
+``extra={"event": "..."}``, or else the unformatted message template.
+WARNING and above are never sampled or rate limited.
+
+Environment:
+  LOG_LEVEL          INFO by default
+  LOG_FORMAT         json (default) or text
+  LOG_ASYNC          true (default, except on Vercel); false writes synchronously
+  LOG_QUEUE_SIZE     records buffered before new ones are dropped
+  LOG_SAMPLE_RATES   e.g. "weekly_mood.entry=0.05,login.attempt=0.5"
+  LOG_RATE_LIMITS    records per second, e.g. "login.attempt=20"
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+# Vercel freezes background threads between invocations, so queued records
+# would be delayed or lost there; write synchronously unless told otherwise
+LOG_ASYNC = os.environ.get("LOG_ASYNC", "false" if "VERCEL" in os.environ else "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+# Attributes every LogRecord has; anything else came from ``extra=`` and is emitted as a field
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def _parse_rates(value):
+    """Parse "key=number,key=number" into a dict, ignoring malformed items"""
+    rates = {}
+    for item in (value or "").split(","):
+        key, _, number = item.partition("=")
+        try:
+            rates[key.strip()] = float(number)
+        except ValueError:
+            continue
+    return rates
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, level, origin and any ``extra`` fields"""
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        elif record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Per-message-type probabilistic sampling plus a token-bucket rate limit"""
+    def __init__(self, sample_rates=None, rate_limits=None):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limits = rate_limits or {}
+        self._buckets = {}  # key -> (tokens, last refill)
+        self._lock = threading.Lock()
+        self.sampled_out = {}
+        self.rate_limited = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not (self.sample_rates or self.rate_limits):
+            return True
+        key = getattr(record, "event", None) or record.msg
+
+        rate = self.sample_rates.get(key)
+        if rate is not None and random.random() >= rate:
+            self._count(self.sampled_out, key)
+            return False
+
+        limit = self.rate_limits.get(key)
+        if limit is not None:
+            now = time.monotonic()
+            with self._lock:
+                tokens, last = self._buckets.get(key, (limit, now))
+                tokens = min(limit, tokens + (now - last) * limit)
+                if tokens < 1:
+                    self._buckets[key] = (tokens, now)
+                    self.rate_limited[key] = self.rate_limited.get(key, 0) + 1
+                    return False
+                self._buckets[key] = (tokens - 1, now)
+
+        if rate is not None and rate > 0:
+            # Lets readers scale sampled counts back up
+            record.sample_rate = rate
+        return True
+
+    def _count(self, counter, key):
+        with self._lock:
+            counter[key] = counter.get(key, 0) + 1
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full,
+    and leaves message formatting to the listener thread"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The record stays in-process, so skip the stock eager getMessage()/format();
+        # only exception info is rendered now, while the traceback is still alive
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_configured = {}
+
+def configure_logging(name="aura_q"):
+    """Configure ``name`` once per process and return the logger"""
+    logger = logging.getLogger(name)
+    if name in _configured:
+        return logger
+
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    sampling = SamplingFilter(_parse_rates(os.environ.get("LOG_SAMPLE_RATES")),
+                              _parse_rates(os.environ.get("LOG_RATE_LIMITS")))
+    state = {"sampling": sampling, "queue_handler": None}
+    if LOG_ASYNC:
+        queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        queue_handler.addFilter(sampling)
+        listener = logging.handlers.QueueListener(queue_handler.queue, output, respect_handler_level=True)
+        listener.start()
+        # Drain whatever is still queued when the interpreter exits
+        atexit.register(listener.stop)
+        logger.addHandler(queue_handler)
+        state["queue_handler"] = queue_handler
+    else:
+        output.addFilter(sampling)
+        logger.addHandler(output)
+
+    _configured[name] = state
+    return logger
+
+def get_logging_stats(name="aura_q"):
+    state = _configured.get(name)
+    if state is None:
+        return {"configured": False}
+    queue_handler = state["queue_handler"]
+    return {
+        "configured": True,
+        "async": queue_handler is not None,
+        "queue_depth": queue_handler.queue.qsize() if queue_handler else 0,
+        "queue_full_drops": queue_handler.dropped if queue_handler else 0,
+        "sampled_out": dict(state["sampling"].sampled_out),
+        "rate_limited": dict(state["sampling"].rate_limited)
+    }
@@ -0,0 +1,102 @@
+import threading
+import pytest
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", fake)
+    return fake
+
+def breaker(**options):
+    settings = dict(window_seconds=60, min_calls=4, error_rate_threshold=0.5,
+                    p95_latency_threshold=5.0, cooldown_seconds=30, probe_successes=2)
+    settings.update(options)
+    return CircuitBreaker("test", **settings)
+
+def test_stays_closed_below_min_calls(clock):
+    cb = breaker()
+    for _ in range(3):
+        cb.record_failure(0.1)
+    assert cb.state == STATE_CLOSED
+
+def test_opens_on_error_rate_and_rejects(clock):
+    cb = breaker()
+    cb.record_success(0.1)
+    cb.record_success(0.1)
+    cb.record_failure(0.1)
+    cb.record_failure(0.1)
+    assert cb.state == STATE_OPEN
+    assert cb.allow_request() is False
+    assert cb.stats()["rejected"] == 1
+
+def test_opens_on_p95_latency(clock):
+    cb = breaker()
+    for _ in range(4):
+        cb.record_success(6.0)
+    assert cb.state == STATE_OPEN
+
+def test_old_samples_leave_the_window(clock):
+    cb = breaker()
+    for _ in range(3):
+        cb.record_failure(0.1)
+    clock.now += 61
+    cb.record_failure(0.1)
+    assert cb.state == STATE_CLOSED
+    assert cb.stats()["calls_in_window"] == 1
+
+def test_half_open_probes_close_it_again(clock):
+    cb = breaker()
+    for _ in range(4):
+        cb.record_failure(0.1)
+    clock.now += 30
+    assert cb.state == STATE_HALF_OPEN
+    assert cb.allow_request() is True
+    # One probe at a time
+    assert cb.allow_request() is False
+    cb.record_success(0.1)
+    assert cb.allow_request() is True
+    cb.record_success(0.1)
+    assert cb.state == STATE_CLOSED
+    assert cb.stats()["calls_in_window"] == 0
+
+def test_failed_probe_reopens(clock):
+    cb = breaker()
+    for _ in range(4):
+        cb.record_failure(0.1)
+    clock.now += 30
+    assert cb.allow_request() is True
+    cb.record_failure(0.1)
+    assert cb.state == STATE_OPEN
+    assert cb.stats()["times_opened"] == 2
+
+def test_unused_probe_slot_is_released(clock):
+    cb = breaker()
+    for _ in range(4):
+        cb.record_failure(0.1)
+    clock.now += 30
+    assert cb.allow_request() is True
+    # The caller answered from the cache and never called Gemini
+    cb.release_probe()
+    assert cb.allow_request() is True
+
+def test_release_leaves_another_threads_probe_alone(clock):
+    cb = breaker()
+    for _ in range(4):
+        cb.record_failure(0.1)
+    clock.now += 30
+    taken = []
+    thread = threading.Thread(target=lambda: taken.append(cb.allow_request()))
+    thread.start()
+    thread.join(5)
+    assert taken == [True]
+    cb.release_probe()
+    assert cb.allow_request() is False
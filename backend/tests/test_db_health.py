@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+from db_health import DatabaseHealthMonitor
+
+def topology_changed(writable):
+    return SimpleNamespace(new_description=SimpleNamespace(has_writable_server=lambda: writable))
+
+def test_tracks_the_topology():
+    monitor = DatabaseHealthMonitor()
+    listener = monitor.listener()
+    assert monitor.is_available() is None
+    listener.description_changed(topology_changed(True))
+    assert monitor.is_available() is True
+    listener.failed(SimpleNamespace(reply="connection refused"))
+    assert monitor.snapshot()["last_error"] == "connection refused"
+    listener.description_changed(topology_changed(False))
+    assert monitor.is_available() is False
+
+def test_events_from_an_abandoned_client_are_ignored():
+    monitor = DatabaseHealthMonitor()
+    abandoned = monitor.listener()
+    abandoned.failed(SimpleNamespace(reply="timed out"))
+    live = monitor.listener()
+    live.description_changed(topology_changed(True))
+    live.succeeded(SimpleNamespace(duration=0.002))
+
+    # The abandoned client's queued events arrive late
+    abandoned.closed(SimpleNamespace())
+    abandoned.description_changed(topology_changed(False))
+    abandoned.failed(SimpleNamespace(reply="timed out"))
+    assert monitor.is_available() is True
+    assert monitor.snapshot()["last_error"] is None
+    assert monitor.snapshot()["last_heartbeat_ms"] == 2.0
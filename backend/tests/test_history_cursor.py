@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+import pymongo
+import pytest
+from bson.objectid import ObjectId
+from history_cursor import encode_history_cursor, decode_history_cursor, history_page_query, InvalidCursor
+
+def matches(doc, query):
+    """Evaluate the small subset of query operators history_page_query emits"""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            ((op, value),) = condition.items()
+            if not (doc[field] < value if op == "$lt" else doc[field] > value):
+                return False
+        elif doc[field] != condition:
+            return False
+    return True
+
+def read_all_pages(docs, direction, page_size):
+    ordered = sorted(docs, key=lambda d: (d["timestamp"], d["_id"]), reverse=direction == pymongo.DESCENDING)
+    seen, cursor = [], None
+    while True:
+        after = decode_history_cursor(cursor, direction) if cursor else None
+        page = [d for d in ordered if matches(d, history_page_query("u", direction, after))][:page_size + 1]
+        seen.extend(page[:page_size])
+        if len(page) <= page_size:
+            return seen
+        cursor = encode_history_cursor(page[page_size - 1], direction)
+
+def test_cursor_round_trip():
+    entry = {"timestamp": datetime(2024, 5, 1, 12, 30), "_id": ObjectId()}
+    cursor = encode_history_cursor(entry, pymongo.DESCENDING)
+    assert decode_history_cursor(cursor, pymongo.DESCENDING) == (entry["timestamp"], entry["_id"])
+
+def test_cursor_for_the_other_sort_order_is_rejected():
+    cursor = encode_history_cursor({"timestamp": datetime(2024, 5, 1), "_id": ObjectId()}, pymongo.ASCENDING)
+    with pytest.raises(InvalidCursor):
+        decode_history_cursor(cursor, pymongo.DESCENDING)
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "e30"])
+def test_garbage_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_history_cursor(cursor, pymongo.DESCENDING)
+
+@pytest.mark.parametrize("direction", [pymongo.DESCENDING, pymongo.ASCENDING])
+def test_pages_cover_every_entry_once_with_tied_timestamps(direction):
+    start = datetime(2024, 1, 1)
+    # Several entries share a timestamp, so paging must break ties on _id
+    docs = [{"user_id": "u", "timestamp": start + timedelta(minutes=i // 3), "_id": ObjectId()} for i in range(10)]
+    seen = read_all_pages(docs, direction, page_size=4)
+    assert sorted(d["_id"] for d in seen) == sorted(d["_id"] for d in docs)
+    assert len(seen) == len(docs)
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+from login_tracker import LoginBookkeeper
+
+class FakeUsers:
+    def __init__(self, error=None):
+        self.error = error
+        self.operations = []
+        self.updates = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.operations.append(operations)
+        if self.error is not None:
+            raise self.error
+
+    def update_one(self, query, update):
+        self.updates.append((query, update))
+
+def buffered(collection):
+    bookkeeper = LoginBookkeeper(flush_interval=60)
+    bookkeeper.collection = collection
+    bookkeeper._ensure_thread = lambda: None  # flush by hand
+    return bookkeeper
+
+def test_logins_are_coalesced_per_user():
+    users = FakeUsers()
+    bookkeeper = buffered(users)
+    first = datetime(2024, 1, 1)
+    bookkeeper.record_login("a", first + timedelta(hours=1))
+    bookkeeper.record_login("a", first)
+    bookkeeper.record_login("b", first)
+    assert bookkeeper.flush() == 2
+    (operations,) = users.operations
+    assert operations[0] == UpdateOne({"_id": "a"}, {"$max": {"last_login": first + timedelta(hours=1)},
+                                                     "$inc": {"login_count": 2}})
+    assert bookkeeper.stats()["pending_users"] == 0
+
+def test_write_through_when_interval_is_zero():
+    users = FakeUsers()
+    bookkeeper = LoginBookkeeper(flush_interval=0)
+    bookkeeper.collection = users
+    bookkeeper.record_login("a", datetime(2024, 1, 1))
+    assert len(users.updates) == 1
+    assert bookkeeper.stats()["pending_users"] == 0
+
+def test_partial_bulk_failure_requeues_only_failed_users():
+    error = BulkWriteError({"writeErrors": [{"index": 1, "code": 2, "errmsg": "bad value"}]})
+    bookkeeper = buffered(FakeUsers(error))
+    when = datetime(2024, 1, 1)
+    for user_id in ("a", "b", "c"):
+        bookkeeper.record_login(user_id, when)
+    assert bookkeeper.flush() == 2
+    assert bookkeeper._pending == {"b": {"count": 1, "last_login": when}}
+
+def test_connection_failure_requeues_the_whole_batch():
+    bookkeeper = buffered(FakeUsers(AutoReconnect("no primary")))
+    when = datetime(2024, 1, 1)
+    bookkeeper.record_login("a", when)
+    bookkeeper.record_login("b", when)
+    assert bookkeeper.flush() == 0
+    # A login recorded meanwhile is merged with the requeued counter
+    bookkeeper.record_login("a", when + timedelta(minutes=1))
+    assert bookkeeper._pending["a"] == {"count": 2, "last_login": when + timedelta(minutes=1)}
+    assert set(bookkeeper._pending) == {"a", "b"}
+
+def test_unknown_error_drops_the_batch():
+    bookkeeper = buffered(FakeUsers(ValueError("unexpected")))
+    bookkeeper.record_login("a", datetime(2024, 1, 1))
+    assert bookkeeper.flush() == 0
+    assert bookkeeper._pending == {}
+    assert bookkeeper.stats()["dropped_users"] == 1
@@ -0,0 +1,73 @@
+import time
+import threading
+import pytest
+import ai_analysis
+from ai_analysis import GeminiMicroBatcher
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Replace the Gemini calls; a single call blocks until ``release`` is set"""
+    calls = {"single": [], "batch": [], "release": threading.Event(), "fail_batch": False}
+    def single(story):
+        calls["single"].append(story)
+        calls["release"].wait(5)
+        return {"mood": "single:" + story}
+    def batch(stories):
+        calls["batch"].append(list(stories))
+        if calls["fail_batch"]:
+            raise RuntimeError("gemini error")
+        return [{"mood": "batch:" + story} for story in stories]
+    monkeypatch.setattr(ai_analysis, "analyze_with_gemini", single)
+    monkeypatch.setattr(ai_analysis, "analyze_batch_with_gemini", batch)
+    return calls
+
+def analyze_in_background(batcher, stories):
+    results = {}
+    threads = [threading.Thread(target=lambda s=story: results.__setitem__(s, batcher.analyze(s))) for story in stories]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+def test_idle_call_is_sent_alone(gemini):
+    gemini["release"].set()
+    batcher = GeminiMicroBatcher(window_ms=10000, max_batch=3)
+    assert batcher.analyze("a") == {"mood": "single:a"}
+    assert batcher.stats()["single_calls"] == 1 and gemini["batch"] == []
+
+def test_concurrent_stories_share_one_batch_request(gemini):
+    batcher = GeminiMicroBatcher(window_ms=10000, max_batch=3)
+    solo, solo_result = analyze_in_background(batcher, ["first"])
+    wait_for(lambda: gemini["single"] == ["first"])
+
+    # A call is in flight, so these queue up; the full batch goes out without waiting for the window
+    threads, results = analyze_in_background(batcher, ["a", "b", "c"])
+    for thread in threads:
+        thread.join(5)
+    assert results == {story: {"mood": "batch:" + story} for story in "abc"}
+    assert sorted(gemini["batch"][0]) == ["a", "b", "c"]
+    assert batcher.stats()["batch_calls"] == 1 and batcher.stats()["batched_stories"] == 3
+
+    gemini["release"].set()
+    solo[0].join(5)
+    assert solo_result == {"first": {"mood": "single:first"}}
+
+def test_failed_batch_releases_every_waiter(gemini):
+    gemini["fail_batch"] = True
+    batcher = GeminiMicroBatcher(window_ms=10000, max_batch=2)
+    solo, _ = analyze_in_background(batcher, ["first"])
+    wait_for(lambda: gemini["single"] == ["first"])
+
+    threads, results = analyze_in_background(batcher, ["a", "b"])
+    for thread in threads:
+        thread.join(5)
+    assert results == {"a": None, "b": None}
+    assert batcher.stats()["pending"] == 0
+
+    gemini["release"].set()
+    solo[0].join(5)
@@ -0,0 +1,113 @@
+import time
+import threading
+import pytest
+import ai_analysis
+from ai_analysis import GeminiModelRegistry
+from deadline import request_deadline
+
+class FakeModel:
+    def __init__(self, api, name):
+        self.api = api
+        self.model_name = name
+
+    def generate_content(self, prompt, generation_config=None, request_options=None):
+        self.api.probes.append(self.model_name)
+        if self.api.probe_gate is not None:
+            self.api.probe_gate.wait(5)
+        if self.model_name in self.api.broken:
+            raise RuntimeError("403 generate_content not permitted")
+
+class FakeGenai:
+    """models.get succeeds for every name not in ``missing``; probes fail for names in ``broken``"""
+    def __init__(self):
+        self.missing = set()
+        self.broken = set()
+        self.lookups = []
+        self.probes = []
+        self.probe_gate = None
+
+    def get_model(self, name, request_options=None):
+        self.lookups.append(name)
+        if name in self.missing:
+            raise RuntimeError("404 model not found")
+
+    def GenerativeModel(self, name):
+        return FakeModel(self, name)
+
+@pytest.fixture
+def api(monkeypatch):
+    fake = FakeGenai()
+    monkeypatch.setattr(ai_analysis, "genai", fake, raising=False)
+    return fake
+
+def registry(**options):
+    settings = dict(revalidate_seconds=900, max_failures=2, retry_seconds=30, lookup_timeout=1, demote_seconds=1800)
+    settings.update(options)
+    return GeminiModelRegistry(["models/a", "models/b", "models/c"], **settings)
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+def fail_over(models):
+    model = models.get_model()
+    for _ in range(models.max_failures):
+        models.report_failure(model)
+
+def revalidate(models):
+    models._resolved_at -= models.revalidate_seconds
+    models.get_model()
+    wait_for(lambda: not models._busy)
+
+def test_resolves_the_first_available_model(api):
+    api.missing.add("models/a")
+    models = registry()
+    assert models.get_model().model_name == "models/b"
+    assert api.probes == []
+
+def test_failover_demotes_the_failing_model(api):
+    models = registry()
+    fail_over(models)
+    assert models.model_name == "models/b"
+    # Its metadata still looks fine, but it is skipped until the demotion expires
+    revalidate(models)
+    assert models.model_name == "models/b"
+    assert "models/a" not in api.probes
+
+def test_promotion_needs_a_successful_probe(api):
+    models = registry(demote_seconds=0)
+    fail_over(models)
+    api.broken.add("models/a")
+    revalidate(models)
+    assert models.model_name == "models/b" and api.probes == ["models/a"]
+
+    api.broken.clear()
+    revalidate(models)
+    assert models.model_name == "models/a"
+
+def test_revalidation_runs_off_the_request_path(api):
+    models = registry(demote_seconds=0)
+    fail_over(models)
+    current = models.get_model()
+    api.probe_gate = threading.Event()
+    models._resolved_at -= models.revalidate_seconds
+
+    started = time.monotonic()
+    assert models.get_model() is current
+    wait_for(lambda: api.probes == ["models/a"])
+    # The probe is blocked, yet callers and failure reports don't wait on it
+    assert models.get_model() is current
+    models.report_failure(current)
+    assert time.monotonic() - started < 1
+
+    api.probe_gate.set()
+    wait_for(lambda: not models._busy)
+    assert models.model_name == "models/a"
+
+def test_request_without_budget_makes_no_lookups(api):
+    models = registry()
+    with request_deadline(ai_analysis.GEMINI_DEADLINE_RESERVE_MS / 1000):
+        assert models.get_model() is None
+    assert api.lookups == []
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+import pytest
+from bson.objectid import ObjectId
+from mood_stats import record_entries, rebuild_user_stats, get_user_statistics
+
+mongomock = pytest.importorskip("mongomock")
+
+USER = ObjectId()
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().auraQ
+
+def insert_entries(db, moods, start=datetime(2024, 1, 1)):
+    entries = [{"_id": ObjectId(), "user_id": USER, "mood": mood, "timestamp": start + timedelta(minutes=i)}
+               for i, mood in enumerate(moods)]
+    db.mood_entries.insert_many(entries)
+    return entries
+
+def totals(db):
+    stats = get_user_statistics(db, USER)
+    return stats["total_entries"], stats["mood_counts"]
+
+def test_entries_are_counted_once(db):
+    rebuild_user_stats(db, USER)
+    entries = insert_entries(db, ["joy", "anger"])
+    record_entries(db, USER, entries)
+    # A retried call changes nothing
+    record_entries(db, USER, entries)
+    assert totals(db) == (2, {"joy": 1, "anger": 1})
+
+def test_rebuild_between_insert_and_record_is_not_double_counted(db):
+    record_entries(db, USER, insert_entries(db, ["joy"]))
+    rebuild_user_stats(db, USER)
+
+    entries = insert_entries(db, ["fear", "joy"], start=datetime(2024, 2, 1))
+    # The rebuild runs after the insert, before the request records the entries
+    rebuild_user_stats(db, USER)
+    record_entries(db, USER, entries)
+    assert totals(db) == (3, {"joy": 2, "fear": 1})
+
+def test_only_entries_the_rebuild_missed_are_counted(db):
+    rebuild_user_stats(db, USER)
+    entries = insert_entries(db, ["joy", "sadness"])
+    # The rebuild saw only the first entry of an unordered insert_many
+    db.mood_entries.delete_one({"_id": entries[1]["_id"]})
+    rebuild_user_stats(db, USER)
+    db.mood_entries.insert_one(entries[1])
+    record_entries(db, USER, entries)
+    assert totals(db) == (2, {"joy": 1, "sadness": 1})
+
+def test_first_write_creates_the_document(db):
+    record_entries(db, USER, insert_entries(db, ["surprise"]))
+    assert db.user_stats.find_one({"_id": USER})["total_entries"] == 1
@@ -0,0 +1,92 @@
+import time
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+from mood_writer import MoodEntryWriter, MoodWriterBusy, DUPLICATE_KEY
+
+class FakeCollection:
+    """insert_many that records batches, optionally raising queued errors first"""
+    def __init__(self, errors=()):
+        self.batches = []
+        self.errors = list(errors)
+
+    def insert_many(self, entries, ordered=True):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.batches.append(list(entries))
+
+    @property
+    def docs(self):
+        return [entry for batch in self.batches for entry in batch]
+
+def entries(n):
+    return [{"mood": "joy", "n": i} for i in range(n)]
+
+def test_write_requires_attached_collection():
+    with pytest.raises(RuntimeError):
+        MoodEntryWriter(mode="sync").write(entries(1))
+
+def test_sync_write_inserts_and_returns_ids_in_order():
+    collection, written = FakeCollection(), []
+    writer = MoodEntryWriter(mode="sync")
+    writer.attach(collection, on_written=written.extend)
+    batch = entries(3)
+    ids = writer.write(batch)
+    assert ids == [entry["_id"] for entry in collection.docs]
+    assert written == batch
+    assert writer.stats()["written"] == 3
+
+def test_async_flush_writes_queued_entries_in_batches():
+    collection = FakeCollection()
+    writer = MoodEntryWriter(mode="async", batch_size=2, max_queue=10)
+    writer.attach(collection)
+    writer._ensure_thread = lambda: None  # drain by hand instead of on the writer thread
+    ids = writer.write(entries(5))
+    assert collection.batches == []
+    assert writer.flush() == 0
+    assert [len(batch) for batch in collection.batches] == [2, 2, 1]
+    assert [entry["_id"] for entry in collection.docs] == ids
+
+def test_async_writer_thread_drains_the_queue():
+    collection = FakeCollection()
+    writer = MoodEntryWriter(mode="async", batch_size=10, linger=0)
+    writer.attach(collection)
+    writer.write(entries(3))
+    deadline = time.monotonic() + 5
+    while len(collection.docs) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(collection.docs) == 3
+
+def test_full_queue_rejects_the_whole_request():
+    writer = MoodEntryWriter(mode="async", max_queue=3, enqueue_timeout=0)
+    writer.attach(FakeCollection())
+    writer._ensure_thread = lambda: None
+    writer.write(entries(2))
+    with pytest.raises(MoodWriterBusy):
+        writer.write(entries(2))
+    assert writer.stats()["queue_depth"] == 2
+    assert writer.rejected == 1
+
+def test_transient_error_is_retried():
+    collection = FakeCollection(errors=[AutoReconnect("primary stepped down")])
+    writer = MoodEntryWriter(mode="async")
+    writer.attach(collection)
+    writer._ensure_thread = lambda: None
+    writer.write(entries(2))
+    assert writer.flush(attempts=2) == 0
+    assert len(collection.docs) == 2
+    assert writer.retries == 1
+
+def test_duplicate_keys_count_as_written_and_other_errors_are_dropped():
+    error = BulkWriteError({"writeErrors": [
+        {"index": 0, "code": DUPLICATE_KEY, "errmsg": "duplicate key"},
+        {"index": 1, "code": 121, "errmsg": "document failed validation"}
+    ]})
+    written = []
+    writer = MoodEntryWriter(mode="async")
+    writer.attach(FakeCollection(errors=[error]), on_written=written.extend)
+    writer._ensure_thread = lambda: None
+    batch = entries(3)
+    writer.write(batch)
+    writer.flush()
+    assert written == [batch[0], batch[2]]
+    assert writer.dropped == 1
@@ -0,0 +1,77 @@
+import time
+import threading
+import pytest
+from analysis_cache import SingleFlight
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+def start_leader(flight, key, fn):
+    """Run flight.do(key, fn) on a thread; returns (thread, result holder)"""
+    outcome = {}
+    def run():
+        try:
+            outcome["result"] = flight.do(key, fn)
+        except Exception as e:
+            outcome["error"] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    wait_for(lambda: flight.stats()["in_flight"] == 1)
+    return thread, outcome
+
+def test_concurrent_callers_share_one_execution():
+    flight, release = SingleFlight(), threading.Event()
+    def analyze():
+        release.wait(5)
+        return {"mood": "joy"}
+    leader, outcome = start_leader(flight, "story", analyze)
+
+    results = []
+    followers = [threading.Thread(target=lambda: results.append(flight.do("story", analyze, timeout=5)))
+                 for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    wait_for(lambda: flight.stats()["coalesced"] == 3)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert flight.stats() == {"executions": 1, "coalesced": 3, "in_flight": 0}
+    assert results == [{"mood": "joy"}] * 3 and outcome["result"] == {"mood": "joy"}
+    # Every caller gets its own copy
+    results[0]["mood"] = "anger"
+    assert results[1]["mood"] == "joy" and outcome["result"]["mood"] == "joy"
+
+def test_leader_error_reaches_followers():
+    flight, release = SingleFlight(), threading.Event()
+    def fail():
+        release.wait(5)
+        raise ValueError("gemini down")
+    leader, outcome = start_leader(flight, "story", fail)
+
+    errors = []
+    def follow():
+        try:
+            flight.do("story", fail, timeout=5)
+        except ValueError as e:
+            errors.append(e)
+    follower = threading.Thread(target=follow)
+    follower.start()
+    wait_for(lambda: flight.stats()["coalesced"] == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert isinstance(outcome["error"], ValueError) and len(errors) == 1
+
+def test_follower_times_out_and_key_is_released_afterwards():
+    flight, release = SingleFlight(), threading.Event()
+    leader, _ = start_leader(flight, "story", lambda: release.wait(5))
+    with pytest.raises(TimeoutError):
+        flight.do("story", lambda: None, timeout=0.01)
+    release.set()
+    leader.join(5)
+    assert flight.do("story", lambda: "fresh") == "fresh"
+    assert flight.stats()["executions"] == 2
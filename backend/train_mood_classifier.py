@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Script to train the local mood classifier used in front of Gemini.
+Usage:
+  cd backend
+  python train_mood_classifier.py [--data mood_training_data.jsonl] [--output mood_classifier.json]
+The training file holds one JSON object per line: {"text": "...", "mood": "joy"}.
+Afterwards choose the serving threshold on held-out data with evaluate_mood_classifier.py.
+"""
+import os
+import json
+import argparse
+
+from mood_classifier import train, MoodClassifier, DEFAULT_MODEL_PATH, DEFAULT_BUCKETS
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mood_training_data.jsonl")
+
+def load_samples(path):
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                samples.append((record["text"], record["mood"]))
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the AuraQ local mood classifier")
+    parser.add_argument("--data", default=DEFAULT_DATA_PATH, help="JSONL file with text/mood pairs")
+    parser.add_argument("--output", default=DEFAULT_MODEL_PATH, help="Where to write the model file")
+    parser.add_argument("--buckets", type=int, default=DEFAULT_BUCKETS, help="Number of hashed feature buckets")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Additive smoothing")
+    args = parser.parse_args()
+
+    samples = load_samples(args.data)
+    model = train(samples, buckets=args.buckets, alpha=args.alpha)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(model, f, separators=(",", ":"), sort_keys=True)
+
+    # In-sample accuracy only catches broken training; quality is measured on held-out data
+    classifier = MoodClassifier(model)
+    correct = sum(1 for text, mood in samples if classifier.predict(text)[0] == mood)
+    print(f"Trained on {len(samples)} samples across {len(model['classes'])} moods")
+    print(f"Training accuracy (in-sample sanity check): {correct / len(samples):.1%}")
+    print(f"Model written to {args.output} ({os.path.getsize(args.output)} bytes)")
+    print("The model has no serving threshold yet; pick one with: python evaluate_mood_classifier.py --write")
+
+if __name__ == "__main__":
+    main()
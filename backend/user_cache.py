@@ -0,0 +1,67 @@
+"""
+Small per-process TTL cache of user documents.
+
+Protected endpoints only need the user's ``_id`` and ``username``, which never
+change, so those are cached briefly (keyed by username) instead of being
+fetched from MongoDB on every request. The TTL bounds how long a deleted
+user keeps resolving; call ``invalidate()`` when removing or renaming a user
+to make that immediate.
+"""
+import os
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 2048))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", 30))
+
+class UserCache:
+    """Thread-safe LRU of user documents with a per-entry TTL"""
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, username):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return copy.copy(entry[1])
+            if entry is not None:
+                del self._entries[username]
+            self.misses += 1
+            return None
+
+    def set(self, username, user):
+        if self.max_size <= 0 or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[username] = (time.monotonic() + self.ttl_seconds, copy.copy(user))
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        with self._lock:
+            if self._entries.pop(username, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations
+            }
+
+user_cache = UserCache()
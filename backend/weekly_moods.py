@@ -0,0 +1,147 @@
+"""
+Daily mood buckets behind the dashboard's weekly mood chart.
+
+``weekly_moods`` holds one document per user per day (``day`` is a
+"YYYY-MM-DD" string) with the latest mood posted that day and a counts map,
+maintained by a single upsert. Reading the last 30 days is therefore at most
+30 tiny documents from the unique (user_id, day) index.
+
+That index is what keeps the upsert from creating two buckets for one day
+when a user's first two posts of the day race, so it is created on first use
+by each process (``ensure_bucket_index``) rather than left to the opt-in
+``python run.py indexes``. If it can't be built, e.g. because duplicate
+buckets already exist, a warning is logged and the chart counts may split
+across documents until they are merged and the index is built.
+
+Older deployments stored one raw document per post; ``migrate_raw_weekly_moods``
+(``python run.py migrate-weekly-moods``) folds those into the buckets.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger("aura_q")
+
+WEEKLY_MOOD_DAYS = 30
+MIGRATION_BATCH_SIZE = 500
+
+BUCKET_INDEX_KEYS = [("user_id", pymongo.ASCENDING), ("day", pymongo.ASCENDING)]
+BUCKET_INDEX_NAME = "user_id_day_unique"
+# Partial so raw pre-bucket rows, which have no day, don't collide before migration
+BUCKET_INDEX_FILTER = {"day": {"$exists": True}}
+
+_indexed = set()  # full names of collections whose bucket index was ensured by this process
+_index_lock = threading.Lock()
+
+def ensure_bucket_index(collection):
+    """Create the unique (user_id, day) index once per collection per process"""
+    if collection.full_name in _indexed:
+        return
+    with _index_lock:
+        if collection.full_name in _indexed:
+            return
+        try:
+            # A no-op when the index already exists with these options
+            collection.create_index(BUCKET_INDEX_KEYS, name=BUCKET_INDEX_NAME, unique=True,
+                                    partialFilterExpression=BUCKET_INDEX_FILTER)
+        except OperationFailure as e:
+            # Duplicate buckets or a conflicting index; don't retry on every post, run.py indexes reports it
+            logger.warning("Could not create the %s index on %s; daily buckets may be duplicated: %s",
+                           BUCKET_INDEX_NAME, collection.full_name, e)
+        _indexed.add(collection.full_name)
+
+def js_day_index(date):
+    """JavaScript getDay() numbering (0=Sunday) for a Python datetime"""
+    return (date.weekday() + 1) % 7
+
+def parse_entry_date(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+
+def record_weekly_mood(collection, user_id, mood, day_index, date, day=None):
+    """Upsert the user's bucket for ``day`` (defaults to the date's calendar day); returns the bucket id"""
+    ensure_bucket_index(collection)
+    day = day or date.date().isoformat()
+    update = {
+        "$set": {"mood": mood, "dayIndex": day_index, "date": date},
+        "$inc": {f"counts.{mood}": 1}
+    }
+    try:
+        bucket = collection.find_one_and_update(
+            {"user_id": user_id, "day": day}, update,
+            projection={"_id": 1}, upsert=True, return_document=pymongo.ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Two first posts of the day raced on the unique index; the loser updates the winner's bucket
+        bucket = collection.find_one_and_update(
+            {"user_id": user_id, "day": day}, update,
+            projection={"_id": 1}, return_document=pymongo.ReturnDocument.AFTER
+        )
+    return bucket["_id"]
+
+def get_recent_weekly_moods(collection, user_id, days=WEEKLY_MOOD_DAYS):
+    """Return the user's daily buckets from the last ``days`` days, newest first"""
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    return list(collection.find(
+        {"user_id": user_id, "day": {"$gte": since}},
+        {"user_id": 0}
+    ).sort("day", pymongo.DESCENDING).limit(days))
+
+def migrate_raw_weekly_moods(collection, report=logger.info):
+    """Fold pre-bucket raw documents (no ``day`` field) into daily buckets, then delete them.
+
+    Raw rows are grouped per user and day in insertion order, so the last one
+    posted becomes the bucket's mood unless a bucket already exists for that
+    day, in which case only its counts are increased. Re-runs only pick up
+    rows that are still raw.
+    """
+    raw = (collection.find({"day": {"$exists": False}}, {"user_id": 1, "mood": 1, "dayIndex": 1, "date": 1})
+           .sort([("user_id", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+           .batch_size(MIGRATION_BATCH_SIZE))
+
+    groups = {}
+    folded = skipped = 0
+    previous_user = None
+    for row in raw:
+        # Flush only between users so one (user, day) group is never split across batches
+        if len(groups) >= MIGRATION_BATCH_SIZE and row["user_id"] != previous_user:
+            _flush_groups(collection, groups)
+            report(f"  ... folded {folded} raw entries")
+            groups = {}
+        previous_user = row["user_id"]
+        try:
+            date = parse_entry_date(row["date"])
+        except (KeyError, ValueError):
+            skipped += 1
+            continue
+        if date.tzinfo is not None:
+            date = date.replace(tzinfo=None) - date.utcoffset()
+        key = (row["user_id"], date.date().isoformat())
+        group = groups.setdefault(key, {"counts": {}, "ids": []})
+        group["counts"][row["mood"]] = group["counts"].get(row["mood"], 0) + 1
+        group["ids"].append(row["_id"])
+        group["latest"] = {"mood": row["mood"], "date": date, "dayIndex": row.get("dayIndex", js_day_index(date))}
+        folded += 1
+    _flush_groups(collection, groups)
+    report(f"Folded {folded} raw weekly mood entries into daily buckets ({skipped} unreadable entries left as-is)")
+    return folded
+
+def _flush_groups(collection, groups):
+    if not groups:
+        return
+    upserts = [
+        UpdateOne(
+            {"user_id": user_id, "day": day},
+            {"$inc": {f"counts.{mood}": count for mood, count in group["counts"].items()},
+             # Buckets written after the upgrade are newer than any raw row; keep their mood
+             "$setOnInsert": group["latest"]},
+            upsert=True
+        )
+        for (user_id, day), group in groups.items()
+    ]
+    collection.bulk_write(upserts, ordered=False)
+    collection.delete_many({"_id": {"$in": [row_id for group in groups.values() for row_id in group["ids"]]}})
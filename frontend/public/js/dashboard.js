@@ -641,6 +641,8 @@ document.addEventListener("DOMContentLoaded", function () {
                 body: JSON.stringify({
                     mood: mood,
                     date: today.toISOString(),
+                    // Local calendar day (YYYY-MM-DD); the server keeps one bucket per day
+                    day: `${today.getFullYear()}-${String(today.getMonth() + 1).padStart(2, '0')}-${String(today.getDate()).padStart(2, '0')}`,
                     dayName: dayName,
                     fullDayName: fullDayName,
                     dayIndex: dayIndex // Add day index (0=Sunday, 1=Monday, etc.) for reliable matching
@@ -1320,6 +1322,12 @@ function displayWeeklyMoodReview(weeklyData, container) {
         return;
     }
     
+    // Each item is one day's bucket with a count per mood; rows without
+    // counts (older backends) stand for a single entry
+    const moodCountsOf = entry => (entry.counts && Object.keys(entry.counts).length > 0)
+        ? entry.counts
+        : { [entry.mood]: 1 };
+    
     // Group entries by day with better date handling
     const dailyMoods = {};
     weekData.forEach(entry => {
@@ -1349,13 +1357,21 @@ function displayWeeklyMoodReview(weeklyData, container) {
                 dayIndex: dayIndex
             };
         }
-        dailyMoods[day].moods.push(entry.mood);
+        for (const [mood, count] of Object.entries(moodCountsOf(entry))) {
+            for (let i = 0; i < count; i++) {
+                dailyMoods[day].moods.push(mood);
+            }
+        }
     });
     
     // Get mood statistics for the whole week
     const moodCounts = {};
+    let totalEntries = 0;
     weekData.forEach(entry => {
-        moodCounts[entry.mood] = (moodCounts[entry.mood] || 0) + 1;
+        for (const [mood, count] of Object.entries(moodCountsOf(entry))) {
+            moodCounts[mood] = (moodCounts[mood] || 0) + count;
+            totalEntries += count;
+        }
     });
     
     // Find most frequent mood
@@ -1380,7 +1396,7 @@ function displayWeeklyMoodReview(weeklyData, container) {
                 </div>
                 <div class="mood-summary-item entries">
                     <span class="summary-label">Total entries:</span>
-                    <span class="summary-value">${weekData.length}</span>
+                    <span class="summary-value">${totalEntries}</span>
                 </div>
             </div>
             <div class="mood-distribution">
@@ -1402,7 +1418,7 @@ function displayWeeklyMoodReview(weeklyData, container) {
     };
     
     for (const [mood, count] of Object.entries(moodCounts)) {
-        const percentage = Math.round((count / weekData.length) * 100);
+        const percentage = Math.round((count / totalEntries) * 100);
         // Find matching color or fallback to default
         const moodLower = mood.toLowerCase();
         let barColor = "#607D8B"; // Default gray
@@ -1534,7 +1550,7 @@ function displayWeeklyMoodReview(weeklyData, container) {
             </div>
             <div class="review-insights">
                 <h4>Insights</h4>
-                <p>${generateInsights(moodCounts, weekData.length)}</p>
+                <p>${generateInsights(moodCounts, totalEntries)}</p>
             </div>
         </div>
     `;